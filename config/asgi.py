@@ -12,5 +12,7 @@ import os
 from django.core.asgi import get_asgi_application
 
 os.environ.setdefault("DJANGO_SETTINGS_MODULE", "config.settings")
+# Serve the native async views of the read-heavy endpoints
+os.environ.setdefault("PARKMATE_URLCONF", "config.asgi_urls")
 
 application = get_asgi_application()
@@ -0,0 +1,12 @@
+"""URLconf used by config.asgi: config.urls with the async parking views."""
+
+from django.contrib import admin
+from django.urls import path, include
+
+from parking.metrics import metrics_view
+
+urlpatterns = [
+    path("admin/", admin.site.urls),
+    path("api/parkmate/", include("parking.async_urls")),
+    path("metrics", metrics_view, name="metrics"),
+]
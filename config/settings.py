@@ -10,6 +10,7 @@ For the full list of settings and their values, see
 https://docs.djangoproject.com/en/4.1/ref/settings/
 """
 
+import os
 from pathlib import Path
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
@@ -42,6 +43,9 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    "parking.middleware.PerformanceMiddleware",
+    "parking.queryinspector.QueryInspectorMiddleware",
+    "parking.routers.ReplicaPinningMiddleware",
     "django.middleware.security.SecurityMiddleware",
     "django.contrib.sessions.middleware.SessionMiddleware",
     "django.middleware.common.CommonMiddleware",
@@ -51,7 +55,8 @@ MIDDLEWARE = [
     "django.middleware.clickjacking.XFrameOptionsMiddleware",
 ]
 
-ROOT_URLCONF = "config.urls"
+# config.asgi switches to config.asgi_urls (async read views)
+ROOT_URLCONF = os.environ.get("PARKMATE_URLCONF", "config.urls")
 
 TEMPLATES = [
     {
@@ -74,14 +79,131 @@ WSGI_APPLICATION = "config.wsgi.application"
 
 # Database
 # https://docs.djangoproject.com/en/4.1/ref/settings/#databases
-
-DATABASES = {
+# Configured from the environment: PARKMATE_DB_ENGINE=postgresql for
+# production, SQLite (tuned for concurrent use unless PARKMATE_SQLITE_TUNED=0)
+# otherwise.
+
+PARKMATE_DB_ENGINE = os.environ.get("PARKMATE_DB_ENGINE", "sqlite")
+
+# Run on every new SQLite connection in tuned mode: readers no longer block
+# the writer (WAL), commits skip the fsync of each transaction and reads
+# are served from a 256 MiB memory map
+PARKMATE_SQLITE_PRAGMAS = (
+    "PRAGMA journal_mode=WAL;"
+    "PRAGMA synchronous=NORMAL;"
+    "PRAGMA mmap_size=268435456;"
+)
+
+if PARKMATE_DB_ENGINE == "postgresql":
+    DATABASES = {
+        "default": {
+            "ENGINE": "django.db.backends.postgresql",
+            "NAME": os.environ.get("PARKMATE_DB_NAME", "parkmate"),
+            "USER": os.environ.get("PARKMATE_DB_USER", "parkmate"),
+            "PASSWORD": os.environ.get("PARKMATE_DB_PASSWORD", ""),
+            "HOST": os.environ.get("PARKMATE_DB_HOST", "localhost"),
+            "PORT": os.environ.get("PARKMATE_DB_PORT", "5432"),
+            # Keep connections open across requests, checked before reuse
+            "CONN_MAX_AGE": int(os.environ.get("PARKMATE_DB_CONN_MAX_AGE", "60")),
+            "CONN_HEALTH_CHECKS": True,
+        }
+    }
+    if os.environ.get("PARKMATE_DB_POOL") == "1":
+        # psycopg connection pool (needs psycopg[pool]); Django requires
+        # persistent connections to be off when pooling
+        DATABASES["default"]["CONN_MAX_AGE"] = 0
+        DATABASES["default"]["OPTIONS"] = {
+            "pool": {
+                "min_size": int(os.environ.get("PARKMATE_DB_POOL_MIN", "2")),
+                "max_size": int(os.environ.get("PARKMATE_DB_POOL_MAX", "10")),
+                "timeout": 10,
+            },
+        }
+else:
+    DATABASES = {
+        "default": {
+            "ENGINE": "django.db.backends.sqlite3",
+            "NAME": os.environ.get("PARKMATE_DB_NAME", BASE_DIR / "db.sqlite3"),
+            "CONN_MAX_AGE": int(os.environ.get("PARKMATE_DB_CONN_MAX_AGE", "0")),
+            # Booking commits read then write; take the write lock up front so
+            # concurrent transactions queue on the busy timeout instead of failing
+            "OPTIONS": {
+                "transaction_mode": "IMMEDIATE",
+                "timeout": int(os.environ.get("PARKMATE_SQLITE_TIMEOUT", "20")),
+            },
+        }
+    }
+    if os.environ.get("PARKMATE_SQLITE_TUNED", "1") == "1":
+        DATABASES["default"]["OPTIONS"]["init_command"] = PARKMATE_SQLITE_PRAGMAS
+
+# Read replicas (parking.routers): PARKMATE_DB_REPLICAS lists the PostgreSQL
+# hosts, or SQLite files kept in sync with "manage.py sync_replicas", that
+# serve reads; selection is "round_robin" or "latency"
+PARKMATE_READ_REPLICAS = []
+for _number, _replica in enumerate(filter(None, os.environ.get("PARKMATE_DB_REPLICAS", "").split(",")), 1):
+    _alias = f"replica{_number}"
+    DATABASES[_alias] = dict(DATABASES["default"], TEST={"MIRROR": "default"})
+    DATABASES[_alias]["HOST" if PARKMATE_DB_ENGINE == "postgresql" else "NAME"] = _replica.strip()
+    PARKMATE_READ_REPLICAS.append(_alias)
+
+DATABASE_ROUTERS = ["parking.routers.ReplicaRouter"] if PARKMATE_READ_REPLICAS else []
+PARKMATE_REPLICA_SELECTION = os.environ.get("PARKMATE_REPLICA_SELECTION", "round_robin")
+PARKMATE_REPLICA_PIN_SECONDS = 5  # read-your-writes window after a write
+
+
+# Cache
+# https://docs.djangoproject.com/en/4.1/topics/cache/
+# Local memory by default; point PARKMATE_CACHE_BACKEND/LOCATION at a shared
+# backend (e.g. django.core.cache.backends.redis.RedisCache) in production.
+
+CACHES = {
     "default": {
-        "ENGINE": "django.db.backends.sqlite3",
-        "NAME": BASE_DIR / "db.sqlite3",
+        "BACKEND": os.environ.get(
+            "PARKMATE_CACHE_BACKEND", "django.core.cache.backends.locmem.LocMemCache"
+        ),
+        "LOCATION": os.environ.get("PARKMATE_CACHE_LOCATION", "parkmate"),
     }
 }
 
+# Parking catalog read-through cache
+PARKMATE_CATALOG_CACHE = "default"
+PARKMATE_CATALOG_CACHE_TIMEOUT = 300  # seconds
+
+
+# Password hashing (see parking/hashing.py). The preferred hasher is
+# "pbkdf2", "scrypt" or "argon2" (needs argon2-cffi); stored hashes of the
+# others still verify and are upgraded on the next login.
+_PASSWORD_HASHERS = {
+    "pbkdf2": "parking.hashing.TunedPBKDF2PasswordHasher",
+    "scrypt": "parking.hashing.TunedScryptPasswordHasher",
+    "argon2": "parking.hashing.TunedArgon2PasswordHasher",
+}
+PARKMATE_PASSWORD_HASHER = os.environ.get("PARKMATE_PASSWORD_HASHER", "pbkdf2")
+PASSWORD_HASHERS = [
+    _PASSWORD_HASHERS[PARKMATE_PASSWORD_HASHER],
+    *(path for name, path in _PASSWORD_HASHERS.items() if name != PARKMATE_PASSWORD_HASHER),
+    "django.contrib.auth.hashers.PBKDF2SHA1PasswordHasher",
+    "django.contrib.auth.hashers.BCryptSHA256PasswordHasher",
+]
+# Hasher costs; unset (0) keeps Django's defaults
+PARKMATE_PBKDF2_ITERATIONS = int(os.environ.get("PARKMATE_PBKDF2_ITERATIONS", "0"))
+PARKMATE_SCRYPT_WORK_FACTOR = int(os.environ.get("PARKMATE_SCRYPT_WORK_FACTOR", "0"))
+PARKMATE_ARGON2_TIME_COST = int(os.environ.get("PARKMATE_ARGON2_TIME_COST", "0"))
+PARKMATE_ARGON2_MEMORY_COST = int(os.environ.get("PARKMATE_ARGON2_MEMORY_COST", "0"))  # KiB
+PARKMATE_ARGON2_PARALLELISM = int(os.environ.get("PARKMATE_ARGON2_PARALLELISM", "0"))
+# Processes hashing passwords off the request threads; 0 hashes inline.
+# Size it to the cores left over by the web workers.
+PARKMATE_HASHER_WORKERS = int(os.environ.get("PARKMATE_HASHER_WORKERS", "0"))
+
+# Bookings that ended more than this many days ago are moved to the archive
+# table by `manage.py archive_bookings`, this many per transaction
+PARKMATE_BOOKING_RETENTION_DAYS = int(os.environ.get("PARKMATE_BOOKING_RETENTION_DAYS", "180"))
+PARKMATE_ARCHIVE_BATCH_SIZE = 1000
+
+# Job queue (parking.jobs): side effects of writes run in `manage.py run_jobs`
+# workers, or inline in the writing transaction with PARKMATE_JOBS_EAGER=1
+PARKMATE_JOBS_EAGER = os.environ.get("PARKMATE_JOBS_EAGER", "0") == "1"
+PARKMATE_JOB_LEASE_SECONDS = 300  # a running job is claimed again after this
 
 # Password validation
 # https://docs.djangoproject.com/en/4.1/ref/settings/#auth-password-validators
@@ -126,3 +248,45 @@ DEFAULT_AUTO_FIELD = "django.db.models.BigAutoField"
 
 # Custom User Model
 AUTH_USER_MODEL = 'parking.User'
+
+# Django REST framework
+REST_FRAMEWORK = {
+    "DEFAULT_AUTHENTICATION_CLASSES": [
+        "parking.authentication.TokenAuthentication",
+        "parking.authentication.UserIdAuthentication",
+    ],
+    # orjson-backed when installed; same output as DRF's JSONRenderer
+    "DEFAULT_RENDERER_CLASSES": [
+        "parking.renderers.FastJSONRenderer",
+        "rest_framework.renderers.BrowsableAPIRenderer",
+    ],
+}
+
+# Availability indexes (per process, kept in step across workers through the
+# cache above): parkings kept in memory, and how long an unused one is kept
+PARKMATE_AVAILABILITY_MAX_PARKINGS = 1000
+PARKMATE_AVAILABILITY_IDLE_SECONDS = 3600
+
+# Authenticated user cache (per process)
+PARKMATE_USER_CACHE_SIZE = 10000
+PARKMATE_USER_CACHE_TTL = 300  # seconds
+
+# Signed access tokens
+PARKMATE_TOKEN_TTL = 7 * 24 * 3600  # seconds
+PARKMATE_REVOCATION_SYNC_INTERVAL = 30  # seconds
+PARKMATE_REVOCATION_SYNC_OVERLAP = 120  # seconds each sync re-reads, for late commits
+
+# Request metrics served at /metrics (Prometheus text format)
+PARKMATE_METRICS_ENABLED = os.environ.get("PARKMATE_METRICS_ENABLED", "1") == "1"
+PARKMATE_SERVER_TIMING = DEBUG
+
+# N+1 and slow-query detection (parking.queryinspector); set
+# PARKMATE_QUERY_STRICT=1 in CI to turn findings into errors
+PARKMATE_QUERY_INSPECTOR = {
+    "ENABLED": DEBUG or os.environ.get("PARKMATE_QUERY_STRICT") == "1",
+    "STRICT": os.environ.get("PARKMATE_QUERY_STRICT") == "1",
+    "REPEAT_THRESHOLD": 5,  # identical-shape queries per request
+    "SLOW_MS": 100,
+    "MAX_QUERIES": None,
+    "BUDGETS": {},  # view name -> max queries
+}
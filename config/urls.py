@@ -17,7 +17,10 @@ Including another URLconf
 from django.contrib import admin
 from django.urls import path, include
 
+from parking.metrics import metrics_view
+
 urlpatterns = [
     path("admin/", admin.site.urls),
     path("api/parkmate/", include("parking.urls")),
+    path("metrics", metrics_view, name="metrics"),
 ]
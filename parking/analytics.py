@@ -0,0 +1,289 @@
+"""
+Pre-aggregated occupancy and revenue per parking.
+
+``OccupancyBucket`` rows hold, per parking and UTC hour or day, the number
+of bookings overlapping the bucket, the seconds they book within it and
+the revenue those seconds earn at the bookings' hourly ``price``. Reports
+read a handful of bucket rows instead of scanning bookings.
+
+The booking signals compute the difference of every booking write to the
+buckets (an update moves the booking's stored interval, see
+``Booking.from_db``) and queue it as an ``analytics.apply`` job in the
+write's transaction (see parking.jobs); the job writes it to the buckets
+off the request path. Inside ``batch()`` the differences are merged into
+one job at the end of the block, which the bulk endpoints use. Revenue is
+taken at the price stored on the booking (the parking's price when it was
+booked), so a removal takes back what the addition counted even after a
+price change; ``rebuild()`` recomputes buckets from the bookings at the
+same prices, vectorized with NumPy when it is installed, and drops the
+empty buckets left by removals.
+"""
+from collections import defaultdict
+from contextlib import contextmanager
+from contextvars import ContextVar
+from datetime import datetime, timezone as dt_timezone
+
+from django.db import transaction
+
+from . import jobs
+from .models import ArchivedBooking, Booking, OccupancyBucket, Parking
+from .routers import PRIMARY
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+GRANULARITIES = {'hour': 3600, 'day': 86400}  # bucket size in seconds
+REBUILD_CHUNK = 500  # parkings rebuilt per query
+
+_batch = ContextVar('parkmate_analytics_batch', default=None)
+
+
+class _Changes:
+    """Bucket differences of one or more booking writes, per database."""
+
+    def __init__(self):
+        # (parking_id, granularity, start, price) -> [bookings, seconds]; a
+        # price of None (bookings from before prices were stored) stands
+        # for the parking's current price
+        self.buckets = defaultdict(lambda: [0, 0])
+
+    def add(self, parking_id, start_time, end_time, sign, price):
+        for granularity, start, seconds in contributions(start_time, end_time):
+            bucket = self.buckets[parking_id, granularity, start, price]
+            bucket[0] += sign
+            bucket[1] += sign * seconds
+
+
+def _epoch(value):
+    return int(value.timestamp())
+
+
+def _datetime(epoch):
+    return datetime.fromtimestamp(epoch, tz=dt_timezone.utc)
+
+
+def contributions(start_time, end_time):
+    """``(granularity, bucket start epoch, seconds)`` of a booking, per bucket."""
+    start, end = _epoch(start_time), _epoch(end_time)
+    for granularity, size in GRANULARITIES.items():
+        bucket = start - start % size
+        while bucket < end:
+            yield granularity, bucket, min(end, bucket + size) - max(start, bucket)
+            bucket += size
+
+
+def _record(using, interval, sign, price):
+    pending = _batch.get()
+    if pending is not None:
+        pending[using].add(*interval, sign, price)
+        return
+    changes = _Changes()
+    changes.add(*interval, sign, price)
+    _submit(changes, using)
+
+
+@contextmanager
+def batch():
+    """Merge the bucket changes of the block and write them when it exits."""
+    if _batch.get() is not None:
+        yield
+        return
+    pending = defaultdict(_Changes)
+    token = _batch.set(pending)
+    try:
+        yield
+    finally:
+        _batch.reset(token)
+    for using, changes in pending.items():
+        _submit(changes, using)
+
+
+def booking_saved(instance, using, stored, current, stored_price=None):
+    """
+    Move a created or updated booking's contribution (called by the
+    signals) from its ``stored`` interval and price to the current ones.
+    """
+    if stored == current and stored_price == instance.price:
+        return
+    with batch():
+        if stored is not None:
+            _record(using, stored, -1, stored_price)
+        _record(using, current, 1, instance.price)
+
+
+def booking_deleted(instance, using, stored, price):
+    _record(using, stored, -1, price)
+
+
+def _submit(changes, using):
+    buckets = [[*key, *delta] for key, delta in changes.buckets.items() if delta != [0, 0]]
+    if buckets:
+        jobs.enqueue('analytics.apply', {'buckets': buckets, 'using': using}, using=using)
+
+
+@jobs.register('analytics.apply')
+def _apply_job(buckets, using, prices=()):
+    changes = _Changes()
+    # Jobs queued before prices were stored on bookings carry them apart
+    prices = dict(prices)
+    for row in buckets:
+        if len(row) == 5:
+            row = [*row[:3], prices.get(row[0]), *row[3:]]
+        parking_id, granularity, start, price, bookings, seconds = row
+        delta = changes.buckets[parking_id, granularity, start, price]
+        delta[0] += bookings
+        delta[1] += seconds
+    _apply(changes, using)
+
+
+def _apply(changes, using):
+    if not any(delta != [0, 0] for delta in changes.buckets.values()):
+        return
+    parking_ids = {parking_id for parking_id, _, _, _ in changes.buckets}
+    # Part of the job's transaction (or the write's, when run eagerly)
+    with transaction.atomic(using=using, savepoint=False):
+        # Buckets can only be written for parkings that still exist
+        current = dict(Parking.objects.using(using).filter(parking_id__in=parking_ids).values_list(
+            'parking_id', 'price'
+        ))
+        buckets = defaultdict(lambda: [0, 0, 0.0])  # (parking_id, granularity, start) -> [bookings, seconds, revenue]
+        for (parking_id, granularity, start, price), (bookings, seconds) in changes.buckets.items():
+            if parking_id in current:
+                bucket = buckets[parking_id, granularity, start]
+                bucket[0] += bookings
+                bucket[1] += seconds
+                bucket[2] += seconds * (current[parking_id] if price is None else price) / 3600
+        starts = sorted({_datetime(start) for _, _, start in buckets})
+        # Every difference is added to a row, creating missing ones empty
+        # first, so jobs give the same buckets in any order. A removal can
+        # run before its addition and leave a negative bucket until then;
+        # emptied buckets are kept, deleting them could drop the
+        # difference of a job waiting on their lock. Rows created by a
+        # concurrent job are skipped instead of failing the insert.
+        OccupancyBucket.objects.using(using).bulk_create([
+            OccupancyBucket(parking_id_id=parking_id, granularity=granularity, start=_datetime(start))
+            for parking_id, granularity, start in buckets
+        ], ignore_conflicts=True)
+        changed = []
+        for bucket in OccupancyBucket.objects.using(using).select_for_update().filter(
+            parking_id__in=current, start__in=starts,
+        ):
+            delta = buckets.get((bucket.parking_id_id, bucket.granularity, _epoch(bucket.start)))
+            if delta is None:
+                continue
+            bookings, seconds, revenue = delta
+            bucket.bookings += bookings
+            bucket.booked_seconds += seconds
+            bucket.revenue += revenue
+            changed.append(bucket)
+        OccupancyBucket.objects.using(using).bulk_update(changed, ['bookings', 'booked_seconds', 'revenue'])
+
+
+def _aggregate_python(rows, prices):
+    totals = defaultdict(lambda: [0, 0, 0.0])
+    for parking_id, start_time, end_time, price in rows:
+        hourly = prices[parking_id] if price is None else price
+        for granularity, start, seconds in contributions(start_time, end_time):
+            total = totals[parking_id, granularity, start]
+            total[0] += 1
+            total[1] += seconds
+            total[2] += seconds * hourly / 3600
+    return {key: tuple(total) for key, total in totals.items()}
+
+
+def _aggregate_numpy(rows, prices):
+    if not rows:
+        return {}
+    parking_ids = numpy.array([row[0] for row in rows], dtype=numpy.int64)
+    starts = numpy.array([_epoch(row[1]) for row in rows], dtype=numpy.int64)
+    ends = numpy.array([_epoch(row[2]) for row in rows], dtype=numpy.int64)
+    hourly_price = numpy.array(
+        [prices[row[0]] if row[3] is None else row[3] for row in rows], dtype=numpy.float64,
+    ) / 3600
+    result = {}
+    for granularity, size in GRANULARITIES.items():
+        first = starts // size
+        counts = numpy.maximum((ends - 1) // size - first + 1, 0)
+        # One element per (booking, bucket) pair: the booking's row and the
+        # bucket's offset from the booking's first bucket
+        row = numpy.repeat(numpy.arange(len(starts)), counts)
+        offset = numpy.arange(counts.sum()) - numpy.repeat(numpy.cumsum(counts) - counts, counts)
+        bucket = (first[row] + offset) * size
+        seconds = numpy.minimum(ends[row], bucket + size) - numpy.maximum(starts[row], bucket)
+        keys, inverse = numpy.unique(numpy.stack((parking_ids[row], bucket), axis=1), axis=0, return_inverse=True)
+        inverse = inverse.reshape(-1)
+        bookings = numpy.bincount(inverse)
+        booked = numpy.bincount(inverse, weights=seconds)
+        revenue = numpy.bincount(inverse, weights=seconds * hourly_price[row])
+        for (parking_id, start), count, total, earned in zip(
+            keys.tolist(), bookings.tolist(), booked.tolist(), revenue.tolist()
+        ):
+            result[parking_id, granularity, start] = (count, int(total), earned)
+    return result
+
+
+def rebuild(parking_ids=None, using=PRIMARY):
+    """
+    Recompute the buckets of ``parking_ids`` (every parking when None) from
+    their bookings. Returns the number of buckets written.
+    """
+    aggregate = _aggregate_numpy if numpy is not None else _aggregate_python
+    parkings = Parking.objects.using(using).order_by('parking_id')
+    if parking_ids is not None:
+        parkings = parkings.filter(parking_id__in=parking_ids)
+    prices = dict(parkings.values_list('parking_id', 'price'))
+    ids = list(prices)
+    written = 0
+    for offset in range(0, len(ids), REBUILD_CHUNK):
+        chunk = ids[offset:offset + REBUILD_CHUNK]
+        with transaction.atomic(using=using):
+            OccupancyBucket.objects.using(using).filter(parking_id__in=chunk).delete()
+            # Archived bookings count like the others
+            rows = [
+                row
+                for model in (Booking, ArchivedBooking)
+                for row in model.objects.using(using).filter(parking_id__in=chunk).values_list(
+                    'parking_id', 'start_time', 'end_time', 'price'
+                )
+            ]
+            buckets = [
+                OccupancyBucket(
+                    parking_id_id=parking_id, granularity=granularity, start=_datetime(start),
+                    bookings=bookings, booked_seconds=seconds, revenue=revenue,
+                )
+                for (parking_id, granularity, start), (bookings, seconds, revenue) in aggregate(rows, prices).items()
+            ]
+            OccupancyBucket.objects.using(using).bulk_create(buckets, batch_size=2000)
+            written += len(buckets)
+    return written
+
+
+def series(parking, granularity, start_time, end_time):
+    """
+    Dense list of the ``granularity`` buckets from ``start_time`` (rounded
+    down) to ``end_time`` (exclusive) for ``parking``, empty buckets included.
+    """
+    size = GRANULARITIES[granularity]
+    first = _epoch(start_time) // size * size
+    end = _epoch(end_time)
+    stored = {
+        _epoch(bucket.start): bucket
+        for bucket in OccupancyBucket.objects.filter(
+            parking_id=parking, granularity=granularity, start__gte=_datetime(first), start__lt=end_time,
+        )
+    }
+    capacity = size * parking.amount_of_spots
+    buckets = []
+    for start in range(first, end, size):
+        bucket = stored.get(start)
+        booked = bucket.booked_seconds if bucket else 0
+        buckets.append({
+            'start': _datetime(start),
+            'bookings': bucket.bookings if bucket else 0,
+            'booked_hours': round(booked / 3600, 2),
+            'occupancy': round(booked / capacity, 4) if capacity else 0.0,
+            'revenue': round(bucket.revenue, 2) if bucket else 0.0,
+        })
+    return buckets
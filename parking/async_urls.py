@@ -0,0 +1,21 @@
+"""
+URLconf of the ASGI application: the routes of ``parking.urls`` with the
+read-heavy views replaced by their native async versions.
+"""
+from django.urls import path
+
+from . import async_views
+from .urls import urlpatterns as sync_urlpatterns
+
+ASYNC_VIEWS = {
+    'parking_list_create': async_views.parking_list_create,
+    'get_parking': async_views.get_parking,
+    'parking_availability': async_views.parking_availability,
+    'get_booking': async_views.get_booking,
+    'booking_export': async_views.booking_export,
+}
+
+urlpatterns = [
+    path(str(pattern.pattern), ASYNC_VIEWS.get(pattern.name, pattern.callback), name=pattern.name)
+    for pattern in sync_urlpatterns
+]
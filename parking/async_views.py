@@ -0,0 +1,198 @@
+"""
+Native async implementations of the read-heavy endpoints.
+
+Under ASGI the DRF views in ``parking.views`` each occupy a worker thread
+for the whole request. These views run on the event loop: they use the
+async ORM and cache API and only leave the loop for the database calls
+themselves. They are routed by ``parking.async_urls`` (the URLconf of
+``config.asgi``) in place of their sync counterparts and answer with the
+same bodies and status codes.
+"""
+from asgiref.sync import sync_to_async
+from django.http import HttpResponse, StreamingHttpResponse
+from django.views.decorators.csrf import csrf_exempt
+from rest_framework import exceptions, status
+
+from . import availability, caching, views
+from .authentication import aauthenticate
+from .exports import DEFAULT_CHUNK_SIZE, EXPORT_FORMATS, aexport_bookings
+from .models import Booking, Parking
+from .pagination import InvalidQuery, KeysetPagination, parse_fields
+from .renderers import dumps
+from .routers import PRIMARY
+from .serializers import BookingSerializer, ParkingSerializer, PARKING_FIELDS
+from .views import _filter_bookings, _parse_window
+
+
+def _json(data, status_code=status.HTTP_200_OK):
+    return HttpResponse(dumps(data), content_type='application/json', status=status_code)
+
+
+def _not_found(model):
+    return _json({'detail': f'No {model._meta.object_name} matches the given query.'}, status.HTTP_404_NOT_FOUND)
+
+
+def _method_not_allowed(request):
+    return _json({'detail': f'Method "{request.method}" not allowed.'}, status.HTTP_405_METHOD_NOT_ALLOWED)
+
+
+async def _authenticate(request):
+    """Resolve the caller like DRF would; returns ``(user, error response)``."""
+    try:
+        return await aauthenticate(request), None
+    except exceptions.AuthenticationFailed as exc:
+        response = _json({'detail': str(exc.detail)}, status.HTTP_401_UNAUTHORIZED)
+        response['WWW-Authenticate'] = 'Bearer'
+        return None, response
+
+
+class _Missing(Exception):
+    pass
+
+
+@csrf_exempt
+async def parking_list_create(request):
+    """
+    Create a new parking or get all parkings.
+    POST /api/parkmate/parking - Create parking (runs the sync view)
+    GET /api/parkmate/parking - Get all parkings (cached; supports If-None-Match)
+    Query: fields=a,b; limit=N, cursor=... for keyset pagination
+    """
+    if request.method == 'POST':
+        return await sync_to_async(views.parking_list_create)(request)
+    if request.method != 'GET':
+        return _method_not_allowed(request)
+    _, error = await _authenticate(request)
+    if error:
+        return error
+
+    paginator = KeysetPagination({'parking_id': ('parking_id',)}, 'parking_id')
+    try:
+        fields = parse_fields(request, PARKING_FIELDS)
+        # Cached entries outlive the request: never build them from a lagging replica
+        parkings = paginator.paginate_queryset(Parking.objects.using(PRIMARY), request)
+    except InvalidQuery as exc:
+        return _json({'error': str(exc)}, status.HTTP_400_BAD_REQUEST)
+
+    async def build():
+        columns = [name for name in PARKING_FIELDS if name in fields or name in paginator.key_fields]
+        rows = [row async for row in parkings.values(*columns)]
+        return paginator.get_response_data(rows, fields)
+
+    return await caching.acached_response(request, await caching.aparking_list_key(request), build)
+
+
+async def get_parking(request, parking_id):
+    """
+    Get specific parking.
+    GET /api/parkmate/parking/{parking_id}
+    Served from the catalog cache; supports If-None-Match.
+    """
+    if request.method != 'GET':
+        return _method_not_allowed(request)
+    _, error = await _authenticate(request)
+    if error:
+        return error
+
+    async def build():
+        try:
+            parking = await Parking.objects.using(PRIMARY).aget(parking_id=parking_id)
+        except Parking.DoesNotExist:
+            raise _Missing
+        return ParkingSerializer(parking).data
+
+    try:
+        return await caching.acached_response(request, await caching.aparking_detail_key(parking_id), build)
+    except _Missing:
+        return _not_found(Parking)
+
+
+async def parking_availability(request, parking_id):
+    """
+    Get free spots of a parking.
+    GET /api/parkmate/parking/{parking_id}/availability?from=...&to=...
+    Without "to" the spots free at the moment "from" (default: now) are returned.
+    """
+    if request.method != 'GET':
+        return _method_not_allowed(request)
+    _, error = await _authenticate(request)
+    if error:
+        return error
+    try:
+        parking = await Parking.objects.aget(parking_id=parking_id)
+    except Parking.DoesNotExist:
+        return _not_found(Parking)
+
+    try:
+        start_time, end_time = _parse_window(request.GET)
+    except InvalidQuery as exc:
+        return _json({'error': str(exc)}, status.HTTP_400_BAD_REQUEST)
+
+    if end_time is None:
+        occupied = await availability.aoccupancy_at(parking.parking_id, start_time)
+    else:
+        occupied = await availability.apeak_occupancy(parking.parking_id, start_time, end_time)
+    return _json({
+        'parking_id': parking.parking_id,
+        'amount_of_spots': parking.amount_of_spots,
+        'from': start_time,
+        'to': end_time,
+        'occupied_spots': occupied,
+        'free_spots': max(parking.amount_of_spots - occupied, 0),
+    })
+
+
+async def get_booking(request, booking_id):
+    """
+    Get specific booking.
+    GET /api/parkmate/bookings/{booking_id}
+    """
+    if request.method != 'GET':
+        return _method_not_allowed(request)
+    user, error = await _authenticate(request)
+    if error:
+        return error
+    try:
+        booking = await Booking.objects.select_related('parking_id', 'user_id').aget(booking_id=booking_id)
+    except Booking.DoesNotExist:
+        return _not_found(Booking)
+
+    # Check permission: admin or owner of the booking
+    if user is not None and not user.is_admin and booking.user_id_id != user.id:
+        return _json(
+            {'error': 'You do not have permission to access this booking'},
+            status.HTTP_403_FORBIDDEN
+        )
+    return _json(BookingSerializer(booking).data)
+
+
+async def booking_export(request):
+    """
+    Stream all bookings as NDJSON or CSV.
+    GET /api/parkmate/bookings/export?output=ndjson|csv
+    Query: from, to, parking_id filters. Admin only.
+    """
+    if request.method != 'GET':
+        return _method_not_allowed(request)
+    user, error = await _authenticate(request)
+    if error:
+        return error
+    if user is None:
+        return _json({'error': 'User authentication required'}, status.HTTP_401_UNAUTHORIZED)
+    if not user.is_admin:
+        return _json({'error': 'You do not have permission to export bookings'}, status.HTTP_403_FORBIDDEN)
+
+    export_format = request.GET.get('output', 'ndjson')
+    if export_format not in EXPORT_FORMATS:
+        return _json({'error': f'output must be one of: {", ".join(EXPORT_FORMATS)}'}, status.HTTP_400_BAD_REQUEST)
+    try:
+        bookings = _filter_bookings(Booking.objects.all(), request.GET)
+    except InvalidQuery as exc:
+        return _json({'error': str(exc)}, status.HTTP_400_BAD_REQUEST)
+
+    response = StreamingHttpResponse(
+        aexport_bookings(bookings, export_format, chunk_size=DEFAULT_CHUNK_SIZE),
+        content_type=EXPORT_FORMATS[export_format],
+    )
+    response['Content-Disposition'] = f'attachment; filename="bookings.{export_format}"'
+    return response
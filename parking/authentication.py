@@ -0,0 +1,154 @@
+"""
+Caller authentication for the API.
+
+Clients authenticate with the signed token returned by login
+(``Authorization: Bearer <token>``, see ``parking.tokens``) or, for older
+clients, the ``X-User-Id`` header. The user is resolved once per request
+and kept in a bounded, thread-safe LRU cache with a TTL, so repeat
+callers cost no queries. ``parking.signals`` evicts users on save/delete;
+other worker processes pick up changes when the TTL expires.
+"""
+import threading
+from collections import OrderedDict
+from time import monotonic
+
+from django.conf import settings
+from rest_framework import authentication, exceptions
+
+from .models import User
+from .routers import PRIMARY
+from .tokens import InvalidToken, averify_token, verify_token
+
+
+class UserCache:
+    """LRU cache of users by id whose entries expire after ``ttl`` seconds."""
+
+    def __init__(self, max_size=10000, ttl=300):
+        self.max_size = max_size
+        self.ttl = ttl
+        self._entries = OrderedDict()  # user_id -> (expires_at, user)
+        self._lock = threading.Lock()
+
+    def _cached(self, user_id, now):
+        with self._lock:
+            entry = self._entries.get(user_id)
+            if entry is not None and entry[0] > now:
+                self._entries.move_to_end(user_id)
+                return entry[1]
+        return None
+
+    def get(self, user_id):
+        """Return the user for ``user_id``, loading it on a miss."""
+        now = monotonic()
+        user = self._cached(user_id, now)
+        if user is None:
+            user = User.objects.using(PRIMARY).get(id=user_id)
+            self.set(user, now)
+        return user
+
+    async def aget(self, user_id):
+        now = monotonic()
+        user = self._cached(user_id, now)
+        if user is None:
+            user = await User.objects.using(PRIMARY).aget(id=user_id)
+            self.set(user, now)
+        return user
+
+    def set(self, user, now=None):
+        expires_at = (monotonic() if now is None else now) + self.ttl
+        with self._lock:
+            self._entries[user.id] = (expires_at, user)
+            self._entries.move_to_end(user.id)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+    def invalidate(self, user_id):
+        with self._lock:
+            self._entries.pop(user_id, None)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+user_cache = UserCache(
+    max_size=getattr(settings, 'PARKMATE_USER_CACHE_SIZE', 10000),
+    ttl=getattr(settings, 'PARKMATE_USER_CACHE_TTL', 300),
+)
+
+
+class UserIdAuthentication(authentication.BaseAuthentication):
+    """Authenticate the caller from the ``X-User-Id`` header."""
+
+    header = 'X-User-Id'
+
+    def authenticate(self, request):
+        value = request.headers.get(self.header)
+        if not value:
+            return None
+        try:
+            user = user_cache.get(int(value))
+        except (User.DoesNotExist, ValueError):
+            raise exceptions.AuthenticationFailed('Invalid user authentication')
+        if not user.is_active:
+            raise exceptions.AuthenticationFailed('User inactive or deleted')
+        return (user, None)
+
+    def authenticate_header(self, request):
+        return self.header
+
+
+class TokenAuthentication(authentication.BaseAuthentication):
+    """Authenticate the caller from an ``Authorization: Bearer`` token."""
+
+    keyword = 'Bearer'
+
+    def authenticate(self, request):
+        parts = authentication.get_authorization_header(request).split()
+        if not parts or parts[0].lower() != self.keyword.lower().encode():
+            return None
+        if len(parts) != 2:
+            raise exceptions.AuthenticationFailed('Invalid token header')
+        try:
+            access = verify_token(parts[1].decode())
+            user = user_cache.get(access.user_id)
+        except InvalidToken as exc:
+            raise exceptions.AuthenticationFailed(str(exc))
+        except (User.DoesNotExist, UnicodeDecodeError):
+            raise exceptions.AuthenticationFailed('Invalid token')
+        if not user.is_active:
+            raise exceptions.AuthenticationFailed('User inactive or deleted')
+        return (user, access)
+
+    def authenticate_header(self, request):
+        return self.keyword
+
+
+async def aauthenticate(request):
+    """
+    Resolve the caller of a native async view the way the two classes
+    above do for DRF views: returns the user, or None for anonymous
+    requests, and raises ``AuthenticationFailed`` for bad credentials.
+    """
+    parts = request.headers.get('Authorization', '').split()
+    if parts and parts[0].lower() == TokenAuthentication.keyword.lower():
+        if len(parts) != 2:
+            raise exceptions.AuthenticationFailed('Invalid token header')
+        try:
+            access = await averify_token(parts[1])
+            user = await user_cache.aget(access.user_id)
+        except InvalidToken as exc:
+            raise exceptions.AuthenticationFailed(str(exc))
+        except User.DoesNotExist:
+            raise exceptions.AuthenticationFailed('Invalid token')
+    else:
+        value = request.headers.get(UserIdAuthentication.header)
+        if not value:
+            return None
+        try:
+            user = await user_cache.aget(int(value))
+        except (User.DoesNotExist, ValueError):
+            raise exceptions.AuthenticationFailed('Invalid user authentication')
+    if not user.is_active:
+        raise exceptions.AuthenticationFailed('User inactive or deleted')
+    return user
@@ -0,0 +1,442 @@
+"""
+Spot availability engine.
+
+Every parking gets an in-memory occupancy index built from its bookings.
+Booking intervals are half-open ``[start_time, end_time)`` and their
+boundaries are compressed into a sorted list of timestamps; a segment tree
+with range-add / range-max over those timestamps answers "occupied spots at
+moment T" and "peak occupancy in [start, end)" in O(log n).
+
+Indexes are loaded lazily from the database the first time a parking is
+queried and are kept in sync by the booking signals in ``parking.signals``.
+Every committed booking write also bumps a per-parking version in the
+shared cache (see ``parking.caching``); a query finding that version
+ahead of its index's, after a write through another worker, reloads it.
+They only hold the bookings that end after their horizon, about an hour
+ago, and moments before it are answered from the database. At most
+``PARKMATE_AVAILABILITY_MAX_PARKINGS`` indexes are kept, the least recently
+used first to go, and an index unused for
+``PARKMATE_AVAILABILITY_IDLE_SECONDS`` is dropped.
+"""
+import threading
+import time
+from bisect import bisect_left, bisect_right
+from collections import OrderedDict, defaultdict
+from datetime import timedelta
+from math import isqrt
+
+from django.conf import settings
+from django.utils import timezone
+
+from . import caching
+from .models import Booking
+from .routers import PRIMARY
+
+MIN_PENDING = 32      # intervals waiting for a tree rebuild, at least
+HORIZON_SLACK = 3600  # seconds ended bookings stay indexed
+_INSTANT = timedelta(microseconds=1)
+
+
+class _SegmentTree:
+    """Range-add / range-max segment tree over a fixed number of leaves."""
+
+    def __init__(self, values):
+        self._size = max(len(values), 1)
+        self._max = [0] * (4 * self._size)
+        self._lazy = [0] * (4 * self._size)
+        if values:
+            self._build(1, 0, self._size - 1, values)
+
+    def _build(self, node, lo, hi, values):
+        if lo == hi:
+            self._max[node] = values[lo]
+            return
+        mid = (lo + hi) // 2
+        self._build(2 * node, lo, mid, values)
+        self._build(2 * node + 1, mid + 1, hi, values)
+        self._max[node] = max(self._max[2 * node], self._max[2 * node + 1])
+
+    def add(self, left, right, delta):
+        """Add ``delta`` to every leaf in ``[left, right]``."""
+        if left <= right:
+            self._add(1, 0, self._size - 1, left, right, delta)
+
+    def _add(self, node, lo, hi, left, right, delta):
+        if right < lo or hi < left:
+            return
+        if left <= lo and hi <= right:
+            self._max[node] += delta
+            self._lazy[node] += delta
+            return
+        mid = (lo + hi) // 2
+        self._add(2 * node, lo, mid, left, right, delta)
+        self._add(2 * node + 1, mid + 1, hi, left, right, delta)
+        self._max[node] = max(self._max[2 * node], self._max[2 * node + 1]) + self._lazy[node]
+
+    def max(self, left, right):
+        """Return the maximum leaf value in ``[left, right]``."""
+        if left > right:
+            return 0
+        return self._query(1, 0, self._size - 1, left, right)
+
+    def _query(self, node, lo, hi, left, right):
+        if right < lo or hi < left:
+            return float('-inf')
+        if left <= lo and hi <= right:
+            return self._max[node]
+        mid = (lo + hi) // 2
+        return max(
+            self._query(2 * node, lo, mid, left, right),
+            self._query(2 * node + 1, mid + 1, hi, left, right),
+        ) + self._lazy[node]
+
+
+class ParkingOccupancy:
+    """
+    Occupancy index for the bookings of a single parking.
+
+    An interval whose boundaries are already leaves of the tree is added to
+    it in O(log n). Other intervals wait in a pending list that the queries
+    take into account, and the tree is rebuilt over every boundary once
+    that list outgrows about sqrt(n) intervals, so a write costs amortised
+    O(sqrt(n) log n) rather than a rebuild.
+
+    With a ``horizon`` (a timestamp), intervals ending by then are not
+    kept, and every rebuild moves the horizon up to ``HORIZON_SLACK``
+    seconds ago: the index no longer answers for moments before it.
+    """
+
+    def __init__(self, intervals=(), horizon=None):
+        self.horizon = horizon
+        self._intervals = {}  # booking_id -> (start, end) timestamps
+        self._pending = {}    # booking_id -> (start, end) not in the tree yet
+        self._times = []      # sorted timestamps, leaf i covers [times[i], times[i + 1])
+        for booking_id, start, end in intervals:
+            interval = self._interval(start, end)
+            if interval is not None:
+                self._intervals[booking_id] = interval
+        self._rebuild()
+
+    def __contains__(self, booking_id):
+        return booking_id in self._intervals
+
+    def __len__(self):
+        return len(self._intervals)
+
+    def add(self, booking_id, start, end):
+        """Insert or replace the interval of a booking."""
+        self.remove(booking_id)
+        interval = self._interval(start, end)
+        if interval is None:
+            return
+        self._intervals[booking_id] = interval
+        left, right = self._leaf(interval[0]), self._leaf(interval[1])
+        if left is not None and right is not None:
+            self._tree.add(left, right - 1, 1)
+            return
+        self._pending[booking_id] = interval
+        if len(self._pending) > max(MIN_PENDING, isqrt(len(self._intervals))):
+            if self.horizon is not None:
+                self.horizon = max(self.horizon, time.time() - HORIZON_SLACK)
+                self._intervals = {
+                    booking_id: interval for booking_id, interval in self._intervals.items()
+                    if interval[1] > self.horizon
+                }
+            self._rebuild()
+
+    def remove(self, booking_id):
+        """Drop the interval of a booking; returns it, or None if it was not indexed."""
+        interval = self._intervals.pop(booking_id, None)
+        if interval is not None and self._pending.pop(booking_id, None) is None:
+            self._tree.add(self._leaf(interval[0]), self._leaf(interval[1]) - 1, -1)
+        return interval
+
+    def occupancy_at(self, when):
+        """Number of bookings covering the moment ``when``."""
+        when = _timestamp(when)
+        position = bisect_right(self._times, when) - 1
+        occupied = self._tree.max(position, position) if position >= 0 else 0
+        return occupied + sum(start <= when < end for start, end in self._pending.values())
+
+    def peak_occupancy(self, start, end):
+        """Maximum number of simultaneous bookings within ``[start, end)``."""
+        start, end = _timestamp(start), _timestamp(end)
+        if start >= end:
+            return 0
+        # The pending intervals are constant between their boundaries: add
+        # them to the tree's peak piece by piece
+        deltas = defaultdict(int)
+        deltas[start] = 0
+        for pending_start, pending_end in self._pending.values():
+            if pending_start < end and pending_end > start:
+                deltas[max(pending_start, start)] += 1
+                if pending_end < end:
+                    deltas[pending_end] -= 1
+        cuts = sorted(deltas)
+        peak = pending = 0
+        for position, cut in enumerate(cuts):
+            pending += deltas[cut]
+            until = cuts[position + 1] if position + 1 < len(cuts) else end
+            peak = max(peak, self._tree_peak(cut, until) + pending)
+        return peak
+
+    def _interval(self, start, end):
+        start, end = _timestamp(start), _timestamp(end)
+        if start >= end or (self.horizon is not None and end <= self.horizon):
+            return None
+        return start, end
+
+    def _leaf(self, timestamp):
+        """The leaf starting at ``timestamp``, or None if it is not a boundary of the tree."""
+        position = bisect_left(self._times, timestamp)
+        if position < len(self._times) and self._times[position] == timestamp:
+            return position
+        return None
+
+    def _tree_peak(self, start, end):
+        left = max(bisect_right(self._times, start) - 1, 0)
+        right = bisect_left(self._times, end) - 1
+        return max(self._tree.max(left, right), 0)
+
+    def _rebuild(self):
+        self._pending = {}
+        self._times = sorted({edge for interval in self._intervals.values() for edge in interval})
+        leaves = {timestamp: position for position, timestamp in enumerate(self._times)}
+        deltas = [0] * (len(self._times) + 1)
+        for start, end in self._intervals.values():
+            deltas[leaves[start]] += 1
+            deltas[leaves[end]] -= 1
+        values = []
+        running = 0
+        for delta in deltas[:-1]:
+            running += delta
+            values.append(running)
+        self._tree = _SegmentTree(values)
+
+
+def _timestamp(value):
+    return value.timestamp() if hasattr(value, 'timestamp') else float(value)
+
+
+_lock = threading.RLock()
+_indexes = OrderedDict()  # parking_id -> ParkingOccupancy, least recently used first
+_versions = {}            # parking_id -> shared occupancy version the index holds
+_last_used = {}           # parking_id -> time.monotonic() of the last query
+
+
+def _horizon():
+    return timezone.now() - timedelta(seconds=HORIZON_SLACK)
+
+
+def _install(parking_id, rows, horizon, version):
+    _indexes[parking_id] = ParkingOccupancy(rows, horizon=horizon.timestamp())
+    _versions[parking_id] = version
+    _touch(parking_id)
+
+
+def _touch(parking_id):
+    _indexes.move_to_end(parking_id)
+    now = _last_used[parking_id] = time.monotonic()
+    limit = getattr(settings, 'PARKMATE_AVAILABILITY_MAX_PARKINGS', 1000)
+    idle = now - getattr(settings, 'PARKMATE_AVAILABILITY_IDLE_SECONDS', 3600)
+    while _indexes:
+        oldest = next(iter(_indexes))
+        if len(_indexes) <= limit and _last_used[oldest] > idle:
+            break
+        _forget(oldest)
+
+
+def _forget(parking_id):
+    if _indexes.pop(parking_id, None) is not None:
+        del _versions[parking_id], _last_used[parking_id]
+
+
+def _stale(versions):
+    with _lock:
+        return [parking_id for parking_id, version in versions.items() if _versions.get(parking_id) != version]
+
+
+def _rows(parking_ids, horizon):
+    return Booking.objects.using(PRIMARY).filter(parking_id__in=parking_ids, end_time__gt=horizon).values_list(
+        'parking_id', 'booking_id', 'start_time', 'end_time'
+    )
+
+
+def _install_all(versions, rows, horizon):
+    intervals = {parking_id: [] for parking_id in versions}
+    for parking_id, *interval in rows:
+        intervals[parking_id].append(interval)
+    with _lock:
+        for parking_id, rows in intervals.items():
+            _install(parking_id, rows, horizon, versions[parking_id])
+
+
+def _load(versions):
+    """
+    (Re)load with one query the indexes of ``versions`` (``{parking_id:
+    shared version}``) that are missing or hold another version. The query
+    runs outside the lock.
+    """
+    stale = _stale(versions)
+    if stale:
+        horizon = _horizon()
+        _install_all({parking_id: versions[parking_id] for parking_id in stale}, _rows(stale, horizon), horizon)
+
+
+async def _aload(parking_id):
+    """``_load`` of a single parking with the async ORM."""
+    versions = {parking_id: await caching.aavailability_version(parking_id)}
+    if _stale(versions):
+        horizon = _horizon()
+        rows = [row async for row in _rows([parking_id], horizon)]
+        _install_all(versions, rows, horizon)
+    return versions[parking_id]
+
+
+def _loaded(parking_id, start, version):
+    """
+    The loaded index of ``parking_id`` if it holds ``version`` and every
+    booking from ``start`` on.
+    """
+    index = _indexes.get(parking_id)
+    if index is None or _versions[parking_id] != version or _timestamp(start) < index.horizon:
+        return None
+    _touch(parking_id)
+    return index
+
+
+def _overlapping(parking_id, start, end, exclude=None):
+    """The booking intervals of ``parking_id`` overlapping ``[start, end)``, from the database."""
+    bookings = Booking.objects.filter(parking_id=parking_id, start_time__lt=end, end_time__gt=start)
+    if exclude is not None:
+        bookings = bookings.exclude(booking_id=exclude)
+    return bookings.values_list('booking_id', 'start_time', 'end_time')
+
+
+def preload(parking_ids):
+    """
+    Load the missing or outdated indexes of ``parking_ids`` with a single
+    query. Returns the versions to pass on to ``free_spots``.
+    """
+    versions = caching.availability_versions(parking_ids)
+    _load(versions)
+    return versions
+
+
+def _version(parking_id, version):
+    if version is None:
+        version = caching.availability_versions([parking_id])[parking_id]
+        _load({parking_id: version})
+    return version
+
+
+def _peak(index, start, end, exclude):
+    excluded = index.remove(exclude) if exclude is not None else None
+    try:
+        return index.peak_occupancy(start, end)
+    finally:
+        if excluded is not None:
+            index.add(exclude, *excluded)
+
+
+def occupancy_at(parking_id, when, version=None):
+    """
+    Number of occupied spots of a parking at the moment ``when``.
+    ``version`` is the one returned by ``preload``, if it was called.
+    """
+    version = _version(parking_id, version)
+    with _lock:
+        index = _loaded(parking_id, when, version)
+        if index is not None:
+            return index.occupancy_at(when)
+    return ParkingOccupancy(_overlapping(parking_id, when, when + _INSTANT)).occupancy_at(when)
+
+
+def peak_occupancy(parking_id, start, end, exclude=None, version=None):
+    """
+    Peak number of occupied spots of a parking within ``[start, end)``.
+    ``exclude`` is a booking id left out of the count, e.g. the booking
+    being rescheduled.
+    """
+    version = _version(parking_id, version)
+    with _lock:
+        index = _loaded(parking_id, start, version)
+        if index is not None:
+            return _peak(index, start, end, exclude)
+    return ParkingOccupancy(_overlapping(parking_id, start, end, exclude)).peak_occupancy(start, end)
+
+
+async def aoccupancy_at(parking_id, when):
+    version = await _aload(parking_id)
+    with _lock:
+        index = _loaded(parking_id, when, version)
+        if index is not None:
+            return index.occupancy_at(when)
+    rows = [row async for row in _overlapping(parking_id, when, when + _INSTANT)]
+    return ParkingOccupancy(rows).occupancy_at(when)
+
+
+async def apeak_occupancy(parking_id, start, end, exclude=None):
+    version = await _aload(parking_id)
+    with _lock:
+        index = _loaded(parking_id, start, version)
+        if index is not None:
+            return _peak(index, start, end, exclude)
+    rows = [row async for row in _overlapping(parking_id, start, end, exclude)]
+    return ParkingOccupancy(rows).peak_occupancy(start, end)
+
+
+def free_spots(parking, start, end=None, exclude=None, version=None):
+    """Spots of ``parking`` free for the whole window (or at ``start``)."""
+    if end is None:
+        occupied = occupancy_at(parking.parking_id, start, version=version)
+    else:
+        occupied = peak_occupancy(parking.parking_id, start, end, exclude=exclude, version=version)
+    return max(parking.amount_of_spots - occupied, 0)
+
+
+def _sync(parking_id, version, change):
+    """
+    Apply ``change`` to the loaded index of ``parking_id`` if ``version``
+    directly follows the one it holds; otherwise another worker wrote in
+    between, and the next query reloads it.
+    """
+    index = _indexes.get(parking_id)
+    if index is not None and _versions[parking_id] == version - 1:
+        change(index)
+        _versions[parking_id] = version
+
+
+def record_booking(booking_id, parking_id, start, end, previous=None):
+    """
+    Sync a committed create or update of a booking into the shared version
+    and the loaded indexes; ``previous`` is the parking it was stored under.
+    """
+    moved = previous is not None and previous != parking_id
+    version = caching.bump_availability(parking_id)
+    left = caching.bump_availability(previous) if moved else None
+    with _lock:
+        if moved:
+            _sync(previous, left, lambda index: index.remove(booking_id))
+        _sync(parking_id, version, lambda index: index.add(booking_id, start, end))
+
+
+def discard_booking(booking_id, parking_id):
+    """Sync a committed delete of a booking."""
+    version = caching.bump_availability(parking_id)
+    with _lock:
+        _sync(parking_id, version, lambda index: index.remove(booking_id))
+
+
+def discard_parking(parking_id):
+    """Forget the index of a deleted parking."""
+    with _lock:
+        _forget(parking_id)
+
+
+def reset():
+    """Drop every loaded index; they are rebuilt from the database on demand."""
+    with _lock:
+        _indexes.clear()
+        _versions.clear()
+        _last_used.clear()
@@ -0,0 +1,104 @@
+"""
+Helpers shared by the ``bench_*`` management commands.
+
+Benchmarks never touch the configured database: ``benchmark_database()``
+sets up the test environment, creates a throwaway test database (file based
+on SQLite, so that worker threads share it) and destroys it afterwards.
+"""
+import logging
+import os
+import random
+import tempfile
+from contextlib import contextmanager
+from datetime import timedelta
+
+from django.db import connection
+from django.test.utils import setup_test_environment, teardown_test_environment
+from django.utils import timezone
+
+from . import analytics, summaries
+from .models import Booking, Parking, User
+
+BENCHMARK_PASSWORD = 'benchmark-password'
+# Synthetic parkings are scattered over a ~20 km square around this point
+SEED_CENTRE = (52.52, 13.405)
+SEED_SPREAD_DEGREES = 0.1
+
+
+@contextmanager
+def benchmark_database(keepdb=False):
+    """Run the block against a freshly created test database."""
+    test_settings = connection.settings_dict.setdefault('TEST', {})
+    temp_dir = None
+    if connection.vendor == 'sqlite' and not test_settings.get('NAME'):
+        temp_dir = tempfile.TemporaryDirectory()
+        test_settings['NAME'] = os.path.join(temp_dir.name, 'benchmark.sqlite3')
+    old_name = connection.settings_dict['NAME']
+    # Expected 4xx responses would otherwise flood the output
+    logging.getLogger('django.request').setLevel(logging.ERROR)
+    # Contended benchmark threads make every query look slow
+    logging.getLogger('parking.queries').setLevel(logging.ERROR)
+    setup_test_environment()
+    connection.creation.create_test_db(verbosity=0, autoclobber=True, keepdb=keepdb)
+    try:
+        yield
+    finally:
+        connection.creation.destroy_test_db(old_name, verbosity=0, keepdb=keepdb)
+        teardown_test_environment()
+        if temp_dir is not None:
+            test_settings['NAME'] = None
+            temp_dir.cleanup()
+
+
+def seed(parkings=10, users=10, bookings=0, spots=10, seed_value=0):
+    """
+    Insert synthetic parkings, users and random bookings over two years
+    (capacity is not enforced).
+    Returns ``(parking_ids, user_ids)``.
+    """
+    rng = random.Random(seed_value)
+    Parking.objects.bulk_create(
+        Parking(
+            amount_of_spots=spots, address=f'{n} Benchmark Street', price=rng.randint(1, 20),
+            latitude=SEED_CENTRE[0] + rng.uniform(-SEED_SPREAD_DEGREES, SEED_SPREAD_DEGREES),
+            longitude=SEED_CENTRE[1] + rng.uniform(-SEED_SPREAD_DEGREES, SEED_SPREAD_DEGREES),
+        )
+        for n in range(parkings)
+    )
+    # Every synthetic user shares one password hash to keep seeding fast
+    template = User(email='template@bench.local')
+    template.set_password(BENCHMARK_PASSWORD)
+    User.objects.bulk_create(
+        User(email=f'user{n}@bench.local', first_name='Bench', last_name=str(n), password=template.password)
+        for n in range(users)
+    )
+    parking_ids = list(Parking.objects.values_list('parking_id', flat=True))
+    user_ids = list(User.objects.values_list('id', flat=True))
+
+    origin = timezone.now().replace(minute=0, second=0, microsecond=0) - timedelta(days=365)
+    batch = []
+    for n in range(bookings):
+        start = origin + timedelta(hours=rng.randint(0, 24 * 730))
+        batch.append(Booking(
+            parking_id_id=rng.choice(parking_ids),
+            user_id_id=rng.choice(user_ids),
+            start_time=start,
+            end_time=start + timedelta(hours=rng.randint(1, 4)),
+        ))
+        if len(batch) >= 5000:
+            Booking.objects.bulk_create(batch)
+            batch = []
+    Booking.objects.bulk_create(batch)
+    # bulk_create bypasses the signals that maintain the buckets
+    analytics.rebuild()
+    summaries.rebuild()
+    return parking_ids, user_ids
+
+
+def percentile(values, fraction):
+    """Nearest-rank percentile of ``values`` (``fraction`` in [0, 1])."""
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    rank = min(max(int(round(fraction * len(ordered) + 0.5)) - 1, 0), len(ordered) - 1)
+    return ordered[rank]
@@ -0,0 +1,282 @@
+"""
+Bulk create/update/delete of parkings and bookings.
+
+All items of a request are validated in one pass, referenced rows are
+loaded with a single ``IN`` query and the writes go through
+``bulk_create``/``bulk_update`` inside one transaction. Items are
+independent: each gets its own result with an HTTP status, and invalid
+items do not keep the valid ones from being written.
+
+``bulk_create`` and ``bulk_update`` do not send model signals, so
+``post_save`` is sent for every written row; the signal receivers stay the
+single place that keeps indexes and caches in sync.
+"""
+from contextlib import contextmanager
+
+from django.db import router, transaction
+from django.db.models.signals import post_save
+
+from . import reservations, signals
+from .availability import ParkingOccupancy
+from .models import Booking, Parking
+from .pagination import is_integer
+from .serializers import BookingWriteSerializer, ParkingSerializer
+
+MAX_ITEMS = 500
+
+NO_FREE_SPOTS = {'parking_id': ['No free spots for the requested time']}
+NO_PARKING = {'parking_id': ['Parking does not exist']}
+
+
+class BulkError(ValueError):
+    """Raised when a bulk request body is not an acceptable list."""
+
+
+def check_items(items):
+    if not isinstance(items, list):
+        raise BulkError('Request body must be a list')
+    if len(items) > MAX_ITEMS:
+        raise BulkError(f'At most {MAX_ITEMS} items per request')
+    return items
+
+
+def _result(index, status_code, **extra):
+    return {'index': index, 'status': status_code, **extra}
+
+
+def _send_saved(model, instances, created):
+    using = router.db_for_write(model)
+    # The occupancy buckets and user summaries of the whole batch are written at once
+    with signals.batch():
+        for instance in instances:
+            post_save.send(
+                sender=model, instance=instance, created=created,
+                update_fields=None, raw=False, using=using,
+            )
+
+
+def _ids(items, key):
+    """Map item index to the integer ``key`` of each dict item that has one."""
+    ids = {}
+    for index, item in enumerate(items):
+        value = item.get(key) if isinstance(item, dict) else item
+        if is_integer(value):
+            ids[index] = value
+    return ids
+
+
+# Parkings
+
+def create_parkings(items):
+    results = [None] * len(items)
+    valid = []
+    for index, item in enumerate(items):
+        serializer = ParkingSerializer(data=item)
+        if serializer.is_valid():
+            valid.append((index, Parking(**serializer.validated_data)))
+        else:
+            results[index] = _result(index, 400, errors=serializer.errors)
+    with transaction.atomic():
+        created = Parking.objects.bulk_create([parking for _, parking in valid])
+        _send_saved(Parking, created, created=True)
+    for (index, _), parking in zip(valid, created):
+        results[index] = _result(index, 201, data=ParkingSerializer(parking).data)
+    return results
+
+
+def update_parkings(items):
+    results = [None] * len(items)
+    ids = _ids(items, 'parking_id')
+    existing = Parking.objects.in_bulk(set(ids.values()))
+    changed = {}
+    fields = set()
+    for index, item in enumerate(items):
+        parking = existing.get(ids.get(index))
+        if parking is None:
+            results[index] = _result(index, 404, errors=NO_PARKING)
+            continue
+        serializer = ParkingSerializer(parking, data=item, partial=True)
+        if not serializer.is_valid():
+            results[index] = _result(index, 400, errors=serializer.errors)
+            continue
+        for name, value in serializer.validated_data.items():
+            setattr(parking, name, value)
+        fields.update(serializer.validated_data)
+        changed[index] = parking
+    with transaction.atomic():
+        if fields:
+            Parking.objects.bulk_update(set(changed.values()), sorted(fields))
+        _send_saved(Parking, changed.values(), created=False)
+    for index, parking in changed.items():
+        results[index] = _result(index, 200, data=ParkingSerializer(parking).data)
+    return results
+
+
+def delete_parkings(items):
+    ids = _ids(items, 'parking_id')
+    existing = set(Parking.objects.filter(parking_id__in=set(ids.values())).values_list('parking_id', flat=True))
+    with transaction.atomic(), signals.batch():
+        # QuerySet.delete() sends post_delete for every row, cascading to bookings
+        Parking.objects.filter(parking_id__in=existing).delete()
+    return [
+        _result(index, 200) if ids.get(index) in existing
+        else _result(index, 404, errors=NO_PARKING)
+        for index in range(len(items))
+    ]
+
+
+# Bookings
+
+def _booking_data(booking):
+    return BookingWriteSerializer({
+        'booking_id': booking.booking_id,
+        'parking_id': booking.parking_id_id,
+        'start_time': booking.start_time,
+        'end_time': booking.end_time,
+    }).data
+
+
+def _occupancy(parkings, windows):
+    """
+    Occupancy indexes of ``parkings`` covering all ``windows``, loaded with
+    one query, and ``{booking_id: parking_id}`` of the bookings in them.
+    """
+    indexes = {parking_id: ParkingOccupancy() for parking_id in parkings}
+    owners = {}
+    if not windows or not parkings:
+        return indexes, owners
+    rows = Booking.objects.filter(
+        parking_id__in=list(parkings),
+        start_time__lt=max(end for _, end in windows),
+        end_time__gt=min(start for start, _ in windows),
+    ).values_list('parking_id', 'booking_id', 'start_time', 'end_time')
+    for parking_id, booking_id, start_time, end_time in rows:
+        indexes[parking_id].add(booking_id, start_time, end_time)
+        owners[booking_id] = parking_id
+    return indexes, owners
+
+
+@contextmanager
+def _reserve(candidates, results):
+    """
+    Lock the parkings of ``candidates`` (``(index, key, data)`` tuples) and
+    yield the ones that still fit, checking each against the database and
+    the items accepted before it. A key that is a stored booking's id moves
+    that booking: its stored interval is only released once its move is
+    accepted. Write them within the block.
+    """
+    with reservations.reservation_batch(data['parking_id'] for _, _, data in candidates) as parkings:
+        windows = [(data['start_time'], data['end_time']) for _, _, data in candidates]
+        indexes, owners = _occupancy(parkings, windows)
+        accepted = []
+        for index, key, data in candidates:
+            parking = parkings.get(data['parking_id'])
+            if parking is None:
+                results[index] = _result(index, 400, errors=NO_PARKING)
+                continue
+            stored = owners.get(key)
+            released = indexes[stored].remove(key) if stored is not None else None
+            occupancy = indexes[parking.parking_id]
+            if occupancy.peak_occupancy(data['start_time'], data['end_time']) >= parking.amount_of_spots:
+                results[index] = _result(index, 400, errors=NO_FREE_SPOTS)
+                if released is not None:
+                    indexes[stored].add(key, *released)
+                continue
+            occupancy.add(key, data['start_time'], data['end_time'])
+            owners[key] = parking.parking_id
+            accepted.append((index, parking, data))
+        yield accepted
+
+
+def create_bookings(items, user):
+    results = [None] * len(items)
+    candidates = []
+    for index, item in enumerate(items):
+        serializer = BookingWriteSerializer(data=item)
+        if serializer.is_valid():
+            candidates.append((index, ('new', index), serializer.validated_data))
+        else:
+            results[index] = _result(index, 400, errors=serializer.errors)
+    if not candidates:
+        return results
+    with _reserve(candidates, results) as accepted:
+        created = Booking.objects.bulk_create([
+            Booking(
+                parking_id=parking, user_id=user, start_time=data['start_time'], end_time=data['end_time'],
+                price=parking.price,
+            )
+            for _, parking, data in accepted
+        ])
+        _send_saved(Booking, created, created=True)
+        for (index, _, _), booking in zip(accepted, created):
+            results[index] = _result(index, 201, data=_booking_data(booking))
+    return results
+
+
+def update_bookings(items, user):
+    results = [None] * len(items)
+    ids = _ids(items, 'booking_id')
+    existing = Booking.objects.in_bulk(set(ids.values()))
+    seen = set()
+    candidates = []
+    for index, item in enumerate(items):
+        booking = existing.get(ids.get(index))
+        if booking is None:
+            results[index] = _result(index, 404, errors={'booking_id': ['Booking does not exist']})
+            continue
+        if booking.booking_id in seen:
+            results[index] = _result(index, 400, errors={'booking_id': ['Duplicate booking in request']})
+            continue
+        seen.add(booking.booking_id)
+        if not user.is_admin and booking.user_id_id != user.id:
+            results[index] = _result(index, 403, errors={'booking_id': ['You do not have permission to update this booking']})
+            continue
+        serializer = BookingWriteSerializer(data=item, partial=True)
+        if not serializer.is_valid():
+            results[index] = _result(index, 400, errors=serializer.errors)
+            continue
+        data = {
+            'parking_id': serializer.validated_data.get('parking_id', booking.parking_id_id),
+            'start_time': serializer.validated_data.get('start_time', booking.start_time),
+            'end_time': serializer.validated_data.get('end_time', booking.end_time),
+        }
+        if data['start_time'] >= data['end_time']:
+            results[index] = _result(index, 400, errors={'end_time': ['End time must be after start time']})
+            continue
+        candidates.append((index, booking.booking_id, data))
+    if not candidates:
+        return results
+    with _reserve(candidates, results) as accepted:
+        updated = []
+        for index, parking, data in accepted:
+            booking = existing[ids[index]]
+            # Like Booking.save(): a booking moved to another parking takes its price
+            if booking.price is None or booking.parking_id_id != parking.parking_id:
+                booking.price = parking.price
+            booking.parking_id = parking
+            booking.start_time = data['start_time']
+            booking.end_time = data['end_time']
+            updated.append(booking)
+            results[index] = _result(index, 200, data=_booking_data(booking))
+        Booking.objects.bulk_update(updated, ['parking_id', 'start_time', 'end_time', 'price'])
+        _send_saved(Booking, updated, created=False)
+    return results
+
+
+def delete_bookings(items, user):
+    ids = _ids(items, 'booking_id')
+    owners = dict(Booking.objects.filter(booking_id__in=set(ids.values())).values_list('booking_id', 'user_id'))
+    results = []
+    deletable = set()
+    for index in range(len(items)):
+        booking_id = ids.get(index)
+        if booking_id not in owners:
+            results.append(_result(index, 404, errors={'booking_id': ['Booking does not exist']}))
+        elif not user.is_admin and owners[booking_id] != user.id:
+            results.append(_result(index, 403, errors={'booking_id': ['You do not have permission to delete this booking']}))
+        else:
+            deletable.add(booking_id)
+            results.append(_result(index, 200))
+    with transaction.atomic(), signals.batch():
+        Booking.objects.filter(booking_id__in=deletable).delete()
+    return results
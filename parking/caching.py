@@ -0,0 +1,208 @@
+"""
+Read-through cache for the parking catalog endpoints.
+
+Rendered JSON bodies are cached together with their ETag, so a hit costs
+one cache lookup and no database query or serialization, and clients
+sending ``If-None-Match`` get a bodyless 304.
+
+Keys embed a version token: one per parking for the detail endpoint and
+one catalog-wide for the list. Invalidating replaces the token instead of
+deleting keys, so a response rendered from a row read just before a
+concurrent update can never be stored under the current version. Tokens
+are random rather than counters: a version evicted from the cache gets a
+new token, never one whose entries may still be cached.
+
+The same cache keeps the per-process indexes of all workers in step
+with the database: the catalog version, replaced by every parking write,
+tells the spatial grid when to rebuild, and a counter per parking,
+bumped by every booking write, does the same for the availability
+indexes.
+"""
+import hashlib
+import random
+from uuid import uuid4
+
+from django.conf import settings
+from django.core.cache import caches
+from django.core.cache.backends.locmem import LocMemCache
+from django.http import HttpResponse, HttpResponseNotModified
+
+from . import renderers
+
+CACHE_ALIAS = getattr(settings, 'PARKMATE_CATALOG_CACHE', 'default')
+CACHE_TIMEOUT = getattr(settings, 'PARKMATE_CATALOG_CACHE_TIMEOUT', 300)
+
+_LIST_VERSION_KEY = 'parkmate:parking:list:version'
+
+
+def _cache():
+    return caches[CACHE_ALIAS]
+
+
+def _version(key):
+    cache = _cache()
+    version = cache.get(key)
+    if version is None:
+        # Concurrent misses agree on the first token added
+        token = uuid4().hex
+        version = token if cache.add(key, token, None) else cache.get(key, token)
+    return version
+
+
+async def _aget(key, default=None):
+    cache = _cache()
+    # The in-process cache never blocks; its async API would only add a
+    # hop to the shared sync thread
+    if isinstance(cache, LocMemCache):
+        return cache.get(key, default)
+    return await cache.aget(key, default)
+
+
+async def _aset(key, value, timeout):
+    cache = _cache()
+    if isinstance(cache, LocMemCache):
+        cache.set(key, value, timeout)
+    else:
+        await cache.aset(key, value, timeout)
+
+
+async def _aadd(key, value, timeout):
+    cache = _cache()
+    if isinstance(cache, LocMemCache):
+        return cache.add(key, value, timeout)
+    return await cache.aadd(key, value, timeout)
+
+
+async def _aversion(key):
+    version = await _aget(key)
+    if version is None:
+        token = uuid4().hex
+        version = token if await _aadd(key, token, None) else await _aget(key, token)
+    return version
+
+
+def _bump(key):
+    _cache().set(key, uuid4().hex, None)
+
+
+def _parking_version_key(parking_id):
+    return f'parkmate:parking:{parking_id}:version'
+
+
+def parking_detail_key(parking_id):
+    return f'parkmate:parking:{parking_id}:v{_version(_parking_version_key(parking_id))}'
+
+
+async def aparking_detail_key(parking_id):
+    return f'parkmate:parking:{parking_id}:v{await _aversion(_parking_version_key(parking_id))}'
+
+
+def _query_digest(request):
+    query = request.GET.urlencode()
+    return hashlib.md5(query.encode(), usedforsecurity=False).hexdigest() if query else 'all'
+
+
+def parking_list_key(request):
+    """Key of a list response; each distinct query string is cached apart."""
+    return f'parkmate:parking:list:v{_version(_LIST_VERSION_KEY)}:{_query_digest(request)}'
+
+
+async def aparking_list_key(request):
+    return f'parkmate:parking:list:v{await _aversion(_LIST_VERSION_KEY)}:{_query_digest(request)}'
+
+
+def invalidate_parking(parking_id):
+    """Drop cached responses that include ``parking_id``."""
+    _bump(_parking_version_key(parking_id))
+    _bump(_LIST_VERSION_KEY)
+
+
+def catalog_version():
+    """Token replaced by every committed parking write, in any worker."""
+    return _version(_LIST_VERSION_KEY)
+
+
+# Occupancy versions are counters rather than tokens: the worker that
+# bumps one can tell whether another write came in between
+
+def _availability_version_key(parking_id):
+    return f'parkmate:availability:{parking_id}:version'
+
+
+def _counter_start():
+    # A counter evicted from the cache restarts far from the values it had
+    return random.getrandbits(62)
+
+
+def availability_versions(parking_ids):
+    """``{parking_id: version}`` of the bookings of ``parking_ids``, in one cache round trip."""
+    cache = _cache()
+    keys = {_availability_version_key(parking_id): parking_id for parking_id in parking_ids}
+    found = cache.get_many(list(keys))
+    versions = {}
+    for key, parking_id in keys.items():
+        version = found.get(key)
+        if version is None:
+            start = _counter_start()
+            version = start if cache.add(key, start, None) else cache.get(key, start)
+        versions[parking_id] = version
+    return versions
+
+
+async def aavailability_version(parking_id):
+    key = _availability_version_key(parking_id)
+    version = await _aget(key)
+    if version is None:
+        start = _counter_start()
+        version = start if await _aadd(key, start, None) else await _aget(key, start)
+    return version
+
+
+def bump_availability(parking_id):
+    """Count a committed booking write of ``parking_id``; returns the new version."""
+    cache = _cache()
+    key = _availability_version_key(parking_id)
+    try:
+        return cache.incr(key)
+    except ValueError:
+        # Missing: no index can be in step with a new counter
+        version = _counter_start()
+        return version if cache.add(key, version, None) else cache.incr(key)
+
+
+def cached_response(request, key, build):
+    """
+    Serve the JSON rendering of ``build()`` from the cache under ``key``.
+    Exceptions raised by ``build`` (e.g. Http404) propagate uncached.
+    """
+    cache = _cache()
+    entry = cache.get(key)
+    if entry is None:
+        entry = _entry(build())
+        cache.set(key, entry, CACHE_TIMEOUT)
+    return _respond(request, entry)
+
+
+async def acached_response(request, key, build):
+    """``cached_response`` for async views; ``build`` is a coroutine function."""
+    entry = await _aget(key)
+    if entry is None:
+        entry = _entry(await build())
+        await _aset(key, entry, CACHE_TIMEOUT)
+    return _respond(request, entry)
+
+
+def _entry(data):
+    body = renderers.dumps(data)
+    return '"%s"' % hashlib.md5(body, usedforsecurity=False).hexdigest(), body
+
+
+def _respond(request, entry):
+    etag, body = entry
+    if_none_match = request.headers.get('If-None-Match', '')
+    if if_none_match.strip() == '*' or etag in (tag.strip() for tag in if_none_match.split(',')):
+        response = HttpResponseNotModified()
+    else:
+        response = HttpResponse(body, content_type='application/json')
+    response['ETag'] = etag
+    return response
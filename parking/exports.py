@@ -0,0 +1,73 @@
+"""
+Streaming booking exports shared by the export endpoint and the
+``export_bookings`` management command.
+
+Rows are read from the database in chunks and encoded one line at a time,
+so memory stays bounded regardless of how many bookings are exported.
+``aexport_bookings`` streams the same lines to async views: an ASGI
+response would read a sync iterator into a list before sending anything.
+"""
+import csv
+from itertools import islice
+
+from asgiref.sync import sync_to_async
+
+from .renderers import dumps
+from .serializers import iter_booking_rows
+
+EXPORT_FORMATS = {
+    'ndjson': 'application/x-ndjson',
+    'csv': 'text/csv',
+}
+DEFAULT_CHUNK_SIZE = 2000
+
+CSV_COLUMNS = (
+    'booking_id', 'start_time', 'end_time',
+    'parking_id', 'parking_address', 'parking_price',
+    'user_id', 'user_email', 'user_first_name', 'user_last_name',
+)
+
+
+class _LineBuffer:
+    """File-like object handing back what ``csv.writer`` writes to it."""
+
+    def write(self, value):
+        return value
+
+
+def export_bookings(bookings, export_format='ndjson', chunk_size=DEFAULT_CHUNK_SIZE):
+    """Yield ``bookings`` encoded as NDJSON or CSV lines."""
+    rows = iter_booking_rows(bookings.order_by('booking_id'), chunk_size=chunk_size)
+    if export_format == 'ndjson':
+        for row in rows:
+            yield dumps(row).decode() + '\n'
+    elif export_format == 'csv':
+        writer = csv.writer(_LineBuffer())
+        yield writer.writerow(CSV_COLUMNS)
+        for row in rows:
+            parking, user = row['parking'], row['user']
+            yield writer.writerow((
+                row['booking_id'], row['start_time'], row['end_time'],
+                parking['parking_id'], parking['address'], parking['price'],
+                user['id'], user['email'], user['first_name'], user['last_name'],
+            ))
+    else:
+        raise ValueError(f'Unsupported export format: {export_format}')
+
+
+async def aexport_bookings(bookings, export_format='ndjson', chunk_size=DEFAULT_CHUNK_SIZE):
+    """
+    ``export_bookings`` as an async iterator; each chunk of lines is
+    produced on the request's sync thread and sent as one part.
+    """
+    lines = export_bookings(bookings, export_format, chunk_size)
+    # One thread for the whole export: the database cursor stays on its connection
+    take = sync_to_async(lambda: ''.join(islice(lines, chunk_size)), thread_sensitive=True)
+    try:
+        while True:
+            chunk = await take()
+            if not chunk:
+                return
+            yield chunk
+    finally:
+        await sync_to_async(lines.close, thread_sensitive=True)()
@@ -0,0 +1,158 @@
+"""
+Password hashing off the request thread.
+
+Hashing a password costs tens of milliseconds of pure CPU and holds the
+GIL throughout, so a login stalls every other request of the worker.
+With ``PARKMATE_HASHER_WORKERS`` > 0 ``make_password()`` and
+``check_password()`` run in a pool of that many processes (spawned, each
+with its own interpreter and Django setup) and the request thread only
+waits; with 0 they run inline.
+
+``User.set_password()`` and ``User.check_password()`` go through here, so
+registration and Django's ``ModelBackend`` (login) use the pool, and a
+password stored with another hasher or an outdated cost is rehashed with
+the preferred one on the next successful login.
+
+The ``Tuned*`` hashers read their cost from settings (see
+``PARKMATE_PASSWORD_HASHER`` and the cost settings in
+``config/settings.py``); raising a cost upgrades hashes the same way.
+"""
+import functools
+import multiprocessing
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+from django.conf import settings
+from django.contrib.auth import hashers
+from django.utils.module_loading import import_string
+
+
+class TunedPBKDF2PasswordHasher(hashers.PBKDF2PasswordHasher):
+    @property
+    def iterations(self):
+        return getattr(settings, 'PARKMATE_PBKDF2_ITERATIONS', None) or hashers.PBKDF2PasswordHasher.iterations
+
+
+class TunedScryptPasswordHasher(hashers.ScryptPasswordHasher):
+    @property
+    def work_factor(self):
+        return getattr(settings, 'PARKMATE_SCRYPT_WORK_FACTOR', None) or hashers.ScryptPasswordHasher.work_factor
+
+    @property
+    def maxmem(self):
+        # scrypt needs 128 * n * r bytes; the OpenSSL default cap is 32 MiB
+        return 2 * 128 * self.work_factor * self.block_size
+
+
+class TunedArgon2PasswordHasher(hashers.Argon2PasswordHasher):
+    @property
+    def time_cost(self):
+        return getattr(settings, 'PARKMATE_ARGON2_TIME_COST', None) or hashers.Argon2PasswordHasher.time_cost
+
+    @property
+    def memory_cost(self):
+        return getattr(settings, 'PARKMATE_ARGON2_MEMORY_COST', None) or hashers.Argon2PasswordHasher.memory_cost
+
+    @property
+    def parallelism(self):
+        return getattr(settings, 'PARKMATE_ARGON2_PARALLELISM', None) or hashers.Argon2PasswordHasher.parallelism
+
+
+# Run in the worker processes (or inline). The hashers are passed by path
+# so the pool always uses the caller's current PASSWORD_HASHERS.
+
+@functools.lru_cache(maxsize=8)
+def _load(paths):
+    return [import_string(path)() for path in paths]
+
+
+def _encode(password, paths):
+    hasher = _load(paths)[0]
+    return hasher.encode(password, hasher.salt())
+
+
+def _verify(password, encoded, paths):
+    """``(valid, rehashed)``; ``rehashed`` is the new hash when it must be upgraded."""
+    loaded = _load(paths)
+    algorithm = encoded.split('$', 1)[0]
+    hasher = next((hasher for hasher in loaded if hasher.algorithm == algorithm), None)
+    if hasher is None:
+        return False, None
+    valid = hasher.verify(password, encoded)
+    changed = hasher.algorithm != loaded[0].algorithm
+    must_update = changed or hasher.must_update(encoded)
+    if not valid:
+        if must_update and not changed:
+            # Same work as a current hash, so timing does not leak the cost
+            hasher.harden_runtime(password, encoded)
+        return False, None
+    return True, _encode(password, paths) if must_update else None
+
+
+def _init_worker(settings_module):
+    if settings_module:
+        os.environ['DJANGO_SETTINGS_MODULE'] = settings_module
+    import django
+    django.setup()
+
+
+_lock = threading.Lock()
+_pool = None
+_pool_pid = None
+
+
+def _executor():
+    global _pool, _pool_pid
+    workers = getattr(settings, 'PARKMATE_HASHER_WORKERS', 0)
+    if not workers:
+        return None
+    with _lock:
+        # A forked server worker must not share its parent's pool
+        if _pool is None or _pool_pid != os.getpid():
+            _pool = ProcessPoolExecutor(
+                max_workers=workers,
+                mp_context=multiprocessing.get_context('spawn'),
+                initializer=_init_worker,
+                initargs=(os.environ.get('DJANGO_SETTINGS_MODULE'),),
+            )
+            _pool_pid = os.getpid()
+        return _pool
+
+
+def _run(function, *args):
+    pool = _executor()
+    if pool is not None:
+        try:
+            return pool.submit(function, *args).result()
+        except BrokenProcessPool:
+            # A worker died; hash inline and start a fresh pool next time
+            shutdown(wait=False)
+    return function(*args)
+
+
+def make_password(password):
+    """Hash ``password`` with the preferred hasher (``None``: unusable password)."""
+    if password is None:
+        return hashers.make_password(None)
+    return _run(_encode, password, tuple(settings.PASSWORD_HASHERS))
+
+
+def check_password(password, encoded):
+    """
+    Return ``(valid, rehashed)``: whether ``password`` matches ``encoded``
+    and, when the hash is outdated, the password hashed anew.
+    """
+    if password is None or not encoded or not hashers.is_password_usable(encoded):
+        return False, None
+    return _run(_verify, password, encoded, tuple(settings.PASSWORD_HASHERS))
+
+
+def shutdown(wait=True):
+    """Stop the worker pool; it is started again on demand."""
+    global _pool
+    with _lock:
+        pool, _pool = _pool, None
+    if pool is not None:
+        pool.shutdown(wait=wait)
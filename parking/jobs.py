@@ -0,0 +1,180 @@
+"""
+Database-backed queue for the side effects of writes.
+
+A handler is registered under a name with ``@register(name)``;
+``enqueue(name, payload)`` inserts a ``Job`` row in the caller's
+transaction, so the job exists exactly when the write that caused it is
+committed, and the write itself only pays for that insert. The commit
+wakes a worker running in the same process at once; other workers poll.
+
+Workers (``manage.py run_jobs``, or ``work()`` in a thread) claim due
+jobs with ``select_for_update(skip_locked=True)`` where the database
+supports it, run them in a thread pool and delete them in the handler's
+own transaction, so a job's effects are committed once. A failing job is
+retried after an exponential backoff up to its ``max_attempts`` and then
+kept as failed, with its last error, for inspection. A job whose worker
+died is claimed again once its lease (``PARKMATE_JOB_LEASE_SECONDS``)
+has expired.
+
+With ``PARKMATE_JOBS_EAGER`` jobs run inline when enqueued, inside the
+caller's transaction (tests and single-process setups).
+"""
+import logging
+import random
+import threading
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import close_old_connections, router, transaction
+from django.db.models import F, Q
+from django.utils import timezone
+
+from .models import Job
+from .routers import PRIMARY
+
+DEFAULT_MAX_ATTEMPTS = 5
+RETRY_DELAY = 2  # seconds before the first retry, doubled on every attempt
+MAX_RETRY_DELAY = 3600
+
+logger = logging.getLogger('parking.jobs')
+
+_registry = {}
+_wake = threading.Event()
+
+
+class _Handler:
+    __slots__ = ('function', 'max_attempts')
+
+    def __init__(self, function, max_attempts):
+        self.function = function
+        self.max_attempts = max_attempts
+
+
+class _LeaseLost(Exception):
+    """The job was claimed again by another worker while it ran."""
+
+
+def register(name, max_attempts=DEFAULT_MAX_ATTEMPTS):
+    """Register the decorated function as the handler of the ``name`` jobs."""
+    def decorator(function):
+        _registry[name] = _Handler(function, max_attempts)
+        return function
+    return decorator
+
+
+def _eager():
+    return getattr(settings, 'PARKMATE_JOBS_EAGER', False)
+
+
+def enqueue(name, payload=None, using=None):
+    """
+    Queue a ``name`` job with the JSON-serializable ``payload`` (passed to
+    the handler as keyword arguments). Returns the job, or None when it
+    ran eagerly.
+    """
+    handler = _registry.get(name)
+    if handler is None:
+        raise LookupError(f'No job handler registered as {name!r}')
+    payload = payload or {}
+    if _eager():
+        handler.function(**payload)
+        return None
+    using = using or router.db_for_write(Job)
+    job = Job.objects.using(using).create(name=name, payload=payload, max_attempts=handler.max_attempts)
+    transaction.on_commit(_wake.set, using=using)
+    return job
+
+
+def claim(limit, using=PRIMARY):
+    """Mark up to ``limit`` due jobs as running and return them."""
+    now = timezone.now()
+    lease = timedelta(seconds=getattr(settings, 'PARKMATE_JOB_LEASE_SECONDS', 300))
+    due = Q(status='pending', run_after__lte=now) | Q(status='running', locked_at__lt=now - lease)
+    with transaction.atomic(using=using):
+        ids = list(
+            Job.objects.using(using).select_for_update(skip_locked=True)
+            .filter(due).order_by('run_after', 'id').values_list('id', flat=True)[:limit]
+        )
+        if not ids:
+            return []
+        # The due condition again: a compare-and-set where rows are not locked
+        Job.objects.using(using).filter(due, id__in=ids).update(
+            status='running', locked_at=now, attempts=F('attempts') + 1,
+        )
+        return list(Job.objects.using(using).filter(id__in=ids, status='running', locked_at=now))
+
+
+def _backoff(attempts):
+    delay = min(RETRY_DELAY * 2 ** (attempts - 1), MAX_RETRY_DELAY)
+    # Jitter keeps the retries of jobs failing together apart
+    return timedelta(seconds=delay * random.uniform(0.5, 1.0))
+
+
+def run(job, using=PRIMARY):
+    """Run a claimed job; returns whether it succeeded."""
+    handler = _registry.get(job.name)
+    try:
+        with transaction.atomic(using=using):
+            if handler is None:
+                raise LookupError(f'No job handler registered as {job.name!r}')
+            handler.function(**job.payload)
+            if not Job.objects.using(using).filter(pk=job.pk, locked_at=job.locked_at).delete()[0]:
+                raise _LeaseLost(job.pk)
+    except _LeaseLost:
+        logger.warning('Job %s (%s) was claimed again while running; discarded its result', job.pk, job.name)
+        return False
+    except Exception as exc:
+        failed = job.attempts >= job.max_attempts
+        changes = {'status': 'failed' if failed else 'pending', 'last_error': f'{type(exc).__name__}: {exc}'}
+        if not failed:
+            changes['run_after'] = timezone.now() + _backoff(job.attempts)
+        Job.objects.using(using).filter(pk=job.pk, locked_at=job.locked_at).update(**changes)
+        logger.warning(
+            'Job %s (%s) failed on attempt %s/%s%s', job.pk, job.name, job.attempts, job.max_attempts,
+            '' if not failed else '; giving up', exc_info=True,
+        )
+        return False
+    return True
+
+
+def run_pending(limit=100, using=PRIMARY):
+    """Run due jobs in the calling thread until none is left; returns how many succeeded."""
+    succeeded = 0
+    while True:
+        claimed = claim(limit, using)
+        if not claimed:
+            return succeeded
+        succeeded += sum(run(job, using) for job in claimed)
+
+
+def _run_in_thread(job, using):
+    try:
+        return run(job, using)
+    finally:
+        # Pool threads keep their connections between jobs
+        close_old_connections()
+
+
+def work(threads=4, poll=1.0, stop=None, once=False, using=PRIMARY):
+    """
+    Run jobs with ``threads`` threads until ``stop`` (an Event) is set, or
+    until no job is due when ``once``. Sleeps up to ``poll`` seconds when
+    idle, less when a job is enqueued in this process.
+    """
+    stop = stop or threading.Event()
+    running = set()
+    with ThreadPoolExecutor(max_workers=threads, thread_name_prefix='parkmate-job') as pool:
+        while not stop.is_set():
+            free = threads - len(running)
+            claimed = claim(free, using) if free else []
+            running.update(pool.submit(_run_in_thread, job, using) for job in claimed)
+            if claimed and len(running) < threads:
+                continue
+            if running:
+                running = wait(running, timeout=poll, return_when=FIRST_COMPLETED).not_done
+                continue
+            if once:
+                return
+            _wake.wait(poll)
+            _wake.clear()
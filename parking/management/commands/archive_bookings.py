@@ -0,0 +1,33 @@
+from time import perf_counter, sleep
+
+from django.core.management.base import BaseCommand
+
+from parking import archive
+
+
+class Command(BaseCommand):
+    help = (
+        "Move bookings that ended before the retention window to the archive "
+        "table, in batches of bounded size (run it on a schedule)."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--days', type=int, help='Retention in days (default: PARKMATE_BOOKING_RETENTION_DAYS)')
+        parser.add_argument('--batch-size', type=int, help='Bookings per transaction (default: PARKMATE_ARCHIVE_BATCH_SIZE)')
+        parser.add_argument('--pause', type=float, default=0.0, help='Seconds to sleep between batches')
+
+    def handle(self, *args, **options):
+        began = perf_counter()
+        before = archive.cutoff(options['days'])
+        moved = batches = 0
+        for count in archive.archive_bookings(before, options['batch_size']):
+            moved += count
+            batches += 1
+            if options['verbosity'] > 1:
+                self.stdout.write(f'Batch {batches}: {count} bookings')
+            if options['pause']:
+                sleep(options['pause'])
+        self.stdout.write(
+            f'Archived {moved} bookings ending before {before.isoformat()} '
+            f'in {batches} batches ({perf_counter() - began:.2f}s)'
+        )
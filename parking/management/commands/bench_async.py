@@ -0,0 +1,139 @@
+import asyncio
+import json
+import random
+import threading
+from datetime import timedelta
+from time import perf_counter
+
+from django.core.cache import cache
+from django.core.management.base import BaseCommand
+from django.test import AsyncClient, Client, override_settings
+from django.utils import timezone
+
+from parking.benchmarking import benchmark_database, percentile, seed
+from parking.models import Booking
+
+ENDPOINTS = ('parking_list', 'get_parking', 'parking_availability', 'get_booking')
+
+
+def _paths(endpoint, parking_ids, booking_ids, count, seed_value=0):
+    """``count`` request paths for ``endpoint``, the same for both runs."""
+    rng = random.Random(seed_value)
+    moment = timezone.now().replace(microsecond=0) + timedelta(days=1)
+    paths = []
+    for _ in range(count):
+        if endpoint == 'parking_list':
+            paths.append('/api/parkmate/parking/?limit=50')
+        elif endpoint == 'get_parking':
+            paths.append(f'/api/parkmate/parking/{rng.choice(parking_ids)}/')
+        elif endpoint == 'parking_availability':
+            start = moment + timedelta(hours=rng.randint(0, 24 * 30))
+            paths.append(
+                f'/api/parkmate/parking/{rng.choice(parking_ids)}/availability/'
+                f'?from={start:%Y-%m-%dT%H:%M:%SZ}&to={start + timedelta(hours=2):%Y-%m-%dT%H:%M:%SZ}'
+            )
+        else:
+            paths.append(f'/api/parkmate/bookings/{rng.choice(booking_ids)}/')
+    return paths
+
+
+def _summary(latencies, elapsed, errors):
+    return {
+        'requests': len(latencies),
+        'errors': errors,
+        'throughput': len(latencies) / elapsed if elapsed else 0.0,
+        'p50_ms': percentile(latencies, 0.50) * 1000,
+        'p95_ms': percentile(latencies, 0.95) * 1000,
+        'p99_ms': percentile(latencies, 0.99) * 1000,
+    }
+
+
+def run_wsgi(paths, connections, headers):
+    """Sync views on ``connections`` threads, like a threaded WSGI server."""
+    queue = list(paths)
+    latencies, errors = [], []
+    lock = threading.Lock()
+
+    def worker():
+        client = Client(headers=headers)
+        while True:
+            with lock:
+                if not queue:
+                    return
+                path = queue.pop()
+            began = perf_counter()
+            response = client.get(path)
+            elapsed = perf_counter() - began
+            with lock:
+                latencies.append(elapsed)
+                if response.status_code != 200:
+                    errors.append(path)
+
+    workers = [threading.Thread(target=worker) for _ in range(connections)]
+    began = perf_counter()
+    for thread in workers:
+        thread.start()
+    for thread in workers:
+        thread.join()
+    return _summary(latencies, perf_counter() - began, len(errors))
+
+
+async def run_asgi(paths, connections, headers):
+    """Async views with ``connections`` concurrent tasks on one event loop."""
+    queue = list(paths)
+    latencies, errors = [], []
+
+    async def worker():
+        client = AsyncClient(headers=headers)
+        while queue:
+            path = queue.pop()
+            began = perf_counter()
+            response = await client.get(path)
+            latencies.append(perf_counter() - began)
+            if response.status_code != 200:
+                errors.append(path)
+
+    began = perf_counter()
+    await asyncio.gather(*(worker() for _ in range(connections)))
+    return _summary(latencies, perf_counter() - began, len(errors))
+
+
+class Command(BaseCommand):
+    help = (
+        "Compare concurrent-connection throughput of the read endpoints on "
+        "the sync (WSGI, threads) and native async (ASGI, event loop) paths."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--parkings', type=int, default=500)
+        parser.add_argument('--bookings', type=int, default=20000)
+        parser.add_argument('--connections', type=int, default=32, help='Concurrent clients')
+        parser.add_argument('--requests', type=int, default=2000, help='Requests per endpoint and path')
+        parser.add_argument('--json', action='store_true', help='Print the results as JSON')
+
+    def handle(self, *args, **options):
+        results = {'connections': options['connections'], 'endpoints': {}}
+        with benchmark_database():
+            parking_ids, user_ids = seed(parkings=options['parkings'], users=100, bookings=options['bookings'])
+            booking_ids = list(Booking.objects.filter(user_id=user_ids[0]).values_list('booking_id', flat=True))
+            headers = {'X-User-Id': str(user_ids[0])}
+            for endpoint in ENDPOINTS:
+                paths = _paths(endpoint, parking_ids, booking_ids, options['requests'])
+                cache.clear()
+                with override_settings(ROOT_URLCONF='config.urls'):
+                    wsgi = run_wsgi(paths, options['connections'], headers)
+                cache.clear()
+                with override_settings(ROOT_URLCONF='config.asgi_urls'):
+                    asgi = asyncio.run(run_asgi(paths, options['connections'], headers))
+                results['endpoints'][endpoint] = {'wsgi': wsgi, 'asgi': asgi}
+
+        if options['json']:
+            self.stdout.write(json.dumps(results, indent=2))
+            return
+        self.stdout.write(f"{options['connections']} concurrent connections")
+        for endpoint, runs in results['endpoints'].items():
+            for name, run in runs.items():
+                self.stdout.write(
+                    f"{endpoint:<22} {name}: {run['throughput']:8.1f} req/s  p50={run['p50_ms']:.2f}ms "
+                    f"p95={run['p95_ms']:.2f}ms p99={run['p99_ms']:.2f}ms errors={run['errors']}"
+                )
@@ -0,0 +1,169 @@
+import json
+import threading
+from datetime import timedelta
+from time import perf_counter
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test import Client
+from django.utils import timezone
+
+from parking import reservations
+from parking.benchmarking import benchmark_database, percentile, seed
+from parking.models import Booking
+
+# SQLite connection setups that --modes can compare:
+# (init_command, CONN_MAX_AGE)
+SQLITE_MODES = {
+    'default': ('', 0),
+    'tuned': (settings.PARKMATE_SQLITE_PRAGMAS, 0),
+    'tuned-persistent': (settings.PARKMATE_SQLITE_PRAGMAS, None),
+}
+
+
+def database_mode():
+    """Short description of how the default database is configured."""
+    settings_dict = connection.settings_dict
+    options = settings_dict.get('OPTIONS', {})
+    if connection.vendor == 'sqlite':
+        mode = 'tuned' if options.get('init_command') else 'default'
+    elif 'pool' in options:
+        mode = 'pool'
+    else:
+        mode = 'default'
+    max_age = settings_dict.get('CONN_MAX_AGE')
+    return f"{mode}, CONN_MAX_AGE={'persistent' if max_age is None else max_age}"
+
+
+class Command(BaseCommand):
+    help = (
+        "Benchmark concurrent booking creation through POST /api/parkmate/bookings/ "
+        "and report throughput, contention and overbooking on a throwaway database."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--threads', type=int, default=8)
+        parser.add_argument('--requests', type=int, default=50, help='Bookings attempted per thread')
+        parser.add_argument('--parkings', type=int, default=1, help='Parkings the threads compete for')
+        parser.add_argument('--spots', type=int, default=20)
+        parser.add_argument(
+            '--modes', nargs='+', choices=sorted(SQLITE_MODES),
+            help='SQLite only: run once per connection setup instead of the configured one',
+        )
+        parser.add_argument('--json', action='store_true', help='Print the results as JSON')
+
+    def handle(self, *args, **options):
+        if options['modes'] and connection.vendor != 'sqlite':
+            raise CommandError('--modes only applies to SQLite')
+        runs = []
+        for mode in options['modes'] or [None]:
+            if mode is not None:
+                connection.close()
+                init_command, max_age = SQLITE_MODES[mode]
+                connection.settings_dict['OPTIONS']['init_command'] = init_command
+                connection.settings_dict['CONN_MAX_AGE'] = max_age
+            runs.append(self._benchmark(options))
+
+        if options['json']:
+            self.stdout.write(json.dumps(runs if options['modes'] else runs[0], indent=2))
+            return
+        for results in runs:
+            self._print(results)
+
+    def _benchmark(self, options):
+        with benchmark_database():
+            parking_ids, user_ids = seed(
+                parkings=options['parkings'], users=options['threads'], spots=options['spots']
+            )
+            reservations.reset_stats()
+            results = self._run(parking_ids, user_ids, options['threads'], options['requests'])
+            results['overbooked_parkings'] = self._overbooked(parking_ids, options['spots'])
+        results['backend'] = connection.vendor
+        results['mode'] = database_mode()
+        results['reservations'] = reservations.stats()
+        return results
+
+    def _print(self, results):
+        self.stdout.write(
+            f"{results['backend']} ({results['mode']}): {results['requests']} requests in {results['seconds']:.2f}s "
+            f"({results['throughput']:.1f} req/s), created={results['created']} "
+            f"rejected={results['rejected']} errors={results['errors']}"
+        )
+        self.stdout.write(
+            f"latency p50={results['p50_ms']:.1f}ms p95={results['p95_ms']:.1f}ms "
+            f"p99={results['p99_ms']:.1f}ms"
+        )
+        stats = results['reservations']
+        self.stdout.write(
+            f"lock contended={stats['contended']} wait={stats['wait_seconds']:.3f}s "
+            f"max_wait={stats['max_wait_seconds'] * 1000:.1f}ms hold={stats['hold_seconds']:.3f}s"
+        )
+        if results['overbooked_parkings']:
+            self.stderr.write(f"OVERBOOKED parkings: {results['overbooked_parkings']}")
+        else:
+            self.stdout.write(self.style.SUCCESS('No parking was overbooked'))
+
+    def _run(self, parking_ids, user_ids, threads, per_thread):
+        # Every thread books the same window so all requests conflict
+        start = timezone.now() + timedelta(days=1)
+        payload_times = {
+            'start_time': start.isoformat(),
+            'end_time': (start + timedelta(hours=2)).isoformat(),
+        }
+        latencies = []
+        outcomes = {201: 0, 400: 0}
+        errors = []
+        guard = threading.Lock()
+
+        def worker(n):
+            client = Client()
+            local = []
+            local_outcomes = {201: 0, 400: 0}
+            try:
+                for i in range(per_thread):
+                    payload = dict(payload_times, parking_id=parking_ids[(n + i) % len(parking_ids)])
+                    began = perf_counter()
+                    response = client.post(
+                        '/api/parkmate/bookings/', payload,
+                        content_type='application/json',
+                        HTTP_X_USER_ID=str(user_ids[n % len(user_ids)]),
+                    )
+                    local.append(perf_counter() - began)
+                    local_outcomes[response.status_code] = local_outcomes.get(response.status_code, 0) + 1
+            except Exception as exc:  # reported, not raised: keep the other threads going
+                errors.append(repr(exc))
+            finally:
+                connection.close()
+            with guard:
+                latencies.extend(local)
+                for code, count in local_outcomes.items():
+                    outcomes[code] = outcomes.get(code, 0) + count
+
+        workers = [threading.Thread(target=worker, args=(n,)) for n in range(threads)]
+        began = perf_counter()
+        for thread in workers:
+            thread.start()
+        for thread in workers:
+            thread.join()
+        elapsed = perf_counter() - began
+
+        return {
+            'requests': len(latencies),
+            'seconds': elapsed,
+            'throughput': len(latencies) / elapsed if elapsed else 0.0,
+            'created': outcomes.pop(201),
+            'rejected': outcomes.pop(400),
+            'errors': sum(outcomes.values()) + len(errors),
+            'p50_ms': percentile(latencies, 0.50) * 1000,
+            'p95_ms': percentile(latencies, 0.95) * 1000,
+            'p99_ms': percentile(latencies, 0.99) * 1000,
+        }
+
+    def _overbooked(self, parking_ids, spots):
+        overbooked = []
+        for parking_id in parking_ids:
+            window = Booking.objects.filter(parking_id=parking_id).order_by('start_time').first()
+            if window and reservations.peak_occupancy(parking_id, window.start_time, window.end_time) > spots:
+                overbooked.append(parking_id)
+        return overbooked
@@ -0,0 +1,131 @@
+import json
+import os
+import threading
+from time import perf_counter, sleep
+
+from django.conf import settings
+from django.contrib.auth import authenticate
+from django.core.management.base import BaseCommand, CommandError
+from django.test import override_settings
+
+from parking import hashing
+from parking.benchmarking import benchmark_database, percentile
+from parking.models import User
+
+HASHERS = {
+    'pbkdf2': 'parking.hashing.TunedPBKDF2PasswordHasher',
+    'scrypt': 'parking.hashing.TunedScryptPasswordHasher',
+    'argon2': 'parking.hashing.TunedArgon2PasswordHasher',
+}
+PASSWORD = 'benchmark-password'
+TICK = 0.005  # seconds the probe thread sleeps between wake-ups
+
+
+def _available(name):
+    if name != 'argon2':
+        return True
+    try:
+        import argon2  # noqa: F401
+    except ImportError:
+        return False
+    return True
+
+
+def run_logins(email, logins, threads):
+    """Log in ``logins`` times from ``threads`` threads while a probe thread
+    measures how late it gets scheduled (the stall other requests see)."""
+    remaining = [logins]
+    latencies, stalls, failures = [], [], []
+    lock = threading.Lock()
+    done = threading.Event()
+
+    def worker():
+        while True:
+            with lock:
+                if not remaining[0]:
+                    return
+                remaining[0] -= 1
+            began = perf_counter()
+            user = authenticate(username=email, password=PASSWORD)
+            elapsed = perf_counter() - began
+            with lock:
+                latencies.append(elapsed)
+                if user is None:
+                    failures.append(email)
+
+    def probe():
+        while not done.is_set():
+            began = perf_counter()
+            sleep(TICK)
+            stalls.append(max(perf_counter() - began - TICK, 0.0))
+
+    prober = threading.Thread(target=probe)
+    workers = [threading.Thread(target=worker) for _ in range(threads)]
+    prober.start()
+    began = perf_counter()
+    for thread in workers:
+        thread.start()
+    for thread in workers:
+        thread.join()
+    elapsed = perf_counter() - began
+    done.set()
+    prober.join()
+    if failures:
+        raise CommandError(f'{len(failures)} logins failed')
+    return {
+        'logins_per_second': len(latencies) / elapsed if elapsed else 0.0,
+        'p50_ms': percentile(latencies, 0.50) * 1000,
+        'p95_ms': percentile(latencies, 0.95) * 1000,
+        'stall_p99_ms': percentile(stalls, 0.99) * 1000,
+    }
+
+
+class Command(BaseCommand):
+    help = (
+        "Measure login throughput (logins/second, per core) for each password "
+        "hasher, hashing inline and in the parking.hashing worker pool."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--hashers', nargs='*', choices=sorted(HASHERS), default=['pbkdf2', 'scrypt', 'argon2'])
+        parser.add_argument(
+            '--workers', nargs='*', type=int, default=[0, os.cpu_count() or 1],
+            help='Pool sizes to compare (0: hash inline)',
+        )
+        parser.add_argument('--threads', type=int, default=8, help='Concurrent login threads')
+        parser.add_argument('--logins', type=int, default=64, help='Logins per configuration')
+        parser.add_argument('--json', action='store_true', help='Print the results as JSON')
+
+    def handle(self, *args, **options):
+        cores = os.cpu_count() or 1
+        results = {'cores': cores, 'threads': options['threads'], 'runs': []}
+        hashers = [name for name in options['hashers'] if _available(name)]
+        skipped = sorted(set(options['hashers']) - set(hashers))
+        with benchmark_database():
+            for name in hashers:
+                preferred = [HASHERS[name], *(path for path in settings.PASSWORD_HASHERS if path != HASHERS[name])]
+                for workers in options['workers']:
+                    email = f'{name}-{workers}@bench.local'
+                    with override_settings(PASSWORD_HASHERS=preferred, PARKMATE_HASHER_WORKERS=workers):
+                        User.objects.create_user(email=email, password=PASSWORD)
+                        # Start the pool before timing
+                        authenticate(username=email, password=PASSWORD)
+                        run = run_logins(email, options['logins'], options['threads'])
+                        hashing.shutdown()
+                    used = min(workers, cores) if workers else 1
+                    run.update(hasher=name, workers=workers, logins_per_core=run['logins_per_second'] / used)
+                    results['runs'].append(run)
+
+        if options['json']:
+            self.stdout.write(json.dumps(results, indent=2))
+            return
+        self.stdout.write(f"{cores} cores, {options['threads']} login threads")
+        if skipped:
+            self.stdout.write(f"skipped (not installed): {', '.join(skipped)}")
+        for run in results['runs']:
+            mode = f"{run['workers']} workers" if run['workers'] else 'inline'
+            self.stdout.write(
+                f"{run['hasher']:<7} {mode:<10} {run['logins_per_second']:7.1f} logins/s "
+                f"({run['logins_per_core']:6.1f}/core)  p50={run['p50_ms']:.1f}ms p95={run['p95_ms']:.1f}ms "
+                f"probe stall p99={run['stall_p99_ms']:.1f}ms"
+            )
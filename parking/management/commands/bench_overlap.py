@@ -0,0 +1,75 @@
+import json
+import random
+from datetime import timedelta
+from time import perf_counter
+
+from django.core.management.base import BaseCommand
+from django.db import connection
+
+from parking.benchmarking import benchmark_database, percentile, seed
+from parking.models import Booking
+from parking.reservations import peak_occupancy
+
+
+class Command(BaseCommand):
+    help = (
+        "Seed a throwaway database with bookings and measure the latency of the "
+        "overlap query behind booking commits, optionally without the booking indexes."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rows', type=int, default=1_000_000, help='Bookings to seed')
+        parser.add_argument('--parkings', type=int, default=1000)
+        parser.add_argument('--queries', type=int, default=1000)
+        parser.add_argument('--compare', action='store_true', help='Also measure with the indexes dropped')
+        parser.add_argument('--json', action='store_true', help='Print the results as JSON')
+
+    def handle(self, *args, **options):
+        results = {'backend': connection.vendor, 'rows': options['rows'], 'runs': {}}
+        with benchmark_database():
+            began = perf_counter()
+            parking_ids, _ = seed(parkings=options['parkings'], users=100, bookings=options['rows'])
+            results['seed_seconds'] = perf_counter() - began
+            if connection.vendor == 'sqlite':
+                with connection.cursor() as cursor:
+                    cursor.execute('ANALYZE')
+
+            results['runs']['indexed'] = self._measure(parking_ids, options['queries'])
+            if options['compare']:
+                with connection.schema_editor() as editor:
+                    for index in Booking._meta.indexes:
+                        editor.remove_index(Booking, index)
+                results['runs']['unindexed'] = self._measure(parking_ids, options['queries'])
+
+        if options['json']:
+            self.stdout.write(json.dumps(results, indent=2))
+            return
+        self.stdout.write(f"{results['backend']}: seeded {results['rows']} bookings in {results['seed_seconds']:.1f}s")
+        for name, run in results['runs'].items():
+            self.stdout.write(
+                f"{name}: p50={run['p50_ms']:.3f}ms p95={run['p95_ms']:.3f}ms "
+                f"p99={run['p99_ms']:.3f}ms ({run['queries']} queries)"
+            )
+            self.stdout.write(f"  plan: {run['plan']}")
+
+    def _measure(self, parking_ids, queries):
+        rng = random.Random(1)
+        window_start = Booking.objects.order_by('start_time').values_list('start_time', flat=True).first()
+        latencies = []
+        for _ in range(queries):
+            start = window_start + timedelta(hours=rng.randint(0, 24 * 700))
+            end = start + timedelta(hours=2)
+            parking_id = rng.choice(parking_ids)
+            began = perf_counter()
+            peak_occupancy(parking_id, start, end)
+            latencies.append(perf_counter() - began)
+        plan = Booking.objects.filter(
+            parking_id=parking_ids[0], start_time__lt=window_start, end_time__gt=window_start
+        ).explain()
+        return {
+            'queries': queries,
+            'p50_ms': percentile(latencies, 0.50) * 1000,
+            'p95_ms': percentile(latencies, 0.95) * 1000,
+            'p99_ms': percentile(latencies, 0.99) * 1000,
+            'plan': ' | '.join(line.strip() for line in plan.splitlines()),
+        }
@@ -0,0 +1,81 @@
+import json
+from datetime import timedelta
+from time import perf_counter
+
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+from rest_framework.renderers import JSONRenderer
+
+from parking import renderers
+from parking.benchmarking import benchmark_database, percentile, seed
+from parking.models import Booking, Parking, User
+from parking.serializers import (
+    BookingSerializer, ParkingSerializer, UserSerializer, PARKING_FIELDS, booking_rows,
+)
+
+
+def _payloads(size):
+    """Response bodies of the list and detail endpoints, as the views build them."""
+    bookings = Booking.objects.order_by('booking_id')[:size]
+    now = timezone.now()
+    return {
+        'booking_list': booking_rows(bookings),
+        'booking_list_serializer': BookingSerializer(bookings.select_related('parking_id', 'user_id'), many=True).data,
+        'parking_list': list(Parking.objects.order_by('parking_id').values(*PARKING_FIELDS)[:size]),
+        'parking_detail': ParkingSerializer(Parking.objects.first()).data,
+        'user_detail': UserSerializer(User.objects.first()).data,
+        # Raw datetimes, encoded by the renderer itself
+        'availability': {
+            'parking_id': 1, 'amount_of_spots': 10, 'from': now, 'to': now + timedelta(hours=2),
+            'occupied_spots': 3, 'free_spots': 7,
+        },
+    }
+
+
+def _time(render, data, iterations):
+    samples = []
+    for _ in range(iterations):
+        began = perf_counter()
+        render(data)
+        samples.append(perf_counter() - began)
+    return samples
+
+
+class Command(BaseCommand):
+    help = (
+        "Measure the per-response JSON rendering cost of the stock DRF "
+        "JSONRenderer against parking.renderers.FastJSONRenderer."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--size', type=int, default=1000, help='Rows in the list payloads')
+        parser.add_argument('--iterations', type=int, default=200)
+        parser.add_argument('--json', action='store_true', help='Print the results as JSON')
+
+    def handle(self, *args, **options):
+        stock, fast = JSONRenderer(), renderers.FastJSONRenderer()
+        results = {'orjson': renderers.orjson is not None, 'payloads': {}}
+        with benchmark_database():
+            seed(parkings=options['size'], users=100, bookings=options['size'])
+            payloads = _payloads(options['size'])
+
+        for name, data in payloads.items():
+            if json.loads(stock.render(data)) != json.loads(fast.render(data)):
+                raise CommandError(f'{name}: FastJSONRenderer output differs from JSONRenderer')
+            run = {'bytes': len(fast.render(data))}
+            for label, renderer in (('stock', stock), ('fast', fast)):
+                samples = _time(renderer.render, data, options['iterations'])
+                run[f'{label}_p50_us'] = percentile(samples, 0.50) * 1e6
+                run[f'{label}_p95_us'] = percentile(samples, 0.95) * 1e6
+            run['speedup'] = run['stock_p50_us'] / run['fast_p50_us'] if run['fast_p50_us'] else 0.0
+            results['payloads'][name] = run
+
+        if options['json']:
+            self.stdout.write(json.dumps(results, indent=2))
+            return
+        self.stdout.write(f"orjson: {'yes' if results['orjson'] else 'no (stdlib fallback)'}")
+        for name, run in results['payloads'].items():
+            self.stdout.write(
+                f"{name:<24} {run['bytes']:>9} B  stock p50={run['stock_p50_us']:9.1f}us "
+                f"fast p50={run['fast_p50_us']:9.1f}us  x{run['speedup']:.1f}"
+            )
@@ -0,0 +1,433 @@
+import json
+import random
+import subprocess
+import sys
+import threading
+from datetime import timedelta
+from time import perf_counter
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test import Client
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+
+from parking import archive, urls as parking_urls
+from parking.benchmarking import (
+    BENCHMARK_PASSWORD, SEED_CENTRE, SEED_SPREAD_DEGREES, benchmark_database, percentile, seed,
+)
+from parking.models import Booking, Parking, User
+from parking.tokens import issue_token
+
+
+class BenchmarkContext:
+    """Seeded ids and helpers shared by the scenarios."""
+
+    def __init__(self, parking_ids, user_ids, seed_value=0):
+        self.parking_ids = parking_ids
+        self.user_ids = user_ids
+        self.admin = User.objects.create_user(
+            email='admin@bench.local', password=BENCHMARK_PASSWORD,
+            first_name='Bench', last_name='Admin', is_admin=True,
+        )
+        self.token, _ = issue_token(self.admin)
+        self.booking_ids = list(Booking.objects.values_list('booking_id', flat=True)[:1000])
+        self._rng = random.Random(seed_value)
+        self._counter = 0
+        self._lock = threading.Lock()
+
+    @property
+    def auth(self):
+        return {'HTTP_AUTHORIZATION': f'Bearer {self.token}'}
+
+    def next_number(self):
+        with self._lock:
+            self._counter += 1
+            return self._counter
+
+    def choice(self, values):
+        with self._lock:
+            return self._rng.choice(values)
+
+    def window(self):
+        """A random two-hour window within the next year, as ISO strings."""
+        with self._lock:
+            hours = self._rng.randint(24, 24 * 365)
+        start = timezone.now().replace(minute=0, second=0, microsecond=0) + timedelta(hours=hours)
+        return start.isoformat(), (start + timedelta(hours=2)).isoformat()
+
+    def point(self):
+        """A random point in the area of the seeded parkings."""
+        with self._lock:
+            return tuple(
+                centre + self._rng.uniform(-SEED_SPREAD_DEGREES, SEED_SPREAD_DEGREES)
+                for centre in SEED_CENTRE
+            )
+
+    def new_parking(self):
+        return Parking.objects.create(amount_of_spots=50, address='Scratch Street', price=5)
+
+    def new_booking(self):
+        start = timezone.now() + timedelta(days=400 + self.next_number())
+        return Booking.objects.create(
+            parking_id_id=self.choice(self.parking_ids), user_id=self.admin,
+            start_time=start, end_time=start + timedelta(hours=1),
+        )
+
+
+# Every scenario does its (untimed) setup and returns the request to time:
+# (method, path, client keyword arguments, accepted status codes)
+
+def _json(data, ctx):
+    return {'data': data, 'content_type': 'application/json', **ctx.auth}
+
+
+def home(ctx):
+    return 'get', reverse('home'), {}, {200}
+
+
+def register(ctx):
+    email = f'register{ctx.next_number()}@bench.local'
+    data = {
+        'email': email, 'first_name': 'Bench', 'last_name': 'User',
+        'password': BENCHMARK_PASSWORD, 'password_confirm': BENCHMARK_PASSWORD,
+    }
+    return 'post', reverse('register'), {'data': data, 'content_type': 'application/json'}, {201}
+
+
+def login(ctx):
+    data = {'email': 'admin@bench.local', 'password': BENCHMARK_PASSWORD}
+    return 'post', reverse('login'), {'data': data, 'content_type': 'application/json'}, {200}
+
+
+def logout(ctx):
+    token, _ = issue_token(ctx.admin)
+    return 'post', reverse('logout'), {'HTTP_AUTHORIZATION': f'Bearer {token}'}, {200}
+
+
+def get_user(ctx):
+    return 'get', reverse('get_user', args=[ctx.choice(ctx.user_ids)]), ctx.auth, {200}
+
+
+def delete_user(ctx):
+    user = User.objects.create(email=f'delete{ctx.next_number()}@bench.local')
+    return 'delete', reverse('delete_user', args=[user.id]), ctx.auth, {200}
+
+
+def user_summary(ctx):
+    return 'get', reverse('user_summary', args=[ctx.choice(ctx.user_ids)]), ctx.auth, {200}
+
+
+def parking_list(ctx):
+    return 'get', reverse('parking_list_create'), ctx.auth, {200}
+
+
+def parking_list_page(ctx):
+    return 'get', reverse('parking_list_create') + '?limit=50&fields=parking_id,address', ctx.auth, {200}
+
+
+def parking_create(ctx):
+    data = {'amount_of_spots': 10, 'address': 'New Street', 'price': 3}
+    return 'post', reverse('parking_list_create'), _json(data, ctx), {201}
+
+
+def parking_bulk_create(ctx):
+    data = [{'amount_of_spots': 10, 'address': f'Bulk Street {n}', 'price': 3} for n in range(20)]
+    return 'post', reverse('parking_bulk'), _json(data, ctx), {200}
+
+
+def get_parking(ctx):
+    return 'get', reverse('get_parking', args=[ctx.choice(ctx.parking_ids)]), ctx.auth, {200}
+
+
+def update_parking(ctx):
+    path = reverse('update_parking', args=[ctx.choice(ctx.parking_ids)])
+    return 'put', path, _json({'comment': f'updated {ctx.next_number()}'}, ctx), {200}
+
+
+def delete_parking(ctx):
+    return 'delete', reverse('delete_parking', args=[ctx.new_parking().parking_id]), ctx.auth, {200}
+
+
+def parking_availability(ctx):
+    start, end = ctx.window()
+    path = reverse('parking_availability', args=[ctx.choice(ctx.parking_ids)])
+    return 'get', path, {'data': {'from': start, 'to': end}, **ctx.auth}, {200}
+
+
+def parking_nearby(ctx):
+    start, end = ctx.window()
+    lat, lon = ctx.point()
+    data = {'lat': lat, 'lon': lon, 'radius': 2, 'from': start, 'to': end}
+    return 'get', reverse('parking_nearby'), {'data': data, **ctx.auth}, {200}
+
+
+def parking_stats(ctx):
+    path = reverse('parking_stats', args=[ctx.choice(ctx.parking_ids)])
+    return 'get', path, {'data': {'granularity': 'hour'}, **ctx.auth}, {200}
+
+
+def parking_stats_daily(ctx):
+    path = reverse('parking_stats', args=[ctx.choice(ctx.parking_ids)])
+    return 'get', path, {'data': {'granularity': 'day'}, **ctx.auth}, {200}
+
+
+def parking_search(ctx):
+    # Seeded addresses are "<n> Benchmark Street": one rare and one common word
+    query = f'{ctx.choice(ctx.parking_ids) % 1000} bench'
+    return 'get', reverse('parking_search'), {'data': {'q': query, 'limit': 20}, **ctx.auth}, {200}
+
+
+def parking_search_broad(ctx):
+    return 'get', reverse('parking_search'), {'data': {'q': 'benchmark str', 'limit': 20}, **ctx.auth}, {200}
+
+
+def booking_list_page(ctx):
+    return 'get', reverse('booking_list_create') + '?limit=100', ctx.auth, {200}
+
+
+def booking_list_archived(ctx):
+    return 'get', reverse('booking_list_create') + '?limit=100&include_archived=true', ctx.auth, {200}
+
+
+def booking_create(ctx):
+    start, end = ctx.window()
+    data = {'parking_id': ctx.choice(ctx.parking_ids), 'start_time': start, 'end_time': end}
+    return 'post', reverse('booking_list_create'), _json(data, ctx), {201, 400}
+
+
+def booking_export(ctx):
+    parking_id = ctx.choice(ctx.parking_ids)
+    path = reverse('booking_export') + f'?output=ndjson&parking_id={parking_id}'
+    return 'get', path, ctx.auth, {200}
+
+
+def booking_bulk_create(ctx):
+    data = []
+    for _ in range(20):
+        start, end = ctx.window()
+        data.append({'parking_id': ctx.choice(ctx.parking_ids), 'start_time': start, 'end_time': end})
+    return 'post', reverse('booking_bulk'), _json(data, ctx), {200}
+
+
+def get_booking(ctx):
+    return 'get', reverse('get_booking', args=[ctx.choice(ctx.booking_ids)]), ctx.auth, {200}
+
+
+def update_booking(ctx):
+    booking = ctx.new_booking()
+    data = {'end_time': (booking.end_time + timedelta(minutes=30)).isoformat()}
+    return 'put', reverse('update_booking', args=[booking.booking_id]), _json(data, ctx), {200}
+
+
+def delete_booking(ctx):
+    return 'delete', reverse('delete_booking', args=[ctx.new_booking().booking_id]), ctx.auth, {200}
+
+
+SCENARIOS = {
+    'home': [home],
+    'register': [register],
+    'login': [login],
+    'logout': [logout],
+    'get_user': [get_user],
+    'delete_user': [delete_user],
+    'user_summary': [user_summary],
+    'parking_list_create': [parking_list, parking_list_page, parking_create],
+    'parking_bulk': [parking_bulk_create],
+    'get_parking': [get_parking],
+    'update_parking': [update_parking],
+    'delete_parking': [delete_parking],
+    'parking_availability': [parking_availability],
+    'parking_nearby': [parking_nearby],
+    'parking_stats': [parking_stats, parking_stats_daily],
+    'parking_search': [parking_search, parking_search_broad],
+    'booking_list_create': [booking_list_page, booking_list_archived, booking_create],
+    'booking_export': [booking_export],
+    'booking_bulk': [booking_bulk_create],
+    'get_booking': [get_booking],
+    'update_booking': [update_booking],
+    'delete_booking': [delete_booking],
+}
+
+
+def _request(client, request):
+    """Send a prepared request; returns (seconds, status code, response bytes, accepted)."""
+    method, path, options, accepted = request
+    began = perf_counter()
+    response = getattr(client, method)(path, **options)
+    size = len(b''.join(response.streaming_content)) if response.streaming else len(response.content)
+    elapsed = perf_counter() - began
+    return elapsed, response.status_code, size, response.status_code in accepted
+
+
+def _summary(latencies, elapsed):
+    return {
+        'p50_ms': percentile(latencies, 0.50) * 1000,
+        'p95_ms': percentile(latencies, 0.95) * 1000,
+        'p99_ms': percentile(latencies, 0.99) * 1000,
+        'mean_ms': sum(latencies) / len(latencies) * 1000 if latencies else 0.0,
+        'throughput': len(latencies) / elapsed if elapsed else 0.0,
+    }
+
+
+class Command(BaseCommand):
+    help = (
+        "Seed a throwaway database and benchmark every route of parking/urls.py "
+        "sequentially and with concurrent threads; writes diffable JSON results."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--parkings', type=int, default=200)
+        parser.add_argument('--users', type=int, default=500)
+        parser.add_argument('--bookings', type=int, default=20000)
+        parser.add_argument('--iterations', type=int, default=50, help='Sequential requests per scenario')
+        parser.add_argument('--threads', type=int, default=4, help='Threads for the concurrent phase (0 to skip)')
+        parser.add_argument('--concurrent-iterations', type=int, default=25, help='Requests per thread')
+        parser.add_argument(
+            '--archive', action='store_true',
+            help='Archive the seeded bookings past the retention window before running',
+        )
+        parser.add_argument('--only', nargs='*', help='Scenario names to run (default: all)')
+        parser.add_argument('--output', '-o', help='Write the JSON results to this file')
+        parser.add_argument('--compare', help='Baseline JSON results to diff against')
+        parser.add_argument('--threshold', type=float, default=0.2, help='Allowed p95 slowdown before failing (fraction)')
+
+    def handle(self, *args, **options):
+        missing = {pattern.name for pattern in parking_urls.urlpatterns} - set(SCENARIOS)
+        if missing:
+            raise CommandError(f'No benchmark scenario for routes: {", ".join(sorted(missing))}')
+
+        scenarios = [scenario for route in SCENARIOS.values() for scenario in route]
+        if options['only']:
+            scenarios = [scenario for scenario in scenarios if scenario.__name__ in options['only']]
+
+        with benchmark_database():
+            began = perf_counter()
+            parking_ids, user_ids = seed(
+                parkings=options['parkings'], users=options['users'],
+                bookings=options['bookings'], spots=1000,
+            )
+            if options['archive']:
+                for _ in archive.archive_bookings():
+                    pass
+            seed_seconds = perf_counter() - began
+            ctx = BenchmarkContext(parking_ids, user_ids)
+            endpoints = {}
+            for scenario in scenarios:
+                endpoints[scenario.__name__] = self._run(scenario, ctx, options)
+                self._print(scenario.__name__, endpoints[scenario.__name__])
+
+        results = {
+            'meta': {
+                'commit': self._commit(),
+                'created_at': timezone.now().isoformat(),
+                'backend': connection.vendor,
+                'python': sys.version.split()[0],
+                'scale': {key: options[key] for key in ('parkings', 'users', 'bookings', 'archive')},
+                'seed_seconds': seed_seconds,
+                'iterations': options['iterations'],
+                'threads': options['threads'],
+            },
+            'endpoints': endpoints,
+        }
+        if options['output']:
+            with open(options['output'], 'w') as output:
+                json.dump(results, output, indent=2, sort_keys=True)
+        if options['compare']:
+            with open(options['compare']) as baseline:
+                regressions = self._compare(json.load(baseline), results, options['threshold'])
+            if regressions:
+                raise CommandError(f'{regressions} endpoint(s) regressed')
+
+    def _run(self, scenario, ctx, options):
+        client = Client()
+        latencies, sizes, queries, errors = [], [], [], 0
+        began = perf_counter()
+        for _ in range(options['iterations']):
+            request = scenario(ctx)
+            with CaptureQueriesContext(connection) as captured:
+                elapsed, _, size, accepted = _request(client, request)
+            latencies.append(elapsed)
+            sizes.append(size)
+            queries.append(len(captured))
+            errors += not accepted
+        result = {
+            'sequential': _summary(latencies, perf_counter() - began),
+            'queries_per_request': percentile(queries, 0.50) if queries else 0,
+            'max_queries': max(queries) if queries else 0,
+            'response_bytes': max(sizes) if sizes else 0,
+            'errors': errors,
+        }
+        if options['threads']:
+            result['concurrent'] = self._run_concurrent(scenario, ctx, options)
+        return result
+
+    def _run_concurrent(self, scenario, ctx, options):
+        latencies, failures = [], []
+        guard = threading.Lock()
+
+        def worker():
+            client = Client()
+            local, local_errors = [], 0
+            try:
+                for _ in range(options['concurrent_iterations']):
+                    elapsed, _, _, accepted = _request(client, scenario(ctx))
+                    local.append(elapsed)
+                    local_errors += not accepted
+            except Exception as exc:  # reported, not raised: keep the other threads going
+                failures.append(repr(exc))
+            finally:
+                connection.close()
+            with guard:
+                latencies.extend(local)
+                failures.extend(['error'] * local_errors)
+
+        workers = [threading.Thread(target=worker) for _ in range(options['threads'])]
+        began = perf_counter()
+        for thread in workers:
+            thread.start()
+        for thread in workers:
+            thread.join()
+        summary = _summary(latencies, perf_counter() - began)
+        summary['errors'] = len(failures)
+        return summary
+
+    def _print(self, name, result):
+        line = (
+            f"{name:<24} p50={result['sequential']['p50_ms']:7.2f}ms "
+            f"p95={result['sequential']['p95_ms']:7.2f}ms p99={result['sequential']['p99_ms']:7.2f}ms "
+            f"{result['sequential']['throughput']:8.1f} req/s  queries={result['queries_per_request']}"
+        )
+        if 'concurrent' in result:
+            line += f"  concurrent={result['concurrent']['throughput']:.1f} req/s"
+        if result['errors'] or result.get('concurrent', {}).get('errors'):
+            line += self.style.ERROR('  ERRORS')
+        self.stdout.write(line)
+
+    def _compare(self, baseline, results, threshold):
+        regressions = 0
+        self.stdout.write(f"\nCompared with {baseline['meta'].get('commit') or 'baseline'}:")
+        for name, current in results['endpoints'].items():
+            previous = baseline['endpoints'].get(name)
+            if previous is None:
+                continue
+            old_p95, new_p95 = previous['sequential']['p95_ms'], current['sequential']['p95_ms']
+            change = (new_p95 - old_p95) / old_p95 if old_p95 else 0.0
+            more_queries = current['queries_per_request'] > previous['queries_per_request']
+            regressed = change > threshold or more_queries
+            regressions += regressed
+            line = (
+                f"{name:<24} p95 {old_p95:7.2f} -> {new_p95:7.2f}ms ({change:+.0%})  "
+                f"queries {previous['queries_per_request']} -> {current['queries_per_request']}"
+            )
+            self.stdout.write(self.style.ERROR(line) if regressed else line)
+        return regressions
+
+    def _commit(self):
+        try:
+            return subprocess.run(
+                ['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True, check=True,
+            ).stdout.strip()
+        except (OSError, subprocess.CalledProcessError):
+            return None
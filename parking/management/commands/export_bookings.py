@@ -0,0 +1,44 @@
+import sys
+
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+from parking.exports import DEFAULT_CHUNK_SIZE, EXPORT_FORMATS, export_bookings
+from parking.models import Booking
+
+
+class Command(BaseCommand):
+    help = "Stream bookings to a file (or stdout) as NDJSON or CSV for reporting."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--output-format', choices=sorted(EXPORT_FORMATS), default='ndjson')
+        parser.add_argument('--output', '-o', help='Destination file (default: stdout)')
+        parser.add_argument('--chunk-size', type=int, default=DEFAULT_CHUNK_SIZE)
+        parser.add_argument('--from', dest='start', help='Only bookings ending after this datetime')
+        parser.add_argument('--to', dest='end', help='Only bookings starting before this datetime')
+        parser.add_argument('--parking-id', type=int)
+
+    def handle(self, *args, **options):
+        bookings = Booking.objects.all()
+        if options['start']:
+            bookings = bookings.filter(end_time__gt=self._parse_time(options['start']))
+        if options['end']:
+            bookings = bookings.filter(start_time__lt=self._parse_time(options['end']))
+        if options['parking_id'] is not None:
+            bookings = bookings.filter(parking_id=options['parking_id'])
+
+        lines = export_bookings(bookings, options['output_format'], chunk_size=options['chunk_size'])
+        if options['output']:
+            with open(options['output'], 'w', newline='', encoding='utf-8') as output:
+                output.writelines(lines)
+        else:
+            sys.stdout.writelines(lines)
+
+    def _parse_time(self, value):
+        parsed = parse_datetime(value)
+        if parsed is None:
+            raise CommandError(f'Invalid datetime: {value}')
+        if timezone.is_naive(parsed):
+            parsed = timezone.make_aware(parsed)
+        return parsed
@@ -0,0 +1,10 @@
+from django.core.management.base import BaseCommand
+
+from parking.tokens import purge_expired
+
+
+class Command(BaseCommand):
+    help = "Delete the revocations of access tokens that have expired (run periodically, e.g. from cron)."
+
+    def handle(self, *args, **options):
+        self.stdout.write(f'Deleted {purge_expired()} expired revocations')
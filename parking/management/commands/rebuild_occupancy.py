@@ -0,0 +1,21 @@
+from time import perf_counter
+
+from django.core.management.base import BaseCommand
+
+from parking import analytics
+
+
+class Command(BaseCommand):
+    help = (
+        "Recompute the hourly and daily occupancy buckets from the bookings "
+        "(vectorized with NumPy when it is installed)."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--parking-id', type=int, nargs='*', help='Only these parkings (default: all)')
+
+    def handle(self, *args, **options):
+        began = perf_counter()
+        written = analytics.rebuild(options['parking_id'] or None)
+        engine = 'numpy' if analytics.numpy is not None else 'python'
+        self.stdout.write(f'Wrote {written} buckets in {perf_counter() - began:.2f}s ({engine})')
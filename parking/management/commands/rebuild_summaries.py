@@ -0,0 +1,24 @@
+from time import perf_counter
+
+from django.core.management.base import BaseCommand
+
+from parking import summaries
+
+
+class Command(BaseCommand):
+    help = "Recompute the per-user booking summaries from the bookings."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--user-id', type=int, nargs='*', help='Only these users (default: all)')
+        parser.add_argument(
+            '--stale', action='store_true',
+            help='Only queue a rebuild of the summaries whose upcoming list ran short (run periodically, e.g. from cron)',
+        )
+
+    def handle(self, *args, **options):
+        if options['stale']:
+            self.stdout.write(f'Queued {summaries.refresh_stale()} stale summaries')
+            return
+        began = perf_counter()
+        written = summaries.rebuild(options['user_id'] or None)
+        self.stdout.write(f'Wrote {written} summaries in {perf_counter() - began:.2f}s')
@@ -0,0 +1,27 @@
+import signal
+import threading
+
+from django.core.management.base import BaseCommand
+
+from parking import jobs
+
+
+class Command(BaseCommand):
+    help = (
+        "Run the queued jobs of parking.jobs (side effects of booking writes) "
+        "with a thread pool, retrying failed jobs with backoff."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--threads', type=int, default=4, help='Jobs run concurrently')
+        parser.add_argument('--poll', type=float, default=1.0, help='Seconds between polls when idle')
+        parser.add_argument('--once', action='store_true', help='Exit once no job is due')
+
+    def handle(self, *args, **options):
+        stop = threading.Event()
+        # Finish the running jobs before exiting
+        for signum in (signal.SIGINT, signal.SIGTERM):
+            signal.signal(signum, lambda *_: stop.set())
+        self.stdout.write(f"Running jobs with {options['threads']} threads")
+        jobs.work(threads=options['threads'], poll=options['poll'], stop=stop, once=options['once'])
+        self.stdout.write('Stopped')
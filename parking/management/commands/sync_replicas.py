@@ -0,0 +1,30 @@
+import sqlite3
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
+
+from parking.routers import PRIMARY
+
+
+class Command(BaseCommand):
+    help = (
+        "Copy the primary SQLite database onto the SQLite read replicas "
+        "(PARKMATE_DB_REPLICAS), for trying replica routing locally."
+    )
+
+    def handle(self, *args, **options):
+        primary = connections[PRIMARY]
+        if primary.vendor != 'sqlite':
+            raise CommandError('Only SQLite replicas can be synced; use database replication otherwise')
+        if not settings.PARKMATE_READ_REPLICAS:
+            raise CommandError('No replicas configured (PARKMATE_DB_REPLICAS)')
+        primary.ensure_connection()
+        for alias in settings.PARKMATE_READ_REPLICAS:
+            connections[alias].close()
+            target = sqlite3.connect(connections[alias].settings_dict['NAME'])
+            try:
+                primary.connection.backup(target)
+            finally:
+                target.close()
+            self.stdout.write(f"Copied {primary.settings_dict['NAME']} to {alias}")
@@ -0,0 +1,133 @@
+"""
+In-memory request metrics in the Prometheus text exposition format.
+
+``PerformanceMiddleware`` (``parking.middleware``) observes every request
+into the histograms below, labelled by view and method; ``metrics_view``
+serves them at ``/metrics``. Values are per process: with several workers
+each one is scraped (or aggregated) separately.
+"""
+import threading
+from bisect import bisect_left
+
+from django.conf import settings
+from django.http import Http404, HttpResponse
+
+ENABLED = getattr(settings, 'PARKMATE_METRICS_ENABLED', True)
+
+DURATION_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+QUERY_BUCKETS = (0, 1, 2, 3, 5, 10, 25, 50, 100)
+SIZE_BUCKETS = (100, 1_000, 10_000, 100_000, 1_000_000, 10_000_000)
+
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+
+class Histogram:
+    """A labelled histogram with fixed upper bounds."""
+
+    def __init__(self, name, documentation, buckets, labels):
+        self.name = name
+        self.documentation = documentation
+        self.buckets = tuple(buckets)
+        self.labels = tuple(labels)
+        self._series = {}  # label values -> [bucket counts..., +Inf count, sum]
+        self._lock = threading.Lock()
+
+    def observe(self, value, *label_values):
+        index = bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(label_values)
+            if series is None:
+                series = self._series[label_values] = [0] * (len(self.buckets) + 2)
+            series[index] += 1
+            series[-1] += value
+
+    def collect(self):
+        with self._lock:
+            series = {key: list(values) for key, values in self._series.items()}
+        lines = [f'# HELP {self.name} {self.documentation}', f'# TYPE {self.name} histogram']
+        for label_values, values in sorted(series.items()):
+            labels = ','.join(f'{name}="{_escape(value)}"' for name, value in zip(self.labels, label_values))
+            cumulative = 0
+            for bound, count in zip(self.buckets + ('+Inf',), values):
+                cumulative += count
+                lines.append(f'{self.name}_bucket{{{labels},le="{bound}"}} {cumulative}')
+            lines.append(f'{self.name}_sum{{{labels}}} {values[-1]}')
+            lines.append(f'{self.name}_count{{{labels}}} {cumulative}')
+        return lines
+
+    def clear(self):
+        with self._lock:
+            self._series.clear()
+
+
+class Counter:
+    """A labelled monotonically increasing counter."""
+
+    def __init__(self, name, documentation, labels):
+        self.name = name
+        self.documentation = documentation
+        self.labels = tuple(labels)
+        self._series = {}
+        self._lock = threading.Lock()
+
+    def inc(self, *label_values, amount=1):
+        with self._lock:
+            self._series[label_values] = self._series.get(label_values, 0) + amount
+
+    def collect(self):
+        with self._lock:
+            series = dict(self._series)
+        lines = [f'# HELP {self.name} {self.documentation}', f'# TYPE {self.name} counter']
+        for label_values, value in sorted(series.items()):
+            labels = ','.join(f'{name}="{_escape(value)}"' for name, value in zip(self.labels, label_values))
+            lines.append(f'{self.name}{{{labels}}} {value}')
+        return lines
+
+    def clear(self):
+        with self._lock:
+            self._series.clear()
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+LABELS = ('view', 'method')
+
+requests_total = Counter('parkmate_requests_total', 'Requests served.', LABELS + ('status',))
+request_duration = Histogram(
+    'parkmate_request_duration_seconds', 'Wall time spent handling a request.', DURATION_BUCKETS, LABELS
+)
+db_duration = Histogram(
+    'parkmate_db_duration_seconds', 'Time spent in database queries per request.', DURATION_BUCKETS, LABELS
+)
+db_queries = Histogram('parkmate_db_queries', 'Database queries per request.', QUERY_BUCKETS, LABELS)
+render_duration = Histogram(
+    'parkmate_render_duration_seconds', 'Time spent rendering the response body.', DURATION_BUCKETS, LABELS
+)
+response_size = Histogram('parkmate_response_size_bytes', 'Response body size.', SIZE_BUCKETS, LABELS)
+
+REGISTRY = (requests_total, request_duration, db_duration, db_queries, render_duration, response_size)
+
+
+def render():
+    """All metrics in the Prometheus text format."""
+    lines = []
+    for metric in REGISTRY:
+        lines.extend(metric.collect())
+    return '\n'.join(lines) + '\n'
+
+
+def reset():
+    for metric in REGISTRY:
+        metric.clear()
+
+
+def metrics_view(request):
+    """
+    GET /metrics
+    Prometheus scrape endpoint; 404 when metrics are disabled.
+    """
+    if not ENABLED:
+        raise Http404
+    return HttpResponse(render(), content_type=CONTENT_TYPE)
@@ -0,0 +1,142 @@
+"""
+Request middleware of the parkmate API.
+"""
+from contextlib import contextmanager
+from contextvars import ContextVar
+from functools import partial
+from time import perf_counter
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import connections
+from django.db.backends.signals import connection_created
+from django.dispatch import receiver
+
+from . import metrics
+
+
+class _QueryTimer:
+    """``execute_wrapper`` counting the queries of a request and their time."""
+
+    def __init__(self):
+        self.count = 0
+        self.seconds = 0.0
+
+    def __call__(self, execute, sql, params, many, context):
+        began = perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.count += 1
+            self.seconds += perf_counter() - began
+
+
+# Connections are per thread: under ASGI the queries of a request run on
+# sync_to_async threads, not on the thread that entered the middleware.
+# Every connection gets one permanent wrapper that passes its queries to
+# the wrappers of the current context, which those threads inherit.
+_wrappers = ContextVar('parkmate_execute_wrappers', default=())
+
+
+def _dispatch(execute, sql, params, many, context):
+    for wrapper in reversed(_wrappers.get()):
+        execute = partial(wrapper, execute)
+    return execute(sql, params, many, context)
+
+
+def _install(connection):
+    # Fires on every reconnect of the same wrapper; install once
+    if _dispatch not in connection.execute_wrappers:
+        connection.execute_wrappers.append(_dispatch)
+
+
+@receiver(connection_created)
+def _install_on_connect(sender, connection, **kwargs):
+    _install(connection)
+
+
+@contextmanager
+def wrapped_connections(wrapper):
+    """
+    Apply ``wrapper`` as an ``execute_wrapper`` to the queries run within
+    the block on every database, by this thread or a thread it awaits.
+    """
+    for alias in connections:
+        _install(connections[alias])
+    token = _wrappers.set((*_wrappers.get(), wrapper))
+    try:
+        yield
+    finally:
+        _wrappers.reset(token)
+
+
+class PerformanceMiddleware:
+    """
+    Record the wall time, database queries and time, render time and
+    response size of each request into ``parking.metrics`` and, when
+    ``PARKMATE_SERVER_TIMING`` is set, report them to the client in a
+    ``Server-Timing`` header. Removed from the stack entirely when
+    ``PARKMATE_METRICS_ENABLED`` is off.
+
+    Place it first in ``MIDDLEWARE`` so the wall time covers the other
+    middleware.
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        if not metrics.ENABLED:
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+        self.server_timing = getattr(settings, 'PARKMATE_SERVER_TIMING', False)
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        began = perf_counter()
+        timer = _QueryTimer()
+        request._render_seconds = 0.0
+        with wrapped_connections(timer):
+            response = self.get_response(request)
+        return self._finish(request, response, timer, perf_counter() - began)
+
+    async def __acall__(self, request):
+        began = perf_counter()
+        timer = _QueryTimer()
+        request._render_seconds = 0.0
+        with wrapped_connections(timer):
+            response = await self.get_response(request)
+        return self._finish(request, response, timer, perf_counter() - began)
+
+    def _finish(self, request, response, timer, elapsed):
+        match = request.resolver_match
+        labels = (match.view_name if match else 'unmatched', request.method)
+        metrics.requests_total.inc(*labels, response.status_code)
+        metrics.request_duration.observe(elapsed, *labels)
+        metrics.db_duration.observe(timer.seconds, *labels)
+        metrics.db_queries.observe(timer.count, *labels)
+        metrics.render_duration.observe(request._render_seconds, *labels)
+        if not response.streaming:
+            metrics.response_size.observe(len(response.content), *labels)
+
+        if self.server_timing:
+            response['Server-Timing'] = (
+                f'db;dur={timer.seconds * 1000:.2f};desc="{timer.count} queries", '
+                f'render;dur={request._render_seconds * 1000:.2f}, '
+                f'total;dur={elapsed * 1000:.2f}'
+            )
+        return response
+
+    def process_template_response(self, request, response):
+        # Called right before DRF renders the Response; time until rendered
+        started = perf_counter()
+
+        def rendered(response):
+            request._render_seconds = perf_counter() - started
+
+        response.add_post_render_callback(rendered)
+        return response
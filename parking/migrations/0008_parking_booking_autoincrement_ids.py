@@ -0,0 +1,23 @@
+# Generated by Django 6.0.1 on 2026-10-18 00:43
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("parking", "0007_alter_user_managers_remove_user_username"),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name="booking",
+            name="booking_id",
+            field=models.AutoField(primary_key=True, serialize=False),
+        ),
+        migrations.AlterField(
+            model_name="parking",
+            name="parking_id",
+            field=models.AutoField(primary_key=True, serialize=False),
+        ),
+    ]
@@ -0,0 +1,21 @@
+# Generated by Django 6.0.1 on 2026-10-18 00:51
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("parking", "0009_revokedtoken"),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name="booking",
+            index=models.Index(fields=["parking_id", "start_time", "end_time"], name="booking_parking_time_idx"),
+        ),
+        migrations.AddIndex(
+            model_name="booking",
+            index=models.Index(fields=["user_id", "start_time"], name="booking_user_start_idx"),
+        ),
+    ]
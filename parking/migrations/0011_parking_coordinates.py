@@ -0,0 +1,24 @@
+# Generated by Django 6.0.1 on 2026-10-18 01:08
+
+import django.core.validators
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("parking", "0010_booking_time_indexes"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="parking",
+            name="latitude",
+            field=models.FloatField(blank=True, null=True, validators=[django.core.validators.MinValueValidator(-90), django.core.validators.MaxValueValidator(90)]),
+        ),
+        migrations.AddField(
+            model_name="parking",
+            name="longitude",
+            field=models.FloatField(blank=True, null=True, validators=[django.core.validators.MinValueValidator(-180), django.core.validators.MaxValueValidator(180)]),
+        ),
+    ]
@@ -0,0 +1,30 @@
+# Generated by Django 6.0.1 on 2026-10-18 01:22
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("parking", "0011_parking_coordinates"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="OccupancyBucket",
+            fields=[
+                ("id", models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name="ID")),
+                ("granularity", models.CharField(choices=[("hour", "Hour"), ("day", "Day")], max_length=4)),
+                ("start", models.DateTimeField()),
+                ("bookings", models.IntegerField(default=0)),
+                ("booked_seconds", models.BigIntegerField(default=0)),
+                ("revenue", models.FloatField(default=0)),
+                ("parking_id", models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to="parking.parking")),
+            ],
+            options={
+                "db_table": "occupancy_bucket",
+                "constraints": [models.UniqueConstraint(fields=("parking_id", "granularity", "start"), name="occupancy_bucket_unique")],
+            },
+        ),
+    ]
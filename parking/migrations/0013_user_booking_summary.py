@@ -0,0 +1,29 @@
+# Generated by Django 6.0.1 on 2026-10-18 01:34
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("parking", "0012_occupancy_bucket"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="UserBookingSummary",
+            fields=[
+                ("user_id", models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, serialize=False, to=settings.AUTH_USER_MODEL)),
+                ("total_bookings", models.IntegerField(default=0)),
+                ("booked_seconds", models.BigIntegerField(default=0)),
+                ("total_spent", models.FloatField(default=0)),
+                ("upcoming", models.JSONField(default=list)),
+                ("upcoming_truncated", models.BooleanField(default=False)),
+            ],
+            options={
+                "db_table": "user_booking_summary",
+            },
+        ),
+    ]
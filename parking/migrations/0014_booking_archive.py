@@ -0,0 +1,30 @@
+# Generated by Django 6.0.1 on 2026-10-18 01:37
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("parking", "0013_user_booking_summary"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="ArchivedBooking",
+            fields=[
+                ("booking_id", models.IntegerField(primary_key=True, serialize=False)),
+                ("start_time", models.DateTimeField()),
+                ("end_time", models.DateTimeField()),
+                ("archived_at", models.DateTimeField(auto_now_add=True)),
+                ("parking_id", models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to="parking.parking")),
+                ("user_id", models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                "db_table": "booking_archive",
+                "indexes": [models.Index(fields=["user_id", "start_time"], name="booking_archive_user_idx"), models.Index(fields=["start_time"], name="booking_archive_start_idx")],
+            },
+        ),
+    ]
@@ -0,0 +1,19 @@
+# Generated by Django 6.0.1 on 2026-10-18 01:59
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("parking", "0015_job"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="revokedtoken",
+            name="revoked_at",
+            field=models.DateTimeField(db_index=True, default=django.utils.timezone.now),
+        ),
+    ]
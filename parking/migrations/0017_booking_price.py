@@ -0,0 +1,33 @@
+# Generated by Django 6.0.1 on 2026-10-18 02:19
+
+from django.db import migrations, models
+from django.db.models import OuterRef, Subquery
+
+
+def populate_prices(apps, schema_editor):
+    """Price existing bookings at their parking's current price, as the buckets were"""
+    Parking = apps.get_model("parking", "Parking")
+    price = Subquery(Parking.objects.filter(parking_id=OuterRef("parking_id")).values("price")[:1])
+    for name in ("Booking", "ArchivedBooking"):
+        apps.get_model("parking", name).objects.update(price=price)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("parking", "0016_revokedtoken_revoked_at"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="archivedbooking",
+            name="price",
+            field=models.IntegerField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name="booking",
+            name="price",
+            field=models.IntegerField(blank=True, null=True),
+        ),
+        migrations.RunPython(populate_prices, migrations.RunPython.noop),
+    ]
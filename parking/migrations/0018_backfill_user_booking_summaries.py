@@ -0,0 +1,45 @@
+# Generated by Django 6.0.1 on 2026-10-18 03:05
+
+from collections import defaultdict
+
+from django.db import migrations
+from django.utils import timezone
+
+
+def backfill_summaries(apps, schema_editor):
+    """Build the summaries of the users who booked before the table was maintained"""
+    from parking.summaries import REBUILD_CHUNK, _fill
+
+    User = apps.get_model("parking", "User")
+    UserBookingSummary = apps.get_model("parking", "UserBookingSummary")
+    booked = set()
+    for name in ("Booking", "ArchivedBooking"):
+        booked.update(apps.get_model("parking", name).objects.values_list("user_id", flat=True).distinct())
+    ids = sorted(booked - set(UserBookingSummary.objects.values_list("user_id", flat=True)))
+    now = timezone.now()
+    for offset in range(0, len(ids), REBUILD_CHUNK):
+        chunk = ids[offset:offset + REBUILD_CHUNK]
+        rows = defaultdict(list)
+        for name in ("Booking", "ArchivedBooking"):
+            bookings = apps.get_model("parking", name).objects.filter(user_id__in=chunk).values_list(
+                "user_id", "booking_id", "parking_id", "start_time", "end_time", "parking_id__price"
+            )
+            for user_id, *row in bookings:
+                rows[user_id].append(row)
+        summaries = []
+        for user_id in User.objects.filter(id__in=chunk).values_list("id", flat=True):
+            summary = UserBookingSummary(user_id_id=user_id)
+            _fill(summary, rows[user_id], now)
+            summaries.append(summary)
+        UserBookingSummary.objects.bulk_create(summaries, batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("parking", "0017_booking_price"),
+    ]
+
+    operations = [
+        migrations.RunPython(backfill_summaries, migrations.RunPython.noop),
+    ]
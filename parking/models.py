@@ -1,6 +1,10 @@
 from django.db import models
 from django.contrib.auth.models import AbstractUser, BaseUserManager
 from django.conf import settings
+from django.core.validators import MaxValueValidator, MinValueValidator
+from django.utils import timezone
+
+from . import hashing
 
 
 class UserManager(BaseUserManager):
@@ -31,11 +35,17 @@ class UserManager(BaseUserManager):
 
 # Create your models here.
 class Parking(models.Model):
-    parking_id = models.IntegerField(primary_key=True)
+    parking_id = models.AutoField(primary_key=True)
     amount_of_spots = models.IntegerField()
     address = models.CharField(max_length=255)
     comment = models.CharField(max_length=255, blank=True, null=True)
     price = models.IntegerField()
+    latitude = models.FloatField(
+        blank=True, null=True, validators=[MinValueValidator(-90), MaxValueValidator(90)]
+    )
+    longitude = models.FloatField(
+        blank=True, null=True, validators=[MinValueValidator(-180), MaxValueValidator(180)]
+    )
     
     class Meta:
         db_table = 'parking'
@@ -44,17 +54,72 @@ class Parking(models.Model):
         return f"Parking {self.parking_id} - {self.address}"
 
 class Booking(models.Model):
-    booking_id = models.IntegerField(primary_key=True)
+    booking_id = models.AutoField(primary_key=True)
     parking_id = models.ForeignKey(Parking, on_delete=models.CASCADE)
     user_id = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE)
     start_time = models.DateTimeField()
     end_time = models.DateTimeField()
+    # Hourly price of the parking when booked (or moved to it); prices the
+    # booking's revenue in the occupancy buckets
+    price = models.IntegerField(blank=True, null=True)
     
     class Meta:
         db_table = 'booking'
+        indexes = [
+            # Overlap checks: parking_id = ? AND start_time < ? AND end_time > ?
+            models.Index(fields=['parking_id', 'start_time', 'end_time'], name='booking_parking_time_idx'),
+            # A user's bookings, in time order
+            models.Index(fields=['user_id', 'start_time'], name='booking_user_start_idx'),
+        ]
         
     def __str__(self):
         return f"Booking {self.booking_id} - {self.parking_id} - {self.user_id}"
+    
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # The stored interval and price, so that the signals can move them on update
+        if {'parking_id_id', 'start_time', 'end_time'}.issubset(instance.__dict__):
+            instance._stored_interval = (instance.parking_id_id, instance.start_time, instance.end_time)
+        if 'price' in instance.__dict__:
+            instance._stored_price = instance.price
+        return instance
+    
+    def save(self, *args, **kwargs):
+        stored = getattr(self, '_stored_interval', None)
+        if self.price is None or (stored is not None and stored[0] != self.parking_id_id):
+            self.price = self.parking_id.price
+        super().save(*args, **kwargs)
+    
+    def interval(self):
+        """``(parking_id, start_time, end_time)``, with the times parsed if set as strings."""
+        to_python = self._meta.get_field('start_time').to_python
+        return self.parking_id_id, to_python(self.start_time), to_python(self.end_time)
+
+
+class ArchivedBooking(models.Model):
+    """A booking moved out of ``booking`` by parking.archive, keeping its id."""
+    booking_id = models.IntegerField(primary_key=True)
+    parking_id = models.ForeignKey(Parking, on_delete=models.CASCADE)
+    user_id = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE)
+    start_time = models.DateTimeField()
+    end_time = models.DateTimeField()
+    price = models.IntegerField(blank=True, null=True)
+    archived_at = models.DateTimeField(auto_now_add=True)
+    
+    class Meta:
+        db_table = 'booking_archive'
+        indexes = [
+            models.Index(fields=['user_id', 'start_time'], name='booking_archive_user_idx'),
+            models.Index(fields=['start_time'], name='booking_archive_start_idx'),
+        ]
+    
+    def __str__(self):
+        return f"Archived booking {self.booking_id} - {self.parking_id} - {self.user_id}"
+    
+    def interval(self):
+        return self.parking_id_id, self.start_time, self.end_time
+
 
 class User(AbstractUser):
     email = models.EmailField(unique=True)
@@ -69,3 +134,92 @@ class User(AbstractUser):
     
     def __str__(self):
         return self.email
+    
+    def set_password(self, raw_password):
+        # Hashed in the worker pool of parking.hashing when configured
+        self.password = hashing.make_password(raw_password)
+        self._password = raw_password
+    
+    def check_password(self, raw_password):
+        """Check the password off-thread and upgrade an outdated hash."""
+        valid, rehashed = hashing.check_password(raw_password, self.password)
+        if rehashed is not None:
+            self.password = rehashed
+            self._password = None
+            self.save(update_fields=['password'])
+        return valid
+
+
+class OccupancyBucket(models.Model):
+    """Bookings, booked time and revenue of a parking over one hour or day (UTC)."""
+    GRANULARITY_CHOICES = [('hour', 'Hour'), ('day', 'Day')]
+    
+    parking_id = models.ForeignKey(Parking, on_delete=models.CASCADE)
+    granularity = models.CharField(max_length=4, choices=GRANULARITY_CHOICES)
+    start = models.DateTimeField()
+    bookings = models.IntegerField(default=0)
+    booked_seconds = models.BigIntegerField(default=0)
+    revenue = models.FloatField(default=0)
+    
+    class Meta:
+        db_table = 'occupancy_bucket'
+        constraints = [
+            models.UniqueConstraint(fields=['parking_id', 'granularity', 'start'], name='occupancy_bucket_unique'),
+        ]
+    
+    def __str__(self):
+        return f"{self.granularity} {self.start} - {self.parking_id_id}"
+
+
+class UserBookingSummary(models.Model):
+    """Booking totals and next bookings of a user, maintained by parking.summaries."""
+    user_id = models.OneToOneField(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, primary_key=True)
+    total_bookings = models.IntegerField(default=0)
+    booked_seconds = models.BigIntegerField(default=0)
+    total_spent = models.FloatField(default=0)
+    # First bookings not ended at the last write, in start order
+    upcoming = models.JSONField(default=list)
+    upcoming_truncated = models.BooleanField(default=False)
+    
+    class Meta:
+        db_table = 'user_booking_summary'
+    
+    def __str__(self):
+        return f"Booking summary - {self.user_id_id}"
+
+
+class Job(models.Model):
+    """A queued side effect, run by parking.jobs (deleted once it succeeds)."""
+    STATUS_CHOICES = [('pending', 'Pending'), ('running', 'Running'), ('failed', 'Failed')]
+    
+    name = models.CharField(max_length=100)
+    payload = models.JSONField(default=dict)
+    status = models.CharField(max_length=7, choices=STATUS_CHOICES, default='pending')
+    attempts = models.IntegerField(default=0)
+    max_attempts = models.IntegerField(default=5)
+    run_after = models.DateTimeField(default=timezone.now)
+    locked_at = models.DateTimeField(blank=True, null=True)
+    last_error = models.TextField(blank=True, default='')
+    created_at = models.DateTimeField(auto_now_add=True)
+    
+    class Meta:
+        db_table = 'job'
+        indexes = [
+            # Due jobs: status = 'pending' AND run_after <= now
+            models.Index(fields=['status', 'run_after'], name='job_due_idx'),
+        ]
+    
+    def __str__(self):
+        return f"Job {self.pk} - {self.name} ({self.status})"
+
+
+class RevokedToken(models.Model):
+    jti = models.CharField(max_length=32, unique=True)
+    expires_at = models.DateTimeField(db_index=True)
+    revoked_at = models.DateTimeField(default=timezone.now, db_index=True)
+    
+    class Meta:
+        db_table = 'revoked_token'
+        
+    def __str__(self):
+        return f"Revoked token {self.jti}"
@@ -0,0 +1,182 @@
+"""
+Keyset (cursor) pagination and sparse fieldsets for list endpoints.
+
+Pages are selected with ``WHERE (key, pk) > (last_key, last_pk)`` on an
+index instead of ``OFFSET``, so every page costs the same no matter how
+deep the client has paged. Lists stay unpaginated unless ``limit`` or
+``cursor`` is passed, to keep existing clients working.
+"""
+import base64
+import binascii
+import json
+
+from django.db import models
+from django.db.models import Q
+from django.utils.dateparse import parse_datetime
+
+DEFAULT_LIMIT = 100
+MAX_LIMIT = 1000
+MAX_INTEGER = 2 ** 63 - 1  # largest value of a 64-bit integer column
+
+
+class InvalidQuery(ValueError):
+    """Raised for malformed list query parameters."""
+
+
+def is_integer(value):
+    """Whether ``value`` is an int (not a bool) that fits a 64-bit column."""
+    return isinstance(value, int) and not isinstance(value, bool) and -MAX_INTEGER <= value <= MAX_INTEGER
+
+
+def _params(request):
+    # DRF requests and plain Django requests (the async views)
+    return getattr(request, 'query_params', request.GET)
+
+
+def parse_fields(request, allowed):
+    """
+    Return the fields requested with ``?fields=a,b`` (all of ``allowed``
+    when absent), in the order of ``allowed``.
+    """
+    value = _params(request).get('fields')
+    if not value:
+        return tuple(allowed)
+    requested = {name.strip() for name in value.split(',') if name.strip()}
+    unknown = requested.difference(allowed)
+    if unknown:
+        raise InvalidQuery(f'Unknown fields: {", ".join(sorted(unknown))}')
+    return tuple(name for name in allowed if name in requested)
+
+
+class KeysetPagination:
+    """
+    ``orderings`` maps each accepted ``?ordering=`` value to the columns of
+    its sort key; the last column must be unique (the primary key).
+    ``-name`` sorts descending.
+    """
+
+    def __init__(self, orderings, default_ordering):
+        self.orderings = orderings
+        self.default_ordering = default_ordering
+        self.ordering = default_ordering
+        self.limit = None
+        self.keys = None
+        self.descending = False
+
+    def is_requested(self, request):
+        params = _params(request)
+        return 'limit' in params or 'cursor' in params
+
+    @property
+    def key_fields(self):
+        return self.keys or ()
+
+    def paginate_queryset(self, queryset, request):
+        """Order ``queryset`` and, when paginating, cut it at the cursor."""
+        params = _params(request)
+        ordering = params.get('ordering', self.default_ordering)
+        cursor = params.get('cursor')
+        if cursor:
+            ordering, values = self._decode(cursor)
+        name = ordering.lstrip('-')
+        if name not in self.orderings:
+            raise InvalidQuery(f'Unsupported ordering: {ordering}')
+        self.keys = self.orderings[name]
+        self.descending = ordering.startswith('-')
+        self.ordering = ordering
+        prefix = '-' if self.descending else ''
+        queryset = queryset.order_by(*(prefix + key for key in self.keys))
+
+        if not self.is_requested(request):
+            return queryset
+        self.limit = self._parse_limit(params.get('limit'))
+        if cursor:
+            queryset = queryset.filter(self._after(queryset.model, values))
+        # One extra row tells whether there is a next page
+        return queryset[:self.limit + 1]
+
+    def merge(self, model, *parts):
+        """
+        Combine the rows of tables split from ``model`` (each paginated
+        separately with the same request) into one list in page order.
+        """
+        def key(row):
+            return [self._to_python(model, name, row[name]) for name in self.keys]
+        
+        rows = sorted((row for part in parts for row in part), key=key, reverse=self.descending)
+        return rows if self.limit is None else rows[:self.limit + 1]
+
+    def get_response_data(self, rows, fields):
+        """Trim ``rows`` to the page and drop key columns not in ``fields``."""
+        if self.limit is None:
+            return self._strip(rows, fields)
+        next_cursor = None
+        if len(rows) > self.limit:
+            rows = rows[:self.limit]
+            next_cursor = self._encode([rows[-1][key] for key in self.keys])
+        return {'next': next_cursor, 'results': self._strip(rows, fields)}
+
+    def _strip(self, rows, fields):
+        extra = [key for key in self.key_fields if key not in fields]
+        if extra:
+            for row in rows:
+                for key in extra:
+                    row.pop(key, None)
+        return rows
+
+    def _parse_limit(self, value):
+        if value is None:
+            return DEFAULT_LIMIT
+        try:
+            limit = int(value)
+        except ValueError:
+            raise InvalidQuery('limit must be an integer')
+        if limit < 1:
+            raise InvalidQuery('limit must be positive')
+        return min(limit, MAX_LIMIT)
+
+    def _after(self, model, values):
+        """Row-value comparison ``keys > values`` expanded into a Q object."""
+        lookup = 'lt' if self.descending else 'gt'
+        values = [self._to_python(model, key, value) for key, value in zip(self.keys, values)]
+        condition = Q()
+        for position, key in enumerate(self.keys):
+            equal = {self.keys[n]: values[n] for n in range(position)}
+            condition |= Q(**equal, **{f'{key}__{lookup}': values[position]})
+        return condition
+
+    def _to_python(self, model, key, value):
+        field = model._meta.get_field(key)
+        if isinstance(field, models.DateTimeField):
+            try:
+                # Raises for well-formed but impossible dates (month 13)
+                parsed = parse_datetime(value) if isinstance(value, str) else None
+            except ValueError:
+                parsed = None
+            if parsed is None:
+                raise InvalidQuery('Invalid cursor')
+            return parsed
+        if isinstance(field, models.IntegerField):
+            if not is_integer(value):
+                raise InvalidQuery('Invalid cursor')
+            return value
+        if not isinstance(value, str):
+            raise InvalidQuery('Invalid cursor')
+        return value
+
+    def _encode(self, values):
+        payload = json.dumps([self.ordering, values], separators=(',', ':'))
+        return base64.urlsafe_b64encode(payload.encode()).decode().rstrip('=')
+
+    def _decode(self, cursor):
+        try:
+            padded = cursor + '=' * (-len(cursor) % 4)
+            ordering, values = json.loads(base64.urlsafe_b64decode(padded))
+        except (binascii.Error, ValueError, TypeError):
+            raise InvalidQuery('Invalid cursor')
+        if not isinstance(ordering, str) or not isinstance(values, list):
+            raise InvalidQuery('Invalid cursor')
+        keys = self.orderings.get(ordering.lstrip('-'))
+        if keys is None or len(keys) != len(values):
+            raise InvalidQuery('Invalid cursor')
+        return ordering, values
@@ -0,0 +1,190 @@
+"""
+Slow-query and N+1 detection.
+
+``QueryInspector`` is a ``connection.execute_wrapper`` that fingerprints
+every query (literals and ``IN`` lists collapsed, so ``WHERE id = 1`` and
+``WHERE id = 2`` have the same shape) and records a finding, with the
+stack of the offending call, when
+
+* one shape runs more than ``repeat_threshold`` times (a likely N+1),
+* a query takes longer than ``slow_ms``,
+* the total exceeds ``max_queries``.
+
+``QueryInspectorMiddleware`` applies it to every request (see
+``PARKMATE_QUERY_INSPECTOR`` in settings) and ``query_budget()`` to a block
+of code, typically a test. In strict mode findings raise
+``QueryBudgetExceeded``; otherwise they are logged as warnings.
+"""
+import logging
+import os
+import re
+import traceback
+from collections import Counter, namedtuple
+from contextlib import contextmanager
+from time import perf_counter
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import DEFAULT_DB_ALIAS, connections
+from django.urls import Resolver404, get_resolver
+
+from . import middleware
+from .middleware import wrapped_connections
+
+logger = logging.getLogger('parking.queries')
+
+DEFAULTS = {
+    'ENABLED': False,
+    'STRICT': False,
+    'REPEAT_THRESHOLD': 5,
+    'SLOW_MS': 100,
+    'MAX_QUERIES': None,
+    'BUDGETS': {},
+}
+
+_STRING = re.compile(r"'(?:[^']|'')*'")
+_NUMBER = re.compile(r'\b\d+(?:\.\d+)?\b')
+_IN_LIST = re.compile(r'\bIN\s*\(\s*\?(?:\s*,\s*\?)*\s*\)', re.IGNORECASE)
+_SPACE = re.compile(r'\s+')
+
+_PROJECT_DIR = str(settings.BASE_DIR)
+# Frames of the wrappers themselves are left out of the reported stacks
+_IGNORED_FILES = {os.path.abspath(__file__), os.path.abspath(middleware.__file__)}
+
+Finding = namedtuple('Finding', 'kind shape seconds stack')
+
+
+class QueryBudgetExceeded(AssertionError):
+    """Raised in strict mode when a request or block breaks its query budget."""
+
+
+def fingerprint(sql):
+    """Shape of ``sql`` with literals and placeholders normalized."""
+    sql = _STRING.sub('?', sql)
+    sql = _NUMBER.sub('?', sql)
+    sql = sql.replace('%s', '?')
+    sql = _IN_LIST.sub('IN (...)', sql)
+    return _SPACE.sub(' ', sql).strip()
+
+
+def _stack():
+    """The project frames of the current call stack, innermost last."""
+    frames = [
+        frame for frame in traceback.extract_stack()[:-2]
+        if frame.filename.startswith(_PROJECT_DIR)
+        and frame.filename not in _IGNORED_FILES
+        and 'site-packages' not in frame.filename
+    ]
+    return ''.join(traceback.format_list(frames))
+
+
+class QueryInspector:
+    def __init__(self, repeat_threshold=5, slow_ms=100, max_queries=None, label=None):
+        self.repeat_threshold = repeat_threshold
+        self.slow_seconds = slow_ms / 1000 if slow_ms is not None else None
+        self.max_queries = max_queries
+        self.label = label
+        self.shapes = Counter()
+        self.total = 0
+        self.findings = []
+
+    def __call__(self, execute, sql, params, many, context):
+        began = perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.record(sql, perf_counter() - began)
+
+    def record(self, sql, seconds):
+        shape = fingerprint(sql)
+        self.total += 1
+        self.shapes[shape] += 1
+        if self.repeat_threshold is not None and self.shapes[shape] == self.repeat_threshold + 1:
+            self.findings.append(Finding('repeated', shape, seconds, _stack()))
+        if self.slow_seconds is not None and seconds > self.slow_seconds:
+            self.findings.append(Finding('slow', shape, seconds, _stack()))
+        if self.max_queries is not None and self.total == self.max_queries + 1:
+            self.findings.append(Finding('budget', shape, seconds, _stack()))
+
+    def report(self):
+        lines = [f'{self.label or "Block"} ran {self.total} queries']
+        for finding in self.findings:
+            if finding.kind == 'repeated':
+                lines.append(f'Query repeated {self.shapes[finding.shape]} times: {finding.shape}')
+            elif finding.kind == 'slow':
+                lines.append(f'Slow query ({finding.seconds * 1000:.1f} ms): {finding.shape}')
+            else:
+                lines.append(f'Query budget of {self.max_queries} exceeded at: {finding.shape}')
+            lines.append(finding.stack.rstrip() or '  (no project frames)')
+        return '\n'.join(lines)
+
+    def check(self, strict):
+        """Raise (strict) or log the findings, if any."""
+        if not self.findings:
+            return
+        if strict:
+            raise QueryBudgetExceeded(self.report())
+        logger.warning(self.report())
+
+
+@contextmanager
+def query_budget(max_queries=None, repeat_threshold=5, slow_ms=None, using=DEFAULT_DB_ALIAS, strict=True):
+    """
+    Inspect the queries run on ``using`` within the block; in strict mode
+    a finding raises ``QueryBudgetExceeded`` when the block exits.
+    """
+    inspector = QueryInspector(repeat_threshold, slow_ms, max_queries)
+    with connections[using].execute_wrapper(inspector):
+        yield inspector
+    inspector.check(strict)
+
+
+class QueryInspectorMiddleware:
+    """
+    Inspect the queries of each request, under ASGI those run by
+    ``sync_to_async`` threads included (see ``wrapped_connections``).
+    ``BUDGETS`` maps view names to the maximum number of queries they may
+    run, overriding ``MAX_QUERIES``.
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        config = {**DEFAULTS, **getattr(settings, 'PARKMATE_QUERY_INSPECTOR', {})}
+        if not config['ENABLED']:
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+        self.config = config
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        inspector = self._inspector(request)
+        with wrapped_connections(inspector):
+            response = self.get_response(request)
+        inspector.check(self.config['STRICT'])
+        return response
+
+    async def __acall__(self, request):
+        inspector = self._inspector(request)
+        with wrapped_connections(inspector):
+            response = await self.get_response(request)
+        inspector.check(self.config['STRICT'])
+        return response
+
+    def _inspector(self, request):
+        max_queries = self.config['MAX_QUERIES']
+        if self.config['BUDGETS']:
+            try:
+                match = get_resolver(getattr(request, 'urlconf', None)).resolve(request.path_info)
+                max_queries = self.config['BUDGETS'].get(match.view_name, max_queries)
+            except Resolver404:
+                pass
+        return QueryInspector(
+            self.config['REPEAT_THRESHOLD'], self.config['SLOW_MS'], max_queries,
+            label=f'{request.method} {request.path}',
+        )
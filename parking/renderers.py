@@ -0,0 +1,51 @@
+"""
+JSON rendering of the API responses.
+
+``FastJSONRenderer`` encodes with orjson when it is installed and falls
+back to DRF's ``JSONRenderer`` (stdlib ``json``) otherwise, or when the
+client asks for indented output. The output is the same as DRF's: compact,
+UTF-8, datetimes in ISO 8601 with ``Z`` for UTC, and every other type
+(decimals, lazy strings, querysets...) converted by DRF's own encoder.
+
+``dumps()`` is the same encoder for the responses built outside of DRF
+(the response cache and the async views).
+"""
+from rest_framework.renderers import JSONRenderer
+from rest_framework.utils.encoders import JSONEncoder
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+_default = JSONEncoder().default
+_stock = JSONRenderer()
+# Escaped by DRF so the output stays a strict subset of JavaScript
+_LINE_SEPARATORS = ('\u2028'.encode(), '\u2029'.encode())
+
+if orjson is not None:
+    _OPTIONS = orjson.OPT_UTC_Z | orjson.OPT_NON_STR_KEYS
+
+
+def dumps(data):
+    """Encode ``data`` as compact JSON bytes."""
+    if orjson is None:
+        return _stock.render(data)
+    try:
+        body = orjson.dumps(data, default=_default, option=_OPTIONS)
+    except TypeError:
+        # Types orjson rejects even through ``default`` (aware times,
+        # integers beyond 64 bits): let the stock encoder decide
+        return _stock.render(data)
+    if _LINE_SEPARATORS[0] in body or _LINE_SEPARATORS[1] in body:
+        body = body.replace(_LINE_SEPARATORS[0], b'\\u2028').replace(_LINE_SEPARATORS[1], b'\\u2029')
+    return body
+
+
+class FastJSONRenderer(JSONRenderer):
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if data is None:
+            return b''
+        if self.get_indent(accepted_media_type, renderer_context or {}) is not None:
+            return super().render(data, accepted_media_type, renderer_context)
+        return dumps(data)
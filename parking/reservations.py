@@ -0,0 +1,135 @@
+"""
+Overbooking-safe booking commits.
+
+Writes that may change the occupancy of a parking go through
+``reservation()``, which serializes them per parking: an in-process lock
+striped by parking id keeps threads of one worker from racing each other,
+and ``select_for_update`` on the parking row does the same across workers
+on databases with row locks. Bookings of different parkings never wait on
+each other.
+
+Inside the lock the capacity check is made against the database rather
+than the in-memory availability index, which may lag behind other workers.
+"""
+import threading
+from contextlib import contextmanager
+from time import perf_counter
+
+from django.db import transaction
+
+from .models import Booking, Parking
+
+LOCK_STRIPES = 64
+
+_stripes = [threading.Lock() for _ in range(LOCK_STRIPES)]
+_stats_lock = threading.Lock()
+_stats = {
+    'commits': 0,
+    'rejected': 0,
+    'contended': 0,
+    'wait_seconds': 0.0,
+    'max_wait_seconds': 0.0,
+    'hold_seconds': 0.0,
+}
+
+
+class SpotsUnavailable(Exception):
+    """Raised when a parking has no free spot left for the requested window."""
+
+
+def peak_occupancy(parking_id, start_time, end_time, exclude=None):
+    """Peak number of bookings overlapping ``[start_time, end_time)`` in the database."""
+    bookings = Booking.objects.filter(
+        parking_id=parking_id, start_time__lt=end_time, end_time__gt=start_time
+    )
+    if exclude is not None:
+        bookings = bookings.exclude(booking_id=exclude)
+    events = []
+    for start, end in bookings.values_list('start_time', 'end_time'):
+        events.append((max(start, start_time), 1))
+        events.append((end, -1))
+    # Ends sort before starts at the same moment: intervals are half-open
+    events.sort(key=lambda event: (event[0], event[1]))
+    peak = current = 0
+    for _, delta in events:
+        current += delta
+        peak = max(peak, current)
+    return peak
+
+
+@contextmanager
+def reservation(parking_id, start_time, end_time, exclude=None):
+    """
+    Lock ``parking_id`` and check that a spot is free in the window.
+
+    Yields the locked parking inside a transaction; the booking must be
+    saved within the block. Raises ``SpotsUnavailable`` when the parking
+    is full and ``Parking.DoesNotExist`` when it is gone.
+    """
+    with _locked([parking_id]):
+        parking = Parking.objects.select_for_update().get(parking_id=parking_id)
+        if peak_occupancy(parking_id, start_time, end_time, exclude) >= parking.amount_of_spots:
+            raise SpotsUnavailable(parking_id)
+        yield parking
+
+
+@contextmanager
+def reservation_batch(parking_ids):
+    """
+    Lock several parkings for a batch of booking writes.
+
+    Yields ``{parking_id: parking}`` for the parkings that exist, inside a
+    transaction; capacity checks are left to the caller. Locks are taken in
+    id order so concurrent batches cannot deadlock.
+    """
+    parking_ids = sorted(set(parking_ids))
+    with _locked(parking_ids):
+        parkings = Parking.objects.select_for_update().filter(parking_id__in=parking_ids).order_by('parking_id')
+        yield {parking.parking_id: parking for parking in parkings}
+
+
+@contextmanager
+def _locked(parking_ids):
+    """Hold the stripe locks of ``parking_ids`` and a transaction."""
+    locks = [_stripes[index] for index in sorted({hash(pk) % LOCK_STRIPES for pk in parking_ids})]
+    requested = perf_counter()
+    contended = False
+    held = []
+    try:
+        for lock in locks:
+            if not lock.acquire(blocking=False):
+                contended = True
+                lock.acquire()
+            held.append(lock)
+        acquired = perf_counter()
+        committed = False
+        try:
+            with transaction.atomic():
+                yield
+            committed = True
+        finally:
+            _record(contended, acquired - requested, perf_counter() - acquired, committed)
+    finally:
+        for lock in reversed(held):
+            lock.release()
+
+
+def _record(contended, wait, hold, committed):
+    with _stats_lock:
+        _stats['commits' if committed else 'rejected'] += 1
+        _stats['contended'] += contended
+        _stats['wait_seconds'] += wait
+        _stats['max_wait_seconds'] = max(_stats['max_wait_seconds'], wait)
+        _stats['hold_seconds'] += hold
+
+
+def stats():
+    """Snapshot of the reservation counters of this process."""
+    with _stats_lock:
+        return dict(_stats)
+
+
+def reset_stats():
+    with _stats_lock:
+        for key in _stats:
+            _stats[key] = type(_stats[key])()
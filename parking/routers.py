@@ -0,0 +1,179 @@
+"""
+Read-replica routing.
+
+``ReplicaRouter`` sends reads to the aliases listed in
+``PARKMATE_READ_REPLICAS`` and writes to the primary (``default``). A
+replica is picked round-robin or, with ``PARKMATE_REPLICA_SELECTION =
+'latency'``, by the lowest moving average of its query time, measured by
+an ``execute_wrapper`` installed on every replica connection.
+
+Reads go to the primary instead when
+
+* they run inside a transaction on the primary (capacity checks, bulk
+  writes), or
+* the current request has already written (read-your-writes): the first
+  write pins the rest of the request, and ``ReplicaPinningMiddleware``
+  sets a short-lived cookie that pins the client's next requests too,
+  until the replicas have caught up.
+
+State that outlives a request (the availability index, the user cache,
+the revocation list, cached catalog responses) is loaded from
+``PRIMARY`` explicitly.
+"""
+import itertools
+import threading
+from contextlib import contextmanager
+from contextvars import ContextVar
+from time import perf_counter
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, connections
+from django.db.backends.signals import connection_created
+from django.dispatch import receiver
+
+PRIMARY = DEFAULT_DB_ALIAS
+PIN_COOKIE = 'parkmate_primary'
+LATENCY_WEIGHT = 0.2  # weight of the newest sample in the moving average
+
+
+class _Scope:
+    __slots__ = ('pinned', 'wrote')
+
+    def __init__(self, pinned=False):
+        self.pinned = pinned
+        self.wrote = False
+
+
+# Outside of a request (management commands, workers) writes pin the
+# rest of the context
+_scope = ContextVar('parkmate_replica_scope', default=None)
+
+_latency = {}  # alias -> moving average of query seconds
+_latency_lock = threading.Lock()
+
+
+def _current_scope():
+    scope = _scope.get()
+    if scope is None:
+        scope = _Scope()
+        _scope.set(scope)
+    return scope
+
+
+@contextmanager
+def request_scope(pinned=False):
+    """Track pinning for one request (or unit of work) and forget it afterwards."""
+    scope = _Scope(pinned)
+    token = _scope.set(scope)
+    try:
+        yield scope
+    finally:
+        _scope.reset(token)
+
+
+def pin_to_primary():
+    """Send the remaining reads of the current scope to the primary."""
+    _current_scope().pinned = True
+
+
+def replica_latency():
+    """Moving average of the query time of each replica seen so far."""
+    with _latency_lock:
+        return dict(_latency)
+
+
+class _LatencyRecorder:
+    def __init__(self, alias):
+        self.alias = alias
+
+    def __call__(self, execute, sql, params, many, context):
+        began = perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            elapsed = perf_counter() - began
+            with _latency_lock:
+                previous = _latency.get(self.alias)
+                _latency[self.alias] = elapsed if previous is None else (
+                    LATENCY_WEIGHT * elapsed + (1 - LATENCY_WEIGHT) * previous
+                )
+
+
+@receiver(connection_created)
+def _record_replica_latency(sender, connection, **kwargs):
+    if connection.alias in getattr(settings, 'PARKMATE_READ_REPLICAS', ()):
+        # Fires on every reconnect of the same wrapper; install once
+        if not any(isinstance(wrapper, _LatencyRecorder) for wrapper in connection.execute_wrappers):
+            connection.execute_wrappers.append(_LatencyRecorder(connection.alias))
+
+
+class ReplicaRouter:
+    def __init__(self):
+        self.replicas = list(getattr(settings, 'PARKMATE_READ_REPLICAS', ()))
+        self.selection = getattr(settings, 'PARKMATE_REPLICA_SELECTION', 'round_robin')
+        self._cycle = itertools.cycle(self.replicas)
+        self._cycle_lock = threading.Lock()
+
+    def db_for_read(self, model, **hints):
+        if not self.replicas:
+            return None
+        scope = _scope.get()
+        if scope is not None and scope.pinned:
+            return PRIMARY
+        if connections[PRIMARY].in_atomic_block:
+            return PRIMARY
+        if self.selection == 'latency':
+            latency = replica_latency()
+            # Replicas without samples yet are tried first
+            return min(self.replicas, key=lambda alias: latency.get(alias, 0.0))
+        with self._cycle_lock:
+            return next(self._cycle)
+
+    def db_for_write(self, model, **hints):
+        scope = _current_scope()
+        scope.pinned = scope.wrote = True
+        return PRIMARY
+
+    def allow_relation(self, obj1, obj2, **hints):
+        databases = {PRIMARY, *self.replicas}
+        if obj1._state.db in databases and obj2._state.db in databases:
+            return True
+        return None
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        # Replicas receive the schema from the primary
+        return False if db in self.replicas else None
+
+
+class ReplicaPinningMiddleware:
+    """
+    Scope pinning to the request and carry it over to the client's next
+    requests for ``PARKMATE_REPLICA_PIN_SECONDS`` after a write.
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.pin_seconds = getattr(settings, 'PARKMATE_REPLICA_PIN_SECONDS', 5)
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        with request_scope(pinned=PIN_COOKIE in request.COOKIES) as scope:
+            response = self.get_response(request)
+        return self._finish(scope, response)
+
+    async def __acall__(self, request):
+        with request_scope(pinned=PIN_COOKIE in request.COOKIES) as scope:
+            response = await self.get_response(request)
+        return self._finish(scope, response)
+
+    def _finish(self, scope, response):
+        if scope.wrote and self.pin_seconds:
+            response.set_cookie(PIN_COOKIE, '1', max_age=self.pin_seconds, httponly=True, samesite='Lax')
+        return response
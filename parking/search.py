@@ -0,0 +1,199 @@
+"""
+Full-text search over parking addresses and comments.
+
+An in-memory inverted index maps every term to the parkings containing it
+and how often (address terms count ``ADDRESS_WEIGHT`` times). The terms
+are also kept in a sorted list, so each query word matches the terms it is
+a prefix of with two bisections ("main str" finds "Main Street").
+
+A parking matches when every query word matches one of its terms. It is
+scored with tf-idf: for each word the best of its matching terms counts,
+``(1 + log tf) * log(1 + N / df)``, prefix matches at ``PREFIX_WEIGHT``,
+and the sum is normalized by the square root of the parking's term count.
+
+Like the availability and spatial indexes, it is loaded lazily from the
+database and kept in sync by the parking signals in ``parking.signals``,
+and rebuilt like the spatial grid when the shared catalog version moved
+on after a parking write through another worker.
+"""
+import heapq
+import math
+import re
+import threading
+import unicodedata
+from bisect import bisect_left, insort
+from collections import Counter
+
+from django.conf import settings
+
+from . import caching
+from .models import Parking
+from .routers import PRIMARY
+
+ADDRESS_WEIGHT = 2
+PREFIX_WEIGHT = 0.5
+# Words shorter than this only match whole terms
+MIN_PREFIX_LENGTH = 2
+# A short prefix could expand to most of the vocabulary; the cap keeps the
+# cost of a query independent of the catalog size. Searches report when a
+# word had more extensions (only the first ones, alphabetically, count)
+MAX_EXPANSIONS = getattr(settings, 'PARKMATE_SEARCH_MAX_EXPANSIONS', 64)
+
+_WORD = re.compile(r'\w+')
+
+
+def tokenize(text):
+    """Lowercased words of ``text`` with accents stripped."""
+    if not text:
+        return []
+    text = unicodedata.normalize('NFKD', text)
+    text = ''.join(char for char in text if not unicodedata.combining(char))
+    return _WORD.findall(text.casefold())
+
+
+class InvertedIndex:
+    def __init__(self):
+        self._postings = {}  # term -> {key: 1 + log(weighted term frequency)}
+        self._lengths = {}   # key -> number of (weighted) terms
+        self._keys = {}      # key -> its terms, for removal
+        self._terms = []     # sorted terms with postings
+
+    def __len__(self):
+        return len(self._lengths)
+
+    def __contains__(self, key):
+        return key in self._lengths
+
+    def add(self, key, address, comment):
+        self.remove(key)
+        frequencies = Counter()
+        for term in tokenize(address):
+            frequencies[term] += ADDRESS_WEIGHT
+        for term in tokenize(comment):
+            frequencies[term] += 1
+        for term, frequency in frequencies.items():
+            postings = self._postings.get(term)
+            if postings is None:
+                postings = self._postings[term] = {}
+                insort(self._terms, term)
+            postings[key] = 1 + math.log(frequency)
+        self._lengths[key] = sum(frequencies.values())
+        self._keys[key] = tuple(frequencies)
+
+    def remove(self, key):
+        if key not in self._lengths:
+            return
+        del self._lengths[key]
+        for term in self._keys.pop(key):
+            postings = self._postings[term]
+            del postings[key]
+            if not postings:
+                del self._postings[term]
+                del self._terms[bisect_left(self._terms, term)]
+
+    def expand(self, word):
+        """
+        The terms ``word`` matches: itself and, if long enough, its first
+        ``MAX_EXPANSIONS`` extensions; and whether there were more.
+        """
+        if len(word) < MIN_PREFIX_LENGTH:
+            return ([word] if word in self._postings else []), False
+        start = bisect_left(self._terms, word)
+        end = bisect_left(self._terms, word + '\U0010ffff', start)
+        return self._terms[start:min(end, start + MAX_EXPANSIONS)], end - start > MAX_EXPANSIONS
+
+    def search(self, query):
+        """
+        ``{key: score}`` of the keys matching every word of ``query``, and
+        whether a word had more extensions than were searched.
+        """
+        total = len(self._lengths)
+        matches = []
+        truncated = False
+        for word in dict.fromkeys(tokenize(query)):
+            terms, capped = self.expand(word)
+            truncated = truncated or capped
+            weighted = []
+            for term in terms:
+                postings = self._postings[term]
+                weight = math.log(1 + total / len(postings))
+                weighted.append((postings, weight if term == word else weight * PREFIX_WEIGHT))
+            if not weighted:
+                return {}, truncated
+            matches.append((sum(len(postings) for postings, _ in weighted), weighted))
+        if not matches:
+            return {}, truncated
+        # The rarest word selects the candidates; the others only look them up
+        matches.sort(key=lambda match: match[0])
+        scores = {}
+        for postings, weight in matches[0][1]:
+            for key, tf in postings.items():
+                score = tf * weight
+                if score > scores.get(key, 0.0):
+                    scores[key] = score
+        for _, weighted in matches[1:]:
+            if len(weighted) == 1:
+                (postings, weight), = weighted
+                scores = {key: score + postings[key] * weight for key, score in scores.items() if key in postings}
+                continue
+            narrowed = {}
+            for key, score in scores.items():
+                best = max(postings.get(key, 0.0) * weight for postings, weight in weighted)
+                if best:
+                    narrowed[key] = score + best
+            scores = narrowed
+        return {key: score / math.sqrt(self._lengths[key]) for key, score in scores.items()}, truncated
+
+
+_lock = threading.RLock()
+_index = None
+_index_version = None  # catalog version the index was built at
+
+
+def _get_index():
+    """The index, rebuilt (outside the lock) if it is missing or outdated."""
+    global _index, _index_version
+    version = caching.catalog_version()
+    with _lock:
+        if _index is not None and _index_version == version:
+            return _index
+    index = InvertedIndex()
+    rows = Parking.objects.using(PRIMARY).values_list('parking_id', 'address', 'comment')
+    for parking_id, address, comment in rows.iterator(chunk_size=2000):
+        index.add(parking_id, address, comment)
+    with _lock:
+        _index, _index_version = index, version
+    return index
+
+
+def search(query, offset=0, limit=20):
+    """
+    Rank the parkings matching ``query``; returns the total number of
+    matches, the ``(parking_id, score)`` pairs of the requested page, best
+    first (ties by id), and whether prefix expansions were capped.
+    """
+    index = _get_index()
+    with _lock:
+        scores, truncated = index.search(query)
+    page = heapq.nsmallest(offset + limit, scores.items(), key=lambda item: (-item[1], item[0]))
+    return len(scores), page[offset:], truncated
+
+
+def record_parking(parking_id, address, comment):
+    """Sync a created or updated parking into the loaded index."""
+    with _lock:
+        if _index is not None:
+            _index.add(parking_id, address, comment)
+
+
+def discard_parking(parking_id):
+    with _lock:
+        if _index is not None:
+            _index.remove(parking_id)
+
+
+def reset():
+    """Drop the index; it is rebuilt from the database on demand."""
+    global _index, _index_version
+    with _lock:
+        _index = _index_version = None
@@ -1,4 +1,7 @@
+from contextlib import contextmanager
+
 from rest_framework import serializers
+from . import reservations
 from .models import Parking, User, Booking
 from django.contrib.auth.hashers import make_password, check_password
 
@@ -42,12 +45,12 @@ class ParkingSerializer(serializers.ModelSerializer):
         fields = '__all__'
         read_only_fields = ('parking_id',)
 
-    def create(self, validated_data):
-        # Auto-generate parking_id if not provided
-        if 'parking_id' not in validated_data or validated_data.get('parking_id') is None:
-            last_parking = Parking.objects.order_by('-parking_id').first()
-            validated_data['parking_id'] = (last_parking.parking_id + 1) if last_parking else 1
-        return super().create(validated_data)
+    def validate(self, attrs):
+        latitude = attrs.get('latitude', getattr(self.instance, 'latitude', None))
+        longitude = attrs.get('longitude', getattr(self.instance, 'longitude', None))
+        if (latitude is None) != (longitude is None):
+            raise serializers.ValidationError("Latitude and longitude must be set together")
+        return attrs
 
 
 class BookingSerializer(serializers.ModelSerializer):
@@ -64,37 +67,115 @@ class BookingSerializer(serializers.ModelSerializer):
     def validate(self, attrs):
         start_time = attrs.get('start_time')
         end_time = attrs.get('end_time')
+        if self.instance is not None:
+            start_time = start_time or self.instance.start_time
+            end_time = end_time or self.instance.end_time
         
         if start_time and end_time and start_time >= end_time:
             raise serializers.ValidationError({"end_time": "End time must be after start time"})
         
-        # Check if parking exists
-        parking_id = attrs.get('parking_id')
-        if parking_id:
-            try:
-                Parking.objects.get(parking_id=parking_id)
-            except Parking.DoesNotExist:
-                raise serializers.ValidationError({"parking_id": "Parking does not exist"})
-        
+        # Parking existence and capacity are checked under the parking's lock
+        # when the booking is saved (see _reserve)
         return attrs
 
     def create(self, validated_data):
-        # Auto-generate booking_id if not provided
-        if 'booking_id' not in validated_data or validated_data.get('booking_id') is None:
-            last_booking = Booking.objects.order_by('-booking_id').first()
-            validated_data['booking_id'] = (last_booking.booking_id + 1) if last_booking else 1
-        
-        # Get parking object from parking_id
-        parking_id = validated_data.pop('parking_id')
-        parking = Parking.objects.get(parking_id=parking_id)
-        validated_data['parking_id'] = parking
+        # Remove user_id from validated_data if it was passed as integer (we use the authenticated user instead)
+        validated_data.pop('user_id', None)
         
-        # Set user_id from request if not provided
+        # Set user_id from the authenticated caller
         request = self.context.get('request')
-        if request and hasattr(request, 'user_obj') and request.user_obj:
-            validated_data['user_id'] = request.user_obj
+        if request and request.user.is_authenticated:
+            validated_data['user_id'] = request.user
         
-        # Remove user_id from validated_data if it was passed as integer (we use request.user_obj instead)
+        # Lock the parking and re-check capacity before inserting
+        parking_id = validated_data.pop('parking_id')
+        with self._reserve(parking_id, validated_data['start_time'], validated_data['end_time']) as parking:
+            validated_data['parking_id'] = parking
+            return super().create(validated_data)
+
+    def update(self, instance, validated_data):
         validated_data.pop('user_id', None)
-        
-        return super().create(validated_data)
+        parking_id = validated_data.pop('parking_id', instance.parking_id_id)
+        start_time = validated_data.get('start_time', instance.start_time)
+        end_time = validated_data.get('end_time', instance.end_time)
+        with self._reserve(parking_id, start_time, end_time, exclude=instance.booking_id) as parking:
+            validated_data['parking_id'] = parking
+            return super().update(instance, validated_data)
+
+    @contextmanager
+    def _reserve(self, parking_id, start_time, end_time, exclude=None):
+        # Errors as lists, like those of is_valid()
+        try:
+            with reservations.reservation(parking_id, start_time, end_time, exclude=exclude) as parking:
+                yield parking
+        except reservations.SpotsUnavailable:
+            raise serializers.ValidationError({"parking_id": ["No free spots for the requested time"]})
+        except Parking.DoesNotExist:
+            raise serializers.ValidationError({"parking_id": ["Parking does not exist"]})
+
+
+class BookingWriteSerializer(serializers.Serializer):
+    """Validates booking fields without touching the database (used by bulk writes)."""
+    booking_id = serializers.IntegerField(required=False)
+    parking_id = serializers.IntegerField()
+    start_time = serializers.DateTimeField()
+    end_time = serializers.DateTimeField()
+
+    def validate(self, attrs):
+        start_time = attrs.get('start_time')
+        end_time = attrs.get('end_time')
+        if start_time and end_time and start_time >= end_time:
+            raise serializers.ValidationError({"end_time": "End time must be after start time"})
+        return attrs
+
+
+# Read-only fast path for booking listings
+
+PARKING_FIELDS = ('parking_id', 'amount_of_spots', 'address', 'comment', 'price', 'latitude', 'longitude')
+BOOKING_FIELDS = ('booking_id', 'start_time', 'end_time', 'parking', 'user')
+_USER_FIELDS = ('id', 'email', 'first_name', 'last_name', 'is_admin', 'date_joined')
+_datetime_field = serializers.DateTimeField()
+
+
+def booking_rows(bookings, fields=BOOKING_FIELDS):
+    """
+    Represent a booking queryset exactly like ``BookingSerializer(many=True).data``,
+    limited to ``fields``.
+
+    Parking and user columns are fetched in the same joined query (and only
+    joined when requested) and the rows are built as plain dicts, skipping
+    per-row serializer instances.
+    """
+    return list(iter_booking_rows(bookings, fields))
+
+
+def iter_booking_rows(bookings, fields=BOOKING_FIELDS, chunk_size=None):
+    """
+    Lazy version of ``booking_rows()``. With ``chunk_size`` the rows are
+    streamed from the database cursor in chunks instead of being cached
+    on the queryset, keeping memory bounded for any table size.
+    """
+    columns = [name for name in ('booking_id', 'start_time', 'end_time') if name in fields]
+    if 'parking' in fields:
+        columns += [f'parking_id__{name}' for name in PARKING_FIELDS]
+    if 'user' in fields:
+        columns += [f'user_id__{name}' for name in _USER_FIELDS]
+    to_datetime = _datetime_field.to_representation
+    results = bookings.values_list(*columns)
+    if chunk_size is not None:
+        results = results.iterator(chunk_size=chunk_size)
+    for values in results:
+        values = iter(values)
+        row = {}
+        for name in ('booking_id', 'start_time', 'end_time'):
+            if name in fields:
+                row[name] = next(values)
+        for name in ('start_time', 'end_time'):
+            if name in row:
+                row[name] = to_datetime(row[name])
+        if 'parking' in fields:
+            row['parking'] = {name: next(values) for name in PARKING_FIELDS}
+        if 'user' in fields:
+            user = row['user'] = {name: next(values) for name in _USER_FIELDS}
+            user['date_joined'] = to_datetime(user['date_joined'])
+        yield row
@@ -0,0 +1,99 @@
+from contextlib import contextmanager
+
+from django.db import transaction
+from django.db.models import QuerySet
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from . import analytics, archive, availability, caching, search, spatial, summaries
+from .authentication import user_cache
+from .models import ArchivedBooking, Booking, Parking, User
+
+
+@contextmanager
+def batch():
+    """Write the occupancy buckets and user summaries of the block's booking signals at its end."""
+    with analytics.batch(), summaries.batch():
+        yield
+
+
+@receiver(post_save, sender=Booking)
+def booking_saved(sender, instance, using, raw=False, **kwargs):
+    """
+    Update the occupancy buckets and the owner's summary in the booking's
+    transaction and keep the availability index in sync once it is committed.
+    """
+    current = instance.interval()
+    stored = getattr(instance, '_stored_interval', None)
+    if not raw:
+        analytics.booking_saved(instance, using, stored, current, getattr(instance, '_stored_price', None))
+        summaries.booking_saved(instance, using, stored, current)
+    instance._stored_interval = current
+    instance._stored_price = instance.price
+    booking_id = instance.booking_id
+    parking_id, start_time, end_time = current
+    previous = stored[0] if stored is not None else None
+    transaction.on_commit(
+        lambda: availability.record_booking(booking_id, parking_id, start_time, end_time, previous),
+        using=using,
+    )
+
+
+def _with_parking(origin):
+    """Whether a delete of ``origin`` cascaded to the booking from its parking."""
+    return isinstance(origin, Parking) or (isinstance(origin, QuerySet) and origin.model is Parking)
+
+
+@receiver(post_delete, sender=Booking)
+def booking_deleted(sender, instance, using, origin=None, **kwargs):
+    stored = getattr(instance, '_stored_interval', None) or instance.interval()
+    # An archived booking keeps counting in the buckets and the summary
+    if not archive.archiving():
+        # The parking's buckets are deleted with it
+        if not _with_parking(origin):
+            analytics.booking_deleted(instance, using, stored, getattr(instance, '_stored_price', instance.price))
+        summaries.booking_deleted(instance, using, stored)
+    booking_id, parking_id = instance.booking_id, stored[0]
+    transaction.on_commit(lambda: availability.discard_booking(booking_id, parking_id), using=using)
+
+
+@receiver(post_delete, sender=ArchivedBooking)
+def archived_booking_deleted(sender, instance, using, origin=None, **kwargs):
+    """An archived booking deleted with its parking or user leaves the derived rows too."""
+    if not _with_parking(origin):
+        analytics.booking_deleted(instance, using, instance.interval(), instance.price)
+    summaries.booking_deleted(instance, using, instance.interval())
+
+
+@receiver(post_save, sender=Parking)
+def parking_saved(sender, instance, using, **kwargs):
+    parking_id = instance.parking_id
+    latitude, longitude = instance.latitude, instance.longitude
+    address, comment = instance.address, instance.comment
+    
+    def sync():
+        caching.invalidate_parking(parking_id)
+        spatial.record_parking(parking_id, latitude, longitude)
+        search.record_parking(parking_id, address, comment)
+    
+    transaction.on_commit(sync, using=using)
+
+
+@receiver(post_delete, sender=Parking)
+def parking_deleted(sender, instance, using, **kwargs):
+    parking_id = instance.parking_id
+    
+    def forget():
+        availability.discard_parking(parking_id)
+        spatial.discard_parking(parking_id)
+        search.discard_parking(parking_id)
+        caching.invalidate_parking(parking_id)
+    
+    transaction.on_commit(forget, using=using)
+
+
+@receiver(post_save, sender=User)
+@receiver(post_delete, sender=User)
+def user_changed(sender, instance, **kwargs):
+    """Evict the user from the authentication cache."""
+    user_cache.invalidate(instance.pk)
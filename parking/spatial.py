@@ -0,0 +1,208 @@
+"""
+Nearest-parking search.
+
+Parkings with coordinates are kept in an in-memory grid of
+``PARKMATE_SPATIAL_CELL_DEGREES``-sized cells. A search visits the cells
+in rings of growing size around the query point and emits parkings in
+increasing great-circle distance as soon as no unvisited ring can hold a
+closer one, so finding the k nearest touches only the cells around the
+point no matter how many parkings there are.
+
+Like the availability indexes, the grid is loaded lazily from the
+database and kept in sync by the parking signals in ``parking.signals``.
+It is rebuilt when the shared catalog version (see ``parking.caching``)
+no longer matches the one it was built at, after a parking write through
+any worker.
+"""
+import heapq
+import math
+import threading
+
+from django.conf import settings
+
+from . import availability, caching
+from .models import Parking
+from .routers import PRIMARY
+
+EARTH_RADIUS_KM = 6371.0088
+KM_PER_DEGREE = math.pi * EARTH_RADIUS_KM / 180
+
+CELL_DEGREES = getattr(settings, 'PARKMATE_SPATIAL_CELL_DEGREES', 0.02)
+
+
+def haversine_km(lat1, lon1, lat2, lon2):
+    """Great-circle distance between two points in kilometres."""
+    lat1, lon1, lat2, lon2 = map(math.radians, (lat1, lon1, lat2, lon2))
+    a = math.sin((lat2 - lat1) / 2) ** 2 + math.cos(lat1) * math.cos(lat2) * math.sin((lon2 - lon1) / 2) ** 2
+    return 2 * EARTH_RADIUS_KM * math.asin(min(1.0, math.sqrt(a)))
+
+
+class GridIndex:
+    """Points bucketed into a latitude/longitude grid."""
+
+    def __init__(self, cell_degrees=CELL_DEGREES):
+        self.cell = cell_degrees
+        self.columns = max(1, round(360 / cell_degrees))
+        self._cells = {}   # (row, column) -> {key: (lat, lon)}
+        self._points = {}  # key -> (lat, lon)
+
+    def __len__(self):
+        return len(self._points)
+
+    def __contains__(self, key):
+        return key in self._points
+
+    def _cell(self, lat, lon):
+        return math.floor(lat / self.cell), math.floor(lon / self.cell) % self.columns
+
+    def add(self, key, lat, lon):
+        self.remove(key)
+        self._points[key] = (lat, lon)
+        self._cells.setdefault(self._cell(lat, lon), {})[key] = (lat, lon)
+
+    def remove(self, key):
+        point = self._points.pop(key, None)
+        if point is not None:
+            cell = self._cell(*point)
+            bucket = self._cells[cell]
+            del bucket[key]
+            if not bucket:
+                del self._cells[cell]
+
+    def nearest(self, lat, lon, radius_km):
+        """Yield ``(distance_km, key)`` within ``radius_km``, nearest first."""
+        row0, column0 = self._cell(lat, lon)
+        radius = radius_km / EARTH_RADIUS_KM
+        row_span = math.ceil(math.degrees(radius) / self.cell) + 1
+        # Highest latitude the search can reach; meridians converge there,
+        # so it bounds how far apart in longitude the columns can be
+        top = min(90.0, abs(lat) + math.degrees(radius) + self.cell)
+        spread = math.sin(radius / 2) / max(math.cos(math.radians(top)), 1e-12)
+        if spread >= 1:
+            column_span = self.columns // 2
+        else:
+            column_span = min(self.columns // 2, math.ceil(math.degrees(2 * math.asin(spread)) / self.cell) + 1)
+        top_cos = math.cos(math.radians(top))
+
+        heap = []
+        for ring in range(max(row_span, column_span) + 1):
+            for row, column in self._ring(row0, column0, ring, row_span, column_span):
+                for key, (point_lat, point_lon) in self._cells.get((row, column), {}).items():
+                    distance = haversine_km(lat, lon, point_lat, point_lon)
+                    if distance <= radius_km:
+                        heapq.heappush(heap, (distance, key))
+            # Every point in the rings still to visit is at least this far
+            gap = math.radians(ring * self.cell)
+            bound = EARTH_RADIUS_KM * min(gap, 2 * math.asin(min(1.0, top_cos * math.sin(gap / 2))))
+            while heap and heap[0][0] <= bound:
+                yield heapq.heappop(heap)
+            if bound > radius_km:
+                break
+        while heap:
+            yield heapq.heappop(heap)
+
+    def _ring(self, row0, column0, ring, row_span, column_span):
+        """Cells at Chebyshev distance ``ring`` from the centre, within the spans."""
+        columns = range(-min(ring, column_span), min(ring, column_span) + 1)
+        seen = set()
+        for delta_row in range(-min(ring, row_span), min(ring, row_span) + 1):
+            if abs(delta_row) == ring:
+                deltas = columns
+            elif ring <= column_span:
+                deltas = (-ring, ring)
+            else:
+                continue
+            for delta_column in deltas:
+                cell = (row0 + delta_row, (column0 + delta_column) % self.columns)
+                if cell not in seen:  # columns wrap around the antimeridian
+                    seen.add(cell)
+                    yield cell
+
+
+_lock = threading.RLock()
+_index = None
+_index_version = None  # catalog version the grid was built at
+
+
+def _get_index():
+    """The grid, rebuilt (outside the lock) if it is missing or outdated."""
+    global _index, _index_version
+    version = caching.catalog_version()
+    with _lock:
+        if _index is not None and _index_version == version:
+            return _index
+    index = GridIndex()
+    rows = Parking.objects.using(PRIMARY).filter(
+        latitude__isnull=False, longitude__isnull=False
+    ).values_list('parking_id', 'latitude', 'longitude')
+    for parking_id, lat, lon in rows:
+        index.add(parking_id, lat, lon)
+    with _lock:
+        _index, _index_version = index, version
+    return index
+
+
+def nearest(lat, lon, radius_km, count):
+    """Up to ``count`` ``(distance_km, parking_id)`` within ``radius_km``, nearest first."""
+    index = _get_index()
+    with _lock:
+        results = []
+        for item in index.nearest(lat, lon, radius_km):
+            results.append(item)
+            if len(results) >= count:
+                break
+        return results
+
+
+def nearest_available(lat, lon, radius_km, start, end=None, limit=10):
+    """
+    The ``limit`` nearest parkings within ``radius_km`` with a free spot for
+    ``[start, end)`` (or at ``start``), as ``(parking, distance_km, free)``.
+    Candidates are checked in growing batches, each costing one parking
+    query and at most one booking query.
+    """
+    results = []
+    checked = 0
+    count = limit * 4
+    while True:
+        candidates = nearest(lat, lon, radius_km, count)
+        batch = candidates[checked:]
+        parkings = Parking.objects.in_bulk([parking_id for _, parking_id in batch])
+        versions = availability.preload(parkings)
+        for distance, parking_id in batch:
+            parking = parkings.get(parking_id)
+            if parking is None:  # deleted since the index was read
+                continue
+            free = availability.free_spots(parking, start, end, version=versions[parking_id])
+            if free:
+                results.append((parking, distance, free))
+                if len(results) == limit:
+                    return results
+        if len(candidates) < count:
+            return results
+        checked = len(candidates)
+        count *= 4
+
+
+def record_parking(parking_id, lat, lon):
+    """Sync a created or updated parking into the loaded grid."""
+    with _lock:
+        if _index is None:
+            return
+        if lat is None or lon is None:
+            _index.remove(parking_id)
+        else:
+            _index.add(parking_id, lat, lon)
+
+
+def discard_parking(parking_id):
+    with _lock:
+        if _index is not None:
+            _index.remove(parking_id)
+
+
+def reset():
+    """Drop the grid; it is rebuilt from the database on demand."""
+    global _index, _index_version
+    with _lock:
+        _index = _index_version = None
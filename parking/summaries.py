@@ -0,0 +1,316 @@
+"""
+Per-user booking summaries for the dashboard.
+
+``UserBookingSummary`` holds, per user, the booking totals (count, booked
+time, spend at the parking's hourly ``price``) and the first
+``UPCOMING_LIMIT`` bookings that had not ended when the row was written,
+in start order. ``read()`` answers from that one row: bookings that have
+ended since are dropped, the ones under way are reported as active.
+
+The booking signals apply every write to the owner's row in the same
+transaction, under the row's lock; inside ``batch()`` the writes of the
+block are applied at its end (the bulk endpoints). A missing row is built
+from the user's bookings on the first write; migration 0018 built the rows
+of the users who had bookings before, so a user without one has none.
+When a write leaves a list short of the upcoming bookings it had to leave
+out, it queues a ``summaries.refresh`` job to rebuild the row;
+``rebuild_summaries --stale`` (run periodically) does the same for the
+lists that ran short as their bookings ended. Reads never write and never
+look at the bookings.
+"""
+from collections import defaultdict
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from django.db import IntegrityError, transaction
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+from rest_framework import serializers
+
+from . import jobs
+from .models import ArchivedBooking, Booking, Job, Parking, User, UserBookingSummary
+from .routers import PRIMARY
+
+UPCOMING_LIMIT = 10  # upcoming bookings kept per user
+REBUILD_CHUNK = 500  # users rebuilt per query
+_FIELDS = ['total_bookings', 'booked_seconds', 'total_spent', 'upcoming', 'upcoming_truncated']
+
+_batch = ContextVar('parkmate_summaries_batch', default=None)
+_datetime_field = serializers.DateTimeField()
+
+
+class _Changes:
+    """Booking writes of one or more users, in order, per database."""
+
+    def __init__(self):
+        self.users = defaultdict(list)  # user_id -> [(sign, booking_id, parking_id, start, end, price)]
+
+    def add(self, user_id, booking_id, interval, sign, price=None):
+        parking_id, start_time, end_time = interval
+        self.users[user_id].append((sign, booking_id, parking_id, start_time, end_time, price))
+
+
+def _item(booking_id, parking_id, start_time, end_time):
+    # Times as the booking endpoints render them
+    return {
+        'booking_id': booking_id,
+        'parking_id': parking_id,
+        'start_time': _datetime_field.to_representation(start_time),
+        'end_time': _datetime_field.to_representation(end_time),
+    }
+
+
+def _key(item):
+    return parse_datetime(item['start_time']), item['booking_id']
+
+
+def _ended(item, now):
+    return parse_datetime(item['end_time']) <= now
+
+
+def _fill(summary, rows, now):
+    """Set ``summary`` from all of its user's ``(booking_id, parking_id, start, end, price)`` rows."""
+    summary.total_bookings = len(rows)
+    summary.booked_seconds = summary.total_spent = 0
+    upcoming = []
+    for booking_id, parking_id, start_time, end_time, price in rows:
+        seconds = int((end_time - start_time).total_seconds())
+        summary.booked_seconds += seconds
+        summary.total_spent += seconds * price / 3600
+        if end_time > now:
+            upcoming.append((start_time, booking_id, parking_id, end_time))
+    upcoming.sort()
+    summary.upcoming = [
+        _item(booking_id, parking_id, start_time, end_time)
+        for start_time, booking_id, parking_id, end_time in upcoming[:UPCOMING_LIMIT]
+    ]
+    summary.upcoming_truncated = len(upcoming) > UPCOMING_LIMIT
+
+
+def _rows(user_ids, using):
+    rows = defaultdict(list)
+    # Archived bookings count in the totals like the others
+    for model in (Booking, ArchivedBooking):
+        bookings = model.objects.using(using).filter(user_id__in=user_ids).values_list(
+            'user_id', 'booking_id', 'parking_id', 'start_time', 'end_time', 'parking_id__price'
+        )
+        for user_id, *row in bookings:
+            rows[user_id].append(row)
+    return rows
+
+
+def _record(using, user_id, booking_id, interval, sign, price=None):
+    pending = _batch.get()
+    if pending is not None:
+        pending[using].add(user_id, booking_id, interval, sign, price)
+        return
+    changes = _Changes()
+    changes.add(user_id, booking_id, interval, sign, price)
+    _apply(changes, using)
+
+
+@contextmanager
+def batch():
+    """Apply the summary changes of the block when it exits."""
+    if _batch.get() is not None:
+        yield
+        return
+    pending = defaultdict(_Changes)
+    token = _batch.set(pending)
+    try:
+        yield
+    finally:
+        _batch.reset(token)
+    for using, changes in pending.items():
+        _apply(changes, using)
+
+
+def booking_saved(instance, using, stored, current):
+    """
+    Move a created or updated booking in its owner's summary (called by the
+    signals) from its ``stored`` interval to the ``current`` one.
+    """
+    if stored == current:
+        return
+    # The parking is usually at hand (loaded by the reservation)
+    parking = instance._meta.get_field('parking_id').get_cached_value(instance, None)
+    price = getattr(parking, 'price', None)
+    with batch():
+        if stored is not None:
+            _record(using, instance.user_id_id, instance.booking_id, stored, -1, price if stored[0] == current[0] else None)
+        _record(using, instance.user_id_id, instance.booking_id, current, 1, price)
+
+
+def booking_deleted(instance, using, stored):
+    parking = instance._meta.get_field('parking_id').get_cached_value(instance, None)
+    _record(using, instance.user_id_id, instance.booking_id, stored, -1, getattr(parking, 'price', None))
+
+
+def _change(summary, sign, booking_id, parking_id, start_time, end_time, price, now):
+    seconds = int((end_time - start_time).total_seconds())
+    summary.total_bookings += sign
+    summary.booked_seconds += sign * seconds
+    summary.total_spent += sign * seconds * price / 3600
+    upcoming = [item for item in summary.upcoming if item['booking_id'] != booking_id and not _ended(item, now)]
+    if sign > 0 and end_time > now:
+        item = _item(booking_id, parking_id, start_time, end_time)
+        # Bookings left out of a truncated list all start after its last one
+        if not summary.upcoming_truncated or (upcoming and _key(item) < _key(upcoming[-1])):
+            upcoming.append(item)
+            upcoming.sort(key=_key)
+            if len(upcoming) > UPCOMING_LIMIT:
+                upcoming.pop()
+                summary.upcoming_truncated = True
+    summary.upcoming = upcoming
+
+
+def _create(user_id, using, now):
+    """Build the missing summary of ``user_id``; None when another transaction created it first."""
+    summary = UserBookingSummary(user_id_id=user_id)
+    _fill(summary, _rows([user_id], using)[user_id], now)
+    try:
+        with transaction.atomic(using=using):
+            summary.save(using=using, force_insert=True)
+    except IntegrityError:
+        return None
+    return summary
+
+
+def _apply(changes, using):
+    now = timezone.now()
+    # Part of the booking write's transaction when there is one
+    with transaction.atomic(using=using, savepoint=False):
+        summaries = UserBookingSummary.objects.using(using).select_for_update()
+        locked = {summary.user_id_id: summary for summary in summaries.filter(user_id__in=list(changes.users))}
+        changed = []
+        for user_id, writes in changes.users.items():
+            summary = locked.get(user_id)
+            if summary is None:
+                # Removals from a missing summary (a user being deleted) have
+                # nothing to undo; a built one already counts these writes
+                if not any(sign > 0 for sign, *_ in writes) or _create(user_id, using, now) is not None:
+                    continue
+                summary = summaries.get(user_id=user_id)
+            changed.append((summary, writes))
+        prices = {}
+        missing = {write[2] for _, writes in changed for write in writes if write[5] is None}
+        if missing:
+            prices.update(Parking.objects.using(using).filter(parking_id__in=missing).values_list('parking_id', 'price'))
+        for summary, writes in changed:
+            for sign, booking_id, parking_id, start_time, end_time, price in writes:
+                if price is None:
+                    price = prices.get(parking_id, 0)
+                _change(summary, sign, booking_id, parking_id, start_time, end_time, price, now)
+        if len(changed) == 1:
+            # A plain UPDATE; bulk_update builds a CASE per column
+            changed[0][0].save(using=using, update_fields=_FIELDS)
+        elif changed:
+            UserBookingSummary.objects.using(using).bulk_update([summary for summary, _ in changed], _FIELDS)
+        # Rebuilt off the request path, in this transaction's job
+        for summary, _ in changed:
+            if _needs_refresh(summary, now):
+                _queue_refresh(summary.user_id_id, using)
+
+
+def _needs_refresh(summary, now):
+    # The left-out bookings come next, so the list is only short once most
+    # of it has ended
+    if not summary.upcoming_truncated:
+        return False
+    return sum(not _ended(item, now) for item in summary.upcoming) < UPCOMING_LIMIT // 2
+
+
+def refresh(user_id, using=PRIMARY):
+    """Rebuild the summary of ``user_id`` from the bookings (``User.DoesNotExist`` if none)."""
+    now = timezone.now()
+    with transaction.atomic(using=using):
+        summary = UserBookingSummary.objects.using(using).select_for_update().filter(user_id=user_id).first()
+        if summary is None:
+            if not User.objects.using(using).filter(id=user_id).exists():
+                raise User.DoesNotExist(f'User {user_id} does not exist')
+            return _create(user_id, using, now) or UserBookingSummary.objects.using(using).get(user_id=user_id)
+        _fill(summary, _rows([user_id], using)[user_id], now)
+        summary.save(using=using, update_fields=_FIELDS)
+        return summary
+
+
+@jobs.register('summaries.refresh')
+def _refresh_job(user_id):
+    try:
+        refresh(user_id)
+    except User.DoesNotExist:  # deleted since
+        pass
+
+
+def _queue_refresh(user_id, using=PRIMARY):
+    payload = {'user_id': user_id}
+    # A running job takes the row's lock, so it also sees the write that queues this one
+    queued = Job.objects.using(using).filter(name='summaries.refresh', payload=payload, status__in=('pending', 'running'))
+    if not queued.exists():
+        jobs.enqueue('summaries.refresh', payload, using=using)
+
+
+def refresh_stale(using=PRIMARY):
+    """
+    Queue a rebuild of the summaries whose list has run short of the
+    upcoming bookings it left out. Returns the number of summaries queued.
+    """
+    now = timezone.now()
+    truncated = UserBookingSummary.objects.using(using).filter(upcoming_truncated=True).only('upcoming', 'upcoming_truncated')
+    stale = [summary.user_id_id for summary in truncated if _needs_refresh(summary, now)]
+    for user_id in stale:
+        _queue_refresh(user_id, using)
+    return len(stale)
+
+
+def rebuild(user_ids=None, using=PRIMARY):
+    """
+    Rebuild the summaries of ``user_ids`` (every user when None) from the
+    bookings. Returns the number of summaries written.
+    """
+    users = User.objects.using(using).order_by('id')
+    if user_ids is not None:
+        users = users.filter(id__in=user_ids)
+    ids = list(users.values_list('id', flat=True))
+    now = timezone.now()
+    for offset in range(0, len(ids), REBUILD_CHUNK):
+        chunk = ids[offset:offset + REBUILD_CHUNK]
+        with transaction.atomic(using=using):
+            UserBookingSummary.objects.using(using).filter(user_id__in=chunk).delete()
+            rows = _rows(chunk, using)
+            summaries = []
+            for user_id in chunk:
+                summary = UserBookingSummary(user_id_id=user_id)
+                _fill(summary, rows[user_id], now)
+                summaries.append(summary)
+            UserBookingSummary.objects.using(using).bulk_create(summaries, batch_size=1000)
+    return len(ids)
+
+
+def read(user_id):
+    """
+    The dashboard summary of ``user_id``: totals and its active and
+    upcoming bookings. Raises ``User.DoesNotExist``.
+    """
+    now = timezone.now()
+    summary = UserBookingSummary.objects.filter(user_id=user_id).first()
+    if summary is None:
+        # The first booking write builds the row, so the user has no bookings
+        if not User.objects.filter(id=user_id).exists():
+            raise User.DoesNotExist(f'User {user_id} does not exist')
+        summary = UserBookingSummary(user_id_id=user_id)
+    active, upcoming = [], []
+    for item in summary.upcoming:
+        if _ended(item, now):
+            continue
+        (active if parse_datetime(item['start_time']) <= now else upcoming).append(item)
+    return {
+        'user_id': user_id,
+        'total_bookings': summary.total_bookings,
+        'booked_hours': round(summary.booked_seconds / 3600, 2),
+        'total_spent': round(summary.total_spent, 2),
+        'active': active,
+        'upcoming': upcoming,
+        'more_upcoming': summary.upcoming_truncated,
+        'as_of': now,
+    }
@@ -1,3 +1,1313 @@
-from django.test import TestCase
+import base64
+import csv
+import io
+import json
+import os
+import tempfile
+from datetime import date, datetime, timedelta, timezone as dt_timezone
+from decimal import Decimal
+from importlib import import_module
+from unittest import mock, skipUnless
 
-# Create your tests here.
+from asgiref.sync import sync_to_async
+from django.apps import apps as django_apps
+from django.contrib.auth.hashers import PBKDF2SHA1PasswordHasher, check_password
+from django.core.cache import cache
+from django.core.management import CommandError, call_command
+from django.db import connection
+from django.test import SimpleTestCase, TestCase, override_settings
+from django.utils import timezone
+from django.utils.translation import gettext_lazy
+from rest_framework.renderers import JSONRenderer
+
+from . import analytics, archive, availability, caching, exports, hashing, jobs, metrics, renderers, reservations, search, spatial, summaries
+from .authentication import user_cache
+from .tokens import issue_token, revocations
+from .models import ArchivedBooking, Booking, Job, OccupancyBucket, Parking, RevokedToken, User, UserBookingSummary
+from .routers import ReplicaRouter, pin_to_primary, request_scope
+from .queryinspector import QueryBudgetExceeded, fingerprint, query_budget
+from .serializers import BookingSerializer
+
+
+class BookingListTests(TestCase):
+    def setUp(self):
+        user_cache.clear()
+        self.admin = User.objects.create_user(
+            email='admin@parkmate.test', password='password123',
+            first_name='Admin', last_name='User', is_admin=True,
+        )
+        self.parking = Parking.objects.create(amount_of_spots=100, address='1 Main Street', price=10)
+
+    def create_bookings(self, count):
+        start = timezone.now() + timedelta(days=1)
+        for n in range(count):
+            user = User.objects.create(
+                email=f'driver{Booking.objects.count()}@parkmate.test',
+                first_name='Driver', last_name=str(n),
+            )
+            Booking.objects.create(
+                parking_id=self.parking, user_id=user,
+                start_time=start + timedelta(hours=n), end_time=start + timedelta(hours=n + 1),
+            )
+
+    def list_bookings(self):
+        return self.client.get('/api/parkmate/bookings/', HTTP_X_USER_ID=str(self.admin.id))
+
+    def test_listing_matches_booking_serializer(self):
+        self.create_bookings(3)
+        response = self.list_bookings()
+        self.assertEqual(response.status_code, 200)
+        expected = BookingSerializer(Booking.objects.all(), many=True).data
+        self.assertEqual(response.json(), [dict(item) for item in expected])
+
+    def test_listing_query_count_is_constant(self):
+        self.create_bookings(2)
+        with self.assertNumQueries(2):  # authenticated user + joined bookings
+            self.list_bookings()
+        self.create_bookings(20)
+        with self.assertNumQueries(1):  # the caller now comes from the user cache
+            self.list_bookings()
+
+
+class AvailabilityTests(TestCase):
+    def setUp(self):
+        availability.reset()
+        user_cache.clear()
+        self.user = User.objects.create(email='driver@parkmate.test')
+        self.parking = Parking.objects.create(amount_of_spots=2, address='1 Main Street', price=10)
+        self.start = timezone.now().replace(microsecond=0) + timedelta(days=1)
+
+    def book(self, hours, offset=0):
+        return Booking.objects.create(
+            parking_id=self.parking, user_id=self.user,
+            start_time=self.start + timedelta(hours=offset), end_time=self.start + timedelta(hours=offset + hours),
+        )
+
+    def test_segment_tree_range_add_and_max(self):
+        tree = availability._SegmentTree([0, 2, 1, 3, 0])
+        self.assertEqual(tree.max(0, 4), 3)
+        self.assertEqual(tree.max(0, 2), 2)
+        tree.add(0, 2, 2)
+        self.assertEqual(tree.max(0, 2), 4)
+        self.assertEqual(tree.max(2, 2), 3)
+        tree.add(1, 3, -1)
+        self.assertEqual([tree.max(leaf, leaf) for leaf in range(5)], [2, 3, 2, 2, 0])
+        self.assertEqual(tree.max(3, 2), 0)
+
+    def test_index_across_pending_intervals_and_rebuilds(self):
+        index = availability.ParkingOccupancy([(0, 0, 10)])
+        # New boundaries wait as pending intervals until the tree is rebuilt
+        for booking_id in range(1, 3 * availability.MIN_PENDING):
+            index.add(booking_id, booking_id, booking_id + 10)
+        self.assertEqual(index.occupancy_at(5), 6)
+        self.assertEqual(index.peak_occupancy(0, 1000), 10)
+        self.assertEqual(index.peak_occupancy(-5, 0.5), 1)
+        self.assertEqual(index.peak_occupancy(200, 300), 0)
+        for booking_id in range(0, 3 * availability.MIN_PENDING, 2):
+            index.remove(booking_id)
+        self.assertEqual(index.peak_occupancy(0, 1000), 5)
+        index.add(1, 50, 51.5)
+        self.assertEqual(index.occupancy_at(51), 6)
+
+    def test_index_drops_ended_intervals(self):
+        now = timezone.now().timestamp()
+        index = availability.ParkingOccupancy([(1, now - 7200, now - 3600 * 1.5), (2, now - 60, now + 60)], horizon=now - 3600)
+        self.assertNotIn(1, index)
+        index.add(3, now - 9000, now - 8000)
+        self.assertEqual(len(index), 1)
+
+    def test_endpoint(self):
+        self.book(2)
+        self.book(1, offset=1)
+        url = f'/api/parkmate/parking/{self.parking.parking_id}/availability/'
+        window = {'from': self.start.isoformat(), 'to': (self.start + timedelta(hours=3)).isoformat()}
+        response = self.client.get(url, window)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual((response.json()['occupied_spots'], response.json()['free_spots']), (2, 0))
+        moment = (self.start + timedelta(minutes=30)).isoformat()
+        self.assertEqual(self.client.get(url, {'from': moment}).json()['free_spots'], 1)
+        self.assertEqual(self.client.get(url, {'from': 'soon'}).status_code, 400)
+        self.assertEqual(self.client.get(url, {'from': window['to'], 'to': window['from']}).status_code, 400)
+        self.assertEqual(self.client.get('/api/parkmate/parking/999/availability/').status_code, 404)
+
+    def test_moments_before_the_horizon_come_from_the_database(self):
+        self.start -= timedelta(days=3)
+        self.book(2)
+        url = f'/api/parkmate/parking/{self.parking.parking_id}/availability/'
+        self.assertEqual(self.client.get(url, {'from': self.start.isoformat()}).json()['occupied_spots'], 1)
+        self.assertEqual(len(availability._indexes[self.parking.parking_id]), 0)
+
+    def test_index_follows_writes_of_other_workers(self):
+        parking_id = self.parking.parking_id
+        self.book(1)
+        self.assertEqual(availability.occupancy_at(parking_id, self.start), 1)
+        # Written by another worker: no signal here, only the shared version it bumps
+        Booking.objects.bulk_create([Booking(
+            parking_id=self.parking, user_id=self.user, start_time=self.start, end_time=self.start + timedelta(hours=1),
+        )])
+        caching.bump_availability(parking_id)
+        self.assertEqual(availability.occupancy_at(parking_id, self.start), 2)
+
+        # Writes of this worker update the loaded index in place
+        with self.captureOnCommitCallbacks(execute=True):
+            booking = self.book(1)
+        with self.assertNumQueries(0):
+            self.assertEqual(availability.occupancy_at(parking_id, self.start), 3)
+        with self.captureOnCommitCallbacks(execute=True):
+            booking.delete()
+        with self.assertNumQueries(0):
+            self.assertEqual(availability.occupancy_at(parking_id, self.start), 2)
+
+    @override_settings(PARKMATE_AVAILABILITY_MAX_PARKINGS=1)
+    def test_least_recently_used_index_is_evicted(self):
+        other = Parking.objects.create(amount_of_spots=1, address='2 Main Street', price=10)
+        availability.occupancy_at(self.parking.parking_id, self.start)
+        availability.occupancy_at(other.parking_id, self.start)
+        self.assertEqual(list(availability._indexes), [other.parking_id])
+
+    def test_booking_over_capacity_is_rejected(self):
+        item = {
+            'parking_id': self.parking.parking_id,
+            'start_time': self.start.isoformat(),
+            'end_time': (self.start + timedelta(hours=1)).isoformat(),
+        }
+        for expected in (201, 201, 400):
+            response = self.client.post(
+                '/api/parkmate/bookings/', item, content_type='application/json', HTTP_X_USER_ID=str(self.user.id),
+            )
+            self.assertEqual(response.status_code, expected)
+        self.assertEqual(response.json(), {'parking_id': ['No free spots for the requested time']})
+        self.assertEqual(Booking.objects.count(), 2)
+
+
+class IdAllocationTests(TestCase):
+    def setUp(self):
+        user_cache.clear()
+        self.user = User.objects.create(email='driver@parkmate.test')
+
+    def post(self, path, data):
+        return self.client.post(path, data, content_type='application/json', HTTP_X_USER_ID=str(self.user.id))
+
+    def test_database_assigns_parking_and_booking_ids(self):
+        parkings = [
+            self.post('/api/parkmate/parking/', {'amount_of_spots': 5, 'address': f'{n} Main Street', 'price': 3})
+            for n in range(2)
+        ]
+        self.assertEqual([response.status_code for response in parkings], [201, 201])
+        first, second = (response.json()['parking_id'] for response in parkings)
+        self.assertIsInstance(first, int)
+        self.assertGreater(second, first)
+        # A client-supplied id is ignored
+        response = self.post('/api/parkmate/parking/', {
+            'parking_id': first, 'amount_of_spots': 5, 'address': '3 Main Street', 'price': 3,
+        })
+        self.assertNotIn(response.json()['parking_id'], (first, second))
+        self.assertEqual(Parking.objects.count(), 3)
+
+        bookings = [
+            self.post('/api/parkmate/bookings/', {
+                'parking_id': first, 'start_time': f'2030-01-01T1{n}:00:00Z', 'end_time': f'2030-01-01T1{n}:30:00Z',
+            })
+            for n in range(2)
+        ]
+        self.assertEqual([response.status_code for response in bookings], [201, 201])
+        ids = [response.json()['booking_id'] for response in bookings]
+        self.assertEqual(sorted(Booking.objects.values_list('booking_id', flat=True)), ids)
+
+
+class ReservationTests(TestCase):
+    def setUp(self):
+        user_cache.clear()
+        self.user = User.objects.create(email='driver@parkmate.test')
+        self.parking = Parking.objects.create(amount_of_spots=1, address='1 Main Street', price=10)
+        self.start = datetime(2030, 1, 1, 10, tzinfo=dt_timezone.utc)
+        self.booking = Booking.objects.create(
+            parking_id=self.parking, user_id=self.user, start_time=self.start, end_time=self.start + timedelta(hours=2),
+        )
+
+    def put(self, booking, data):
+        return self.client.put(
+            f'/api/parkmate/bookings/{booking.booking_id}/update/', data,
+            content_type='application/json', HTTP_X_USER_ID=str(self.user.id),
+        )
+
+    def test_full_parking_is_rejected(self):
+        reservations.reset_stats()
+        window = (self.start + timedelta(hours=1), self.start + timedelta(hours=3))
+        with self.assertRaises(reservations.SpotsUnavailable):
+            with reservations.reservation(self.parking.parking_id, *window):
+                pass
+        with reservations.reservation(self.parking.parking_id, *window, exclude=self.booking.booking_id) as parking:
+            self.assertEqual(parking, self.parking)
+        self.assertEqual((reservations.stats()['rejected'], reservations.stats()['commits']), (1, 1))
+        with self.assertRaises(Parking.DoesNotExist):
+            with reservations.reservation(999, *window):
+                pass
+
+    def test_update_excludes_the_booking_itself(self):
+        response = self.put(self.booking, {
+            'start_time': (self.start + timedelta(hours=1)).isoformat(),
+            'end_time': (self.start + timedelta(hours=3)).isoformat(),
+        })
+        self.assertEqual(response.status_code, 200)
+        other = Booking.objects.create(
+            parking_id=self.parking, user_id=self.user,
+            start_time=self.start + timedelta(hours=4), end_time=self.start + timedelta(hours=5),
+        )
+        response = self.put(other, {'start_time': (self.start + timedelta(hours=2)).isoformat()})
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.json(), {'parking_id': ['No free spots for the requested time']})
+        other.refresh_from_db()
+        self.assertEqual(other.start_time, self.start + timedelta(hours=4))
+
+    def test_missing_parking_is_a_400(self):
+        response = self.client.post('/api/parkmate/bookings/', {
+            'parking_id': 999, 'start_time': '2030-01-02T10:00:00Z', 'end_time': '2030-01-02T11:00:00Z',
+        }, content_type='application/json', HTTP_X_USER_ID=str(self.user.id))
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.json(), {'parking_id': ['Parking does not exist']})
+        response = self.put(self.booking, {'parking_id': 999})
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.json(), {'parking_id': ['Parking does not exist']})
+
+
+class ListQueryTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        user_cache.clear()
+        self.admin = User.objects.create(email='admin@parkmate.test', is_admin=True)
+        self.parkings = [
+            Parking.objects.create(amount_of_spots=5, address=f'{n} Main Street', price=n) for n in range(5)
+        ]
+        start = datetime(2030, 1, 1, tzinfo=dt_timezone.utc)
+        # Start times in the reverse order of the ids
+        self.bookings = [
+            Booking.objects.create(
+                parking_id=self.parkings[n % 2], user_id=self.admin,
+                start_time=start + timedelta(hours=5 - n), end_time=start + timedelta(hours=6 - n),
+            )
+            for n in range(5)
+        ]
+
+    def get(self, path, **params):
+        return self.client.get(path, params, HTTP_X_USER_ID=str(self.admin.id))
+
+    def pages(self, path, key, **params):
+        """Every ``key`` value of a paginated list, following the cursors."""
+        values = []
+        response = self.get(path, limit=2, **params).json()
+        while True:
+            values += [item[key] for item in response['results']]
+            if response['next'] is None:
+                return values
+            response = self.get(path, limit=2, cursor=response['next'], **params).json()
+
+    def cursor(self, *payload):
+        return base64.urlsafe_b64encode(json.dumps(list(payload)).encode()).decode().rstrip('=')
+
+    def test_keyset_pages(self):
+        parking_ids = [parking.parking_id for parking in self.parkings]
+        self.assertEqual(self.pages('/api/parkmate/parking/', 'parking_id'), parking_ids)
+        booking_ids = [booking.booking_id for booking in self.bookings]
+        self.assertEqual(self.pages('/api/parkmate/bookings/', 'booking_id'), booking_ids)
+        self.assertEqual(self.pages('/api/parkmate/bookings/', 'booking_id', ordering='start_time'), booking_ids[::-1])
+        self.assertEqual(self.pages('/api/parkmate/bookings/', 'booking_id', ordering='-booking_id'), booking_ids[::-1])
+        # Without limit or cursor the list is not paginated
+        self.assertEqual(len(self.get('/api/parkmate/bookings/').json()), 5)
+
+    def test_invalid_cursors_are_rejected(self):
+        cursors = [
+            'not a cursor',
+            self.cursor('booking_id', ['abc']),
+            self.cursor('booking_id', [None]),
+            self.cursor('booking_id', [{}]),
+            self.cursor('booking_id', [True]),
+            self.cursor('booking_id', [10 ** 30]),
+            self.cursor('booking_id', [1, 2]),
+            self.cursor('start_time', ['yesterday', 1]),
+            self.cursor('start_time', ['2030-13-45T00:00:00Z', 1]),
+            self.cursor('unknown', [1]),
+        ]
+        for cursor in cursors:
+            response = self.get('/api/parkmate/bookings/', cursor=cursor)
+            self.assertEqual(response.status_code, 400, cursor)
+            self.assertEqual(response.json(), {'error': 'Invalid cursor'})
+        self.assertEqual(self.get('/api/parkmate/parking/', cursor=self.cursor('parking_id', ['abc'])).status_code, 400)
+        self.assertEqual(self.get('/api/parkmate/bookings/', limit='many').status_code, 400)
+        self.assertEqual(self.get('/api/parkmate/bookings/', ordering='price').status_code, 400)
+
+    def test_sparse_fields(self):
+        response = self.get('/api/parkmate/parking/', fields='address,price')
+        self.assertEqual(response.json()[0], {'address': '0 Main Street', 'price': 0})
+        # The page key is dropped from the rows unless requested
+        response = self.get('/api/parkmate/bookings/', fields='start_time', limit=1)
+        self.assertEqual(list(response.json()['results'][0]), ['start_time'])
+        self.assertIsNotNone(response.json()['next'])
+        response = self.get('/api/parkmate/bookings/', fields='start_time,password')
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.json(), {'error': 'Unknown fields: password'})
+
+    def test_filters(self):
+        def booking_ids(**params):
+            return [item['booking_id'] for item in self.get('/api/parkmate/bookings/', fields='booking_id', **params).json()]
+
+        ids = [booking.booking_id for booking in self.bookings]
+        self.assertEqual(booking_ids(parking_id=self.parkings[1].parking_id), [ids[1], ids[3]])
+        self.assertEqual(booking_ids(**{'from': '2030-01-01T03:30:00Z'}), ids[:3])
+        self.assertEqual(booking_ids(to='2030-01-01T02:00:00Z'), ids[4:])
+        for params in ({'parking_id': 'abc'}, {'parking_id': str(10 ** 30)}, {'from': 'soon'}, {'to': 'later'}):
+            self.assertEqual(self.get('/api/parkmate/bookings/', **params).status_code, 400, params)
+
+
+class BookingExportTests(TestCase):
+    def setUp(self):
+        user_cache.clear()
+        self.admin = User.objects.create(email='admin@parkmate.test', first_name='Ada', last_name='Min', is_admin=True)
+        self.parkings = [
+            Parking.objects.create(amount_of_spots=5, address=f'{n} Main Street, "Centre"', price=10) for n in range(2)
+        ]
+        start = datetime(2030, 1, 1, tzinfo=dt_timezone.utc)
+        for n in range(4):
+            Booking.objects.create(
+                parking_id=self.parkings[n % 2], user_id=self.admin,
+                start_time=start + timedelta(hours=n), end_time=start + timedelta(hours=n + 1),
+            )
+
+    def export(self, **params):
+        return self.client.get('/api/parkmate/bookings/export/', params, HTTP_X_USER_ID=str(self.admin.id))
+
+    def content(self, response):
+        return b''.join(response.streaming_content).decode()
+
+    def expected(self, bookings=None):
+        bookings = Booking.objects.order_by('booking_id') if bookings is None else bookings
+        return [dict(item) for item in BookingSerializer(bookings, many=True).data]
+
+    def test_ndjson_rows_match_the_serializer(self):
+        response = self.export()
+        self.assertEqual(response['Content-Type'], 'application/x-ndjson')
+        rows = [json.loads(line) for line in self.content(response).splitlines()]
+        self.assertEqual(rows, self.expected())
+
+    def test_csv(self):
+        response = self.export(output='csv')
+        self.assertEqual(response['Content-Type'], 'text/csv')
+        rows = list(csv.DictReader(io.StringIO(self.content(response))))
+        self.assertEqual(len(rows), 4)
+        for row, booking in zip(rows, self.expected()):
+            self.assertEqual(row['booking_id'], str(booking['booking_id']))
+            self.assertEqual(row['start_time'], booking['start_time'])
+            self.assertEqual(row['parking_address'], booking['parking']['address'])
+            self.assertEqual(row['user_email'], booking['user']['email'])
+
+    def test_filters_and_errors(self):
+        parking = self.parkings[1]
+        response = self.export(parking_id=parking.parking_id, **{'from': '2030-01-01T02:00:00Z'})
+        rows = [json.loads(line) for line in self.content(response).splitlines()]
+        self.assertEqual(rows, self.expected(Booking.objects.filter(parking_id=parking, end_time__gt='2030-01-01T02:00:00Z')))
+        self.assertEqual(len(rows), 1)
+        self.assertEqual(self.export(output='xml').status_code, 400)
+        self.assertEqual(self.export(parking_id='abc').status_code, 400)
+        other = User.objects.create(email='driver@parkmate.test')
+        response = self.client.get('/api/parkmate/bookings/export/', HTTP_X_USER_ID=str(other.id))
+        self.assertEqual(response.status_code, 403)
+
+    @override_settings(ROOT_URLCONF='config.asgi_urls')
+    async def test_export_streams_under_asgi(self):
+        url = '/api/parkmate/bookings/export/'
+        response = await self.async_client.get(url, headers={'X-User-Id': str(self.admin.id)})
+        # A sync iterator would be read into a list before the first part is sent
+        self.assertTrue(response.is_async)
+        content = b''.join([part async for part in response.streaming_content]).decode()
+        self.assertEqual([json.loads(line) for line in content.splitlines()], await sync_to_async(self.expected)())
+        parts = [part async for part in exports.aexport_bookings(Booking.objects.all(), 'csv', chunk_size=2)]
+        self.assertEqual([part.count('\n') for part in parts], [2, 2, 1])
+
+        response = await self.async_client.get(url, {'output': 'xml'}, headers={'X-User-Id': str(self.admin.id)})
+        self.assertEqual(response.status_code, 400)
+        other = await User.objects.acreate(email='driver@parkmate.test')
+        self.assertEqual((await self.async_client.get(url, headers={'X-User-Id': str(other.id)})).status_code, 403)
+        self.assertEqual((await self.async_client.get(url)).status_code, 401)
+
+    def test_command(self):
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'bookings.csv')
+            call_command(
+                'export_bookings', '--output-format', 'csv', '-o', path, '--chunk-size', '1',
+                '--parking-id', str(self.parkings[0].parking_id),
+            )
+            with open(path, newline='', encoding='utf-8') as output:
+                rows = list(csv.DictReader(output))
+        self.assertEqual([row['parking_id'] for row in rows], [str(self.parkings[0].parking_id)] * 2)
+        with self.assertRaises(CommandError):
+            call_command('export_bookings', '--from', 'soon')
+
+
+class AuthenticationTests(TestCase):
+    def setUp(self):
+        user_cache.clear()
+        self.user = User.objects.create(email='driver@parkmate.test', first_name='Driver', last_name='One')
+
+    def get_user(self, user_id, **headers):
+        return self.client.get(f'/api/parkmate/users/{user_id}/', **headers)
+
+    def test_repeat_caller_costs_no_auth_query(self):
+        self.get_user(self.user.id, HTTP_X_USER_ID=str(self.user.id))
+        with self.assertNumQueries(1):  # only the looked-up user
+            response = self.get_user(self.user.id, HTTP_X_USER_ID=str(self.user.id))
+        self.assertEqual(response.status_code, 200)
+
+    def test_cache_is_invalidated_on_save(self):
+        other = User.objects.create(email='other@parkmate.test')
+        self.get_user(other.id, HTTP_X_USER_ID=str(self.user.id))
+        self.assertEqual(self.get_user(other.id, HTTP_X_USER_ID=str(self.user.id)).status_code, 403)
+        self.user.is_admin = True
+        self.user.save()
+        self.assertEqual(self.get_user(other.id, HTTP_X_USER_ID=str(self.user.id)).status_code, 200)
+
+    def test_invalid_header_is_rejected(self):
+        self.assertEqual(self.get_user(self.user.id, HTTP_X_USER_ID='nope').status_code, 401)
+        self.assertEqual(self.get_user(self.user.id, HTTP_X_USER_ID='999').status_code, 401)
+
+
+class TokenAuthenticationTests(TestCase):
+    def setUp(self):
+        user_cache.clear()
+        revocations.clear()
+        self.user = User.objects.create_user(
+            email='driver@parkmate.test', password='password123',
+            first_name='Driver', last_name='One',
+        )
+
+    def get_self(self, token):
+        return self.client.get(f'/api/parkmate/users/{self.user.id}/', HTTP_AUTHORIZATION=f'Bearer {token}')
+
+    def test_login_token_authenticates(self):
+        response = self.client.post(
+            '/api/parkmate/login/', {'email': 'driver@parkmate.test', 'password': 'password123'},
+            content_type='application/json',
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(self.get_self(response.json()['token']).status_code, 200)
+
+    def test_tampered_and_expired_tokens_are_rejected(self):
+        token, _ = issue_token(self.user)
+        self.assertEqual(self.get_self(token[:-1] + ('A' if token[-1] != 'A' else 'B')).status_code, 401)
+        expired, _ = issue_token(self.user, ttl=-1)
+        self.assertEqual(self.get_self(expired).status_code, 401)
+
+    def test_logout_revokes_token(self):
+        token, _ = issue_token(self.user)
+        response = self.client.post('/api/parkmate/logout/', HTTP_AUTHORIZATION=f'Bearer {token}')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(self.get_self(token).status_code, 401)
+        # Other processes learn about it from the database
+        revocations.clear()
+        self.assertEqual(self.get_self(token).status_code, 401)
+
+    def test_sync_reads_late_commits_without_writing(self):
+        revocations.sync()
+        _, access = issue_token(self.user)
+        expires_at = timezone.now() + timedelta(hours=1)
+        # Stamped before the last sync but committed after it
+        RevokedToken.objects.create(jti=access.jti, expires_at=expires_at, revoked_at=timezone.now() - timedelta(seconds=60))
+        RevokedToken.objects.create(jti='expired', expires_at=timezone.now() - timedelta(hours=1))
+        with self.assertNumQueries(1):
+            revocations.sync()
+        self.assertTrue(revocations.is_revoked(access.jti))
+        self.assertEqual(RevokedToken.objects.count(), 2)
+
+        output = io.StringIO()
+        call_command('purge_revoked_tokens', stdout=output)
+        self.assertEqual(output.getvalue(), 'Deleted 1 expired revocations\n')
+        self.assertEqual(list(RevokedToken.objects.values_list('jti', flat=True)), [access.jti])
+
+
+@override_settings(PARKMATE_PBKDF2_ITERATIONS=1000)
+class PasswordHashingTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create(
+            email='driver@parkmate.test',
+            password=PBKDF2SHA1PasswordHasher().encode('old-secret-1', 'oldsalt', iterations=1000),
+        )
+
+    def login(self, password):
+        return self.client.post(
+            '/api/parkmate/login/', {'email': 'driver@parkmate.test', 'password': password},
+            content_type='application/json',
+        )
+
+    def test_login_upgrades_outdated_hashes(self):
+        self.assertEqual(self.login('wrong-secret').status_code, 401)
+        self.user.refresh_from_db()
+        self.assertTrue(self.user.password.startswith('pbkdf2_sha1$'))
+
+        self.assertEqual(self.login('old-secret-1').status_code, 200)
+        self.user.refresh_from_db()
+        self.assertTrue(self.user.password.startswith('pbkdf2_sha256$1000$'))
+
+        with override_settings(PARKMATE_PBKDF2_ITERATIONS=2000):
+            self.assertEqual(self.login('old-secret-1').status_code, 200)
+        self.user.refresh_from_db()
+        self.assertTrue(self.user.password.startswith('pbkdf2_sha256$2000$'))
+
+    def test_unknown_user_and_unusable_password(self):
+        self.assertEqual(self.client.post(
+            '/api/parkmate/login/', {'email': 'nobody@parkmate.test', 'password': 'secret'},
+            content_type='application/json',
+        ).status_code, 401)
+        self.user.set_unusable_password()
+        self.user.save()
+        self.assertEqual(self.login('old-secret-1').status_code, 401)
+
+    def test_hashing_in_worker_processes(self):
+        self.addCleanup(hashing.shutdown)
+        # The hashers are sent to the workers by path; MD5 keeps the test fast
+        md5 = ['django.contrib.auth.hashers.MD5PasswordHasher']
+        with override_settings(PARKMATE_HASHER_WORKERS=1, PASSWORD_HASHERS=md5):
+            encoded = hashing.make_password('pool-secret')
+            self.assertEqual(hashing.check_password('pool-secret', encoded), (True, None))
+            self.assertEqual(hashing.check_password('wrong-secret', encoded), (False, None))
+            self.assertTrue(check_password('pool-secret', encoded))
+        self.assertIsNotNone(hashing._pool)
+
+
+class ParkingCacheTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.parking = Parking.objects.create(amount_of_spots=10, address='1 Main Street', price=10)
+        self.url = f'/api/parkmate/parking/{self.parking.parking_id}/'
+
+    def test_detail_is_served_from_cache(self):
+        first = self.client.get(self.url)
+        with self.assertNumQueries(0):
+            second = self.client.get(self.url)
+        self.assertEqual(second.content, first.content)
+        self.assertEqual(second.json()['address'], '1 Main Street')
+
+    @override_settings(PARKMATE_READ_REPLICAS=['replica1'], DATABASE_ROUTERS=['parking.routers.ReplicaRouter'])
+    def test_entries_are_built_from_the_primary(self):
+        # As outside a transaction, reads would go to the replica (not configured here)
+        with mock.patch.object(ReplicaRouter, 'db_for_read', return_value='replica1'):
+            self.assertEqual(self.client.get(self.url).json()['address'], '1 Main Street')
+            self.assertEqual(len(self.client.get('/api/parkmate/parking/').json()), 1)
+
+    def test_if_none_match_returns_304(self):
+        etag = self.client.get('/api/parkmate/parking/')['ETag']
+        response = self.client.get('/api/parkmate/parking/', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response.content, b'')
+
+    def test_update_and_delete_invalidate(self):
+        self.client.get(self.url)
+        self.client.get('/api/parkmate/parking/')
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.put(f'{self.url}update/', {'price': 12}, content_type='application/json')
+        self.assertEqual(self.client.get(self.url).json()['price'], 12)
+        self.assertEqual(self.client.get('/api/parkmate/parking/').json()[0]['price'], 12)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.delete(f'{self.url}delete/')
+        self.assertEqual(self.client.get(self.url).status_code, 404)
+        self.assertEqual(self.client.get('/api/parkmate/parking/').json(), [])
+
+    def test_evicted_version_does_not_revive_old_entries(self):
+        self.client.get(self.url)
+        caching.invalidate_parking(self.parking.parking_id)
+        self.client.get(self.url)
+        # The version key is culled while entries cached under it remain
+        cache.delete(caching._parking_version_key(self.parking.parking_id))
+        Parking.objects.filter(parking_id=self.parking.parking_id).update(address='2 Main Street')
+        self.assertEqual(self.client.get(self.url).json()['address'], '2 Main Street')
+
+
+class BulkBookingTests(TestCase):
+    def setUp(self):
+        user_cache.clear()
+        self.user = User.objects.create(email='fleet@parkmate.test', first_name='Fleet', last_name='Operator')
+        self.parking = Parking.objects.create(amount_of_spots=2, address='1 Main Street', price=10)
+
+    def test_bulk_create_respects_capacity_within_the_batch(self):
+        item = {
+            'parking_id': self.parking.parking_id,
+            'start_time': '2030-01-01T10:00:00Z',
+            'end_time': '2030-01-01T12:00:00Z',
+        }
+        response = self.client.post(
+            '/api/parkmate/bookings/bulk/', [item, item, item, dict(item, parking_id=999)],
+            content_type='application/json', HTTP_X_USER_ID=str(self.user.id),
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([result['status'] for result in response.json()['results']], [201, 201, 400, 400])
+        self.assertEqual(Booking.objects.filter(parking_id=self.parking).count(), 2)
+
+    def test_rejected_move_keeps_its_spot(self):
+        self.parking.amount_of_spots = 1
+        self.parking.save()
+        day = datetime(2030, 1, 1, tzinfo=dt_timezone.utc)
+        first, second, blocker = (
+            Booking.objects.create(
+                parking_id=self.parking, user_id=self.user,
+                start_time=day + timedelta(hours=hour), end_time=day + timedelta(hours=hour + 2),
+            )
+            for hour in (10, 20, 16)
+        )
+
+        def move(*moves):
+            items = [{
+                'booking_id': booking.booking_id,
+                'start_time': (day + timedelta(hours=hour)).isoformat(),
+                'end_time': (day + timedelta(hours=hour + 2)).isoformat(),
+            } for booking, hour in moves]
+            response = self.client.put(
+                '/api/parkmate/bookings/bulk/', items, content_type='application/json', HTTP_X_USER_ID=str(self.user.id),
+            )
+            return [result['status'] for result in response.json()['results']]
+
+        # The first move is rejected, so the second cannot take its slot
+        self.assertEqual(move((first, 16), (second, 10)), [400, 400])
+        self.assertEqual(move((first, 13), (second, 10)), [200, 200])
+        self.assertEqual(move((blocker, 13)), [400])
+        starts = sorted(Booking.objects.values_list('start_time', flat=True))
+        self.assertEqual(starts, [day + timedelta(hours=hour) for hour in (10, 13, 16)])
+
+
+class NearbyParkingTests(TestCase):
+    def setUp(self):
+        spatial.reset()
+        availability.reset()
+        self.user = User.objects.create(email='driver@parkmate.test')
+        self.near = Parking.objects.create(
+            amount_of_spots=1, address='1 Main Street', price=10, latitude=52.5200, longitude=13.4050,
+        )
+        self.far = Parking.objects.create(
+            amount_of_spots=5, address='9 Far Street', price=10, latitude=52.5400, longitude=13.4050,
+        )
+        self.url = '/api/parkmate/parking/nearby/'
+        self.window = {'from': '2030-01-01T10:00:00Z', 'to': '2030-01-01T12:00:00Z'}
+
+    def search(self, **params):
+        return self.client.get(self.url, {'lat': 52.5201, 'lon': 13.4051, **self.window, **params})
+
+    def test_nearest_first_and_full_parkings_skipped(self):
+        response = self.search()
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([item['parking_id'] for item in response.json()], [self.near.parking_id, self.far.parking_id])
+        self.assertLess(response.json()[0]['distance_km'], 0.1)
+
+        Booking.objects.create(
+            parking_id=self.near, user_id=self.user,
+            start_time='2030-01-01T11:00:00Z', end_time='2030-01-01T13:00:00Z',
+        )
+        availability.reset()
+        self.assertEqual([item['parking_id'] for item in self.search().json()], [self.far.parking_id])
+        self.assertEqual(self.search(radius=1).json(), [])
+
+    def test_index_follows_parking_writes(self):
+        self.search()
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post('/api/parkmate/parking/', {
+                'amount_of_spots': 3, 'address': '2 Main Street', 'price': 5,
+                'latitude': 52.5201, 'longitude': 13.4051,
+            }, content_type='application/json')
+            self.near.latitude = 10.0
+            self.near.save()
+        addresses = [item['address'] for item in self.search().json()]
+        self.assertEqual(addresses, ['2 Main Street', '9 Far Street'])
+
+    def test_index_follows_parking_writes_of_other_workers(self):
+        self.search()
+        # Written by another worker: no signal here, only the catalog version it replaces
+        Parking.objects.filter(pk=self.near.pk).update(latitude=10.0)
+        caching.invalidate_parking(self.near.parking_id)
+        self.assertEqual([item['parking_id'] for item in self.search().json()], [self.far.parking_id])
+
+    def test_invalid_parameters(self):
+        self.assertEqual(self.client.get(self.url, {'lat': 52.52}).status_code, 400)
+        self.assertEqual(self.search(lat=91).status_code, 400)
+        self.assertEqual(self.search(radius='far').status_code, 400)
+
+
+class ParkingSearchTests(TestCase):
+    def setUp(self):
+        search.reset()
+        for address, comment in [
+            ('12 Main Street', 'Covered'),
+            ('4 Mainz Avenue', None),
+            ('7 Harbour Road', 'Near the main station'),
+            ('1 Königstraße', 'EV charging'),
+        ]:
+            Parking.objects.create(amount_of_spots=5, address=address, comment=comment, price=5)
+        self.url = '/api/parkmate/parking/search/'
+
+    def addresses(self, **params):
+        return [item['address'] for item in self.client.get(self.url, params).json()['results']]
+
+    def test_ranked_prefix_search(self):
+        # Exact address match first; address words outweigh comment words
+        self.assertEqual(self.addresses(q='main'), ['12 Main Street', '4 Mainz Avenue', '7 Harbour Road'])
+        self.assertEqual(self.addresses(q='main str'), ['12 Main Street'])
+        self.assertEqual(self.addresses(q='konigs'), ['1 Königstraße'])
+        self.assertEqual(self.addresses(q='nowhere'), [])
+
+    def test_pagination(self):
+        page = self.client.get(self.url, {'q': 'ma', 'limit': 2}).json()
+        self.assertEqual((page['count'], page['next'], len(page['results'])), (3, 2, 2))
+        page = self.client.get(self.url, {'q': 'ma', 'limit': 2, 'offset': 2}).json()
+        self.assertEqual((page['next'], len(page['results'])), (None, 1))
+        self.assertEqual(self.client.get(self.url).status_code, 400)
+        for offset in ('inf', '1e400', '-1', '1.5', '10001'):
+            self.assertEqual(self.client.get(self.url, {'q': 'ma', 'offset': offset}).status_code, 400, offset)
+
+    def test_index_follows_parking_writes(self):
+        self.addresses(q='main')
+        parking = Parking.objects.get(address='12 Main Street')
+        with self.captureOnCommitCallbacks(execute=True):
+            parking.address = '12 Quay Street'
+            parking.save()
+            Parking.objects.filter(address='4 Mainz Avenue').delete()
+        self.assertEqual(self.addresses(q='main'), ['7 Harbour Road'])
+        self.assertEqual(self.addresses(q='quay'), ['12 Quay Street'])
+
+    def test_index_follows_parking_writes_of_other_workers(self):
+        self.addresses(q='main')
+        # Written by another worker: no signal here, only the catalog version it replaces
+        parking = Parking.objects.get(address='12 Main Street')
+        Parking.objects.filter(pk=parking.pk).update(address='12 Quay Street')
+        caching.invalidate_parking(parking.parking_id)
+        self.assertEqual(self.addresses(q='quay'), ['12 Quay Street'])
+
+    def test_capped_prefix_expansions_are_reported(self):
+        self.assertFalse(self.client.get(self.url, {'q': 'ma'}).json()['truncated'])
+        # "ma" extends to "main" and "mainz"; only the first is searched
+        with mock.patch.object(search, 'MAX_EXPANSIONS', 1):
+            page = self.client.get(self.url, {'q': 'ma'}).json()
+        self.assertTrue(page['truncated'])
+        self.assertEqual([item['address'] for item in page['results']], ['12 Main Street', '7 Harbour Road'])
+        self.assertFalse(self.client.get(self.url, {'q': 'main'}).json()['truncated'])
+
+
+@override_settings(PARKMATE_JOBS_EAGER=True)
+class OccupancyAnalyticsTests(TestCase):
+    def setUp(self):
+        user_cache.clear()
+        self.admin = User.objects.create(email='admin@parkmate.test', is_admin=True)
+        self.parking = Parking.objects.create(amount_of_spots=2, address='1 Main Street', price=6)
+        self.day = datetime(2030, 1, 1, tzinfo=dt_timezone.utc)
+
+    def at(self, hours):
+        return self.day + timedelta(hours=hours)
+
+    def buckets(self):
+        # Emptied buckets are kept until a rebuild
+        return set(OccupancyBucket.objects.exclude(bookings=0, booked_seconds=0).values_list(
+            'granularity', 'start', 'bookings', 'booked_seconds', 'revenue',
+        ))
+
+    def test_buckets_follow_booking_writes_and_match_rebuild(self):
+        booking = Booking.objects.create(
+            parking_id=self.parking, user_id=self.admin, start_time=self.at(10.5), end_time=self.at(12),
+        )
+        self.assertEqual(self.buckets(), {
+            ('hour', self.at(10), 1, 1800, 3.0), ('hour', self.at(11), 1, 3600, 6.0), ('day', self.day, 1, 5400, 9.0),
+        })
+
+        booking = Booking.objects.get(pk=booking.pk)
+        booking.start_time, booking.end_time = self.at(11), self.at(13)
+        booking.save()
+        Booking.objects.create(parking_id=self.parking, user_id=self.admin, start_time=self.at(12), end_time=self.at(13))
+        incremental = self.buckets()
+        self.assertEqual(incremental, {
+            ('hour', self.at(11), 1, 3600, 6.0), ('hour', self.at(12), 2, 7200, 12.0), ('day', self.day, 2, 10800, 18.0),
+        })
+        analytics.rebuild()
+        self.assertEqual(self.buckets(), incremental)
+
+        Booking.objects.filter(parking_id=self.parking).delete()
+        self.assertEqual(self.buckets(), set())
+
+    def test_revenue_is_taken_back_at_the_booked_price(self):
+        booking = Booking.objects.create(
+            parking_id=self.parking, user_id=self.admin, start_time=self.at(10), end_time=self.at(12),
+        )
+        Parking.objects.filter(pk=self.parking.pk).update(price=9)
+        booking = Booking.objects.get(pk=booking.pk)
+        booking.start_time = self.at(11)
+        booking.save()
+        self.assertEqual(self.buckets(), {('hour', self.at(11), 1, 3600, 6.0), ('day', self.day, 1, 3600, 6.0)})
+        analytics.rebuild()
+        self.assertEqual(self.buckets(), {('hour', self.at(11), 1, 3600, 6.0), ('day', self.day, 1, 3600, 6.0)})
+
+        # Moved to another parking, the booking takes that parking's price
+        other = Parking.objects.create(amount_of_spots=2, address='2 Main Street', price=3)
+        booking = Booking.objects.get(pk=booking.pk)
+        booking.parking_id = other
+        booking.save()
+        self.assertEqual(booking.price, 3)
+        self.assertEqual(set(OccupancyBucket.objects.filter(parking_id=other).values_list('revenue', flat=True)), {3.0})
+        Booking.objects.get(pk=booking.pk).delete()
+        self.assertEqual(set(OccupancyBucket.objects.values_list('bookings', 'revenue')), {(0, 0.0)})
+
+    def test_stats_endpoint(self):
+        Booking.objects.create(parking_id=self.parking, user_id=self.admin, start_time=self.at(1), end_time=self.at(3))
+        url = f'/api/parkmate/parking/{self.parking.parking_id}/stats/'
+        window = {'from': '2030-01-01T00:00:00Z', 'to': '2030-01-01T04:00:00Z'}
+        self.assertEqual(self.client.get(url, window).status_code, 401)
+
+        with self.assertNumQueries(3):  # caller, parking, buckets
+            response = self.client.get(url, window, HTTP_X_USER_ID=str(self.admin.id))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([bucket['occupancy'] for bucket in response.json()['buckets']], [0.0, 0.5, 0.5, 0.0])
+        self.assertEqual(response.json()['revenue'], 12.0)
+
+        response = self.client.get(url, {'granularity': 'day', **window}, HTTP_X_USER_ID=str(self.admin.id))
+        self.assertEqual(response.json()['buckets'][0]['booked_hours'], 2.0)
+        response = self.client.get(url, {'granularity': 'week'}, HTTP_X_USER_ID=str(self.admin.id))
+        self.assertEqual(response.status_code, 400)
+
+
+class UserBookingSummaryTests(TestCase):
+    def setUp(self):
+        user_cache.clear()
+        self.user = User.objects.create(email='driver@parkmate.test')
+        self.parking = Parking.objects.create(amount_of_spots=50, address='1 Main Street', price=4)
+        self.now = timezone.now()
+
+    def book(self, start_hours, end_hours):
+        return Booking.objects.create(
+            parking_id=self.parking, user_id=self.user,
+            start_time=self.now + timedelta(hours=start_hours), end_time=self.now + timedelta(hours=end_hours),
+        )
+
+    def stored(self):
+        summary = UserBookingSummary.objects.get(user_id=self.user)
+        return summary.total_bookings, summary.booked_seconds, summary.total_spent, summary.upcoming, summary.upcoming_truncated
+
+    def test_summary_follows_booking_writes_and_matches_rebuild(self):
+        self.book(-3, -2)
+        active = self.book(-1, 1)
+        future = [self.book(day * 24, day * 24 + 1) for day in range(1, summaries.UPCOMING_LIMIT + 2)]
+        summary = summaries.read(self.user.id)
+        self.assertEqual(summary['total_bookings'], summaries.UPCOMING_LIMIT + 3)
+        self.assertEqual([item['booking_id'] for item in summary['active']], [active.booking_id])
+        self.assertEqual(len(summary['upcoming']), summaries.UPCOMING_LIMIT - 1)
+        self.assertTrue(summary['more_upcoming'])
+
+        # Moving a left-out booking first brings it into the list
+        last = Booking.objects.get(pk=future[-1].pk)
+        last.start_time, last.end_time = self.now + timedelta(hours=2), self.now + timedelta(hours=4)
+        last.save()
+        Booking.objects.get(pk=future[0].pk).delete()
+        summary = summaries.read(self.user.id)
+        self.assertEqual(summary['upcoming'][0]['booking_id'], last.booking_id)
+        self.assertEqual(summary['booked_hours'], summaries.UPCOMING_LIMIT + 4)
+        self.assertEqual(summary['total_spent'], (summaries.UPCOMING_LIMIT + 4) * 4)
+
+        # A rebuild may list more upcoming bookings, the same ones first
+        incremental = self.stored()
+        summaries.rebuild([self.user.id])
+        rebuilt = self.stored()
+        self.assertEqual(rebuilt[:3], incremental[:3])
+        self.assertEqual(rebuilt[3][:len(incremental[3])], incremental[3])
+
+    def test_summary_endpoint(self):
+        self.book(2, 3)
+        url = f'/api/parkmate/users/{self.user.id}/summary/'
+        self.assertEqual(self.client.get(url).status_code, 401)
+        other = User.objects.create(email='other@parkmate.test')
+        self.assertEqual(self.client.get(url, HTTP_X_USER_ID=str(other.id)).status_code, 403)
+
+        with self.assertNumQueries(2):  # caller, summary
+            response = self.client.get(url, HTTP_X_USER_ID=str(self.user.id))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['total_bookings'], 1)
+        self.assertEqual(response.json()['upcoming'][0]['parking_id'], self.parking.parking_id)
+
+        admin = User.objects.create(email='admin@parkmate.test', is_admin=True)
+        response = self.client.get('/api/parkmate/users/999999/summary/', HTTP_X_USER_ID=str(admin.id))
+        self.assertEqual(response.status_code, 404)
+
+    def test_reads_never_write(self):
+        self.book(2, 3)
+        expected = summaries.read(self.user.id)
+        UserBookingSummary.objects.all().delete()
+        # A missing row is answered without the bookings or a job; the
+        # backfill of migration 0018 builds it
+        with self.assertNumQueries(2):  # summary, user
+            summary = summaries.read(self.user.id)
+        self.assertEqual((summary['total_bookings'], summary['upcoming']), (0, []))
+        self.assertFalse(Job.objects.filter(name='summaries.refresh').exists())
+        backfill = import_module('parking.migrations.0018_backfill_user_booking_summaries').backfill_summaries
+        backfill(django_apps, None)
+        with self.assertNumQueries(1):
+            summary = summaries.read(self.user.id)
+        self.assertEqual(dict(summary, as_of=None), dict(expected, as_of=None))
+
+    def test_short_list_is_rebuilt_off_the_read_path(self):
+        future = [self.book(day * 24, day * 24 + 1) for day in range(1, summaries.UPCOMING_LIMIT + 3)]
+        # As if most of the list had ended since the last write
+        summary = UserBookingSummary.objects.get(user_id=self.user)
+        summary.upcoming = summary.upcoming[-2:]
+        summary.save()
+        with self.assertNumQueries(1):
+            self.assertEqual(len(summaries.read(self.user.id)['upcoming']), 2)
+        self.assertFalse(Job.objects.filter(name='summaries.refresh').exists())
+
+        # The next write queues one rebuild, also while it is running
+        self.book(-2, -1)
+        self.assertEqual(Job.objects.filter(name='summaries.refresh').count(), 1)
+        Job.objects.filter(name='summaries.refresh').update(status='running')
+        self.book(-4, -3)
+        self.assertEqual(Job.objects.filter(name='summaries.refresh').count(), 1)
+        Job.objects.filter(name='summaries.refresh').delete()
+        self.assertEqual(summaries.refresh_stale(), 1)
+        jobs.run_pending()
+        upcoming = [item['booking_id'] for item in summaries.read(self.user.id)['upcoming']]
+        self.assertEqual(upcoming, [booking.booking_id for booking in future[:summaries.UPCOMING_LIMIT]])
+        self.assertEqual(summaries.refresh_stale(), 0)
+
+
+_flaky_calls = []
+
+
+@jobs.register('tests.flaky', max_attempts=2)
+def _flaky_job(fail):
+    _flaky_calls.append(fail)
+    if fail:
+        raise RuntimeError('flaky')
+
+
+class JobQueueTests(TestCase):
+    def setUp(self):
+        user_cache.clear()
+        _flaky_calls.clear()
+
+    def test_analytics_update_runs_as_a_job(self):
+        user = User.objects.create(email='driver@parkmate.test')
+        parking = Parking.objects.create(amount_of_spots=2, address='1 Main Street', price=6)
+        start = datetime(2030, 1, 1, 10, tzinfo=dt_timezone.utc)
+        Booking.objects.create(parking_id=parking, user_id=user, start_time=start, end_time=start + timedelta(hours=1))
+        self.assertEqual(Job.objects.get().name, 'analytics.apply')
+        self.assertFalse(OccupancyBucket.objects.exists())
+
+        self.assertEqual(jobs.run_pending(), 1)
+        self.assertEqual(set(OccupancyBucket.objects.values_list('granularity', 'bookings')), {('hour', 1), ('day', 1)})
+        self.assertFalse(Job.objects.exists())
+
+    def test_analytics_jobs_give_the_same_buckets_in_any_order(self):
+        user = User.objects.create(email='driver@parkmate.test')
+        parking = Parking.objects.create(amount_of_spots=2, address='1 Main Street', price=6)
+        start = datetime(2030, 1, 1, 10, tzinfo=dt_timezone.utc)
+        first = Booking.objects.create(parking_id=parking, user_id=user, start_time=start, end_time=start + timedelta(hours=1))
+        # Creates the same new buckets as the first job
+        Booking.objects.create(
+            parking_id=parking, user_id=user, start_time=start + timedelta(minutes=30), end_time=start + timedelta(hours=2),
+        )
+        first = Booking.objects.get(pk=first.pk)
+        first.start_time, first.end_time = start + timedelta(hours=3), start + timedelta(hours=4)
+        first.save()
+        first.delete()
+
+        # The removals run before the additions they undo, as with several
+        # workers or an addition waiting for a retry
+        claimed = jobs.claim(10)
+        self.assertEqual(len(claimed), 4)
+        self.assertEqual([jobs.run(job) for job in reversed(claimed)], [True] * 4)
+        self.assertFalse(Job.objects.exists())
+
+        def buckets():
+            return set(OccupancyBucket.objects.filter(bookings__gt=0).values_list(
+                'granularity', 'start', 'bookings', 'booked_seconds', 'revenue',
+            ))
+        incremental = buckets()
+        self.assertEqual(incremental, {
+            ('hour', start, 1, 1800, 3.0), ('hour', start + timedelta(hours=1), 1, 3600, 6.0),
+            ('day', datetime(2030, 1, 1, tzinfo=dt_timezone.utc), 1, 5400, 9.0),
+        })
+        self.assertFalse(OccupancyBucket.objects.filter(bookings__lt=0).exists())
+        analytics.rebuild()
+        self.assertEqual(buckets(), incremental)
+
+    def test_failing_job_is_retried_with_backoff_then_kept(self):
+        job = jobs.enqueue('tests.flaky', {'fail': True})
+        with self.assertLogs('parking.jobs', 'WARNING'):
+            self.assertEqual(jobs.run_pending(), 0)
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.attempts), ('pending', 1))
+        self.assertGreater(job.run_after, timezone.now())
+        self.assertEqual(jobs.run_pending(), 0)  # not due yet
+
+        Job.objects.filter(pk=job.pk).update(run_after=timezone.now())
+        with self.assertLogs('parking.jobs', 'WARNING'):
+            self.assertEqual(jobs.run_pending(), 0)
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.attempts, job.last_error), ('failed', 2, 'RuntimeError: flaky'))
+
+        jobs.enqueue('tests.flaky', {'fail': False})
+        self.assertEqual(jobs.run_pending(), 1)
+        self.assertEqual(_flaky_calls, [True, True, False])
+        self.assertEqual(list(Job.objects.values_list('status', flat=True)), ['failed'])
+
+
+@override_settings(PARKMATE_JOBS_EAGER=True)
+class BookingArchiveTests(TestCase):
+    def setUp(self):
+        user_cache.clear()
+        self.admin = User.objects.create(email='admin@parkmate.test', is_admin=True)
+        self.user = User.objects.create(email='driver@parkmate.test')
+        self.parking = Parking.objects.create(amount_of_spots=10, address='1 Main Street', price=2)
+        now = timezone.now().replace(microsecond=0)
+        self.bookings = [
+            Booking.objects.create(
+                parking_id=self.parking, user_id=self.user,
+                start_time=now + timedelta(days=days), end_time=now + timedelta(days=days, hours=1),
+            )
+            for days in (-400, -300, -200, -1, 5)
+        ]
+
+    def test_archiving_moves_old_bookings_and_keeps_derived_rows(self):
+        buckets = set(OccupancyBucket.objects.values_list('granularity', 'start', 'bookings'))
+        totals = summaries.read(self.user.id)['total_bookings']
+
+        self.assertEqual(list(archive.archive_bookings(archive.cutoff(180), batch_size=2)), [2, 1])
+        self.assertEqual(sorted(ArchivedBooking.objects.values_list('booking_id', flat=True)),
+                         [booking.booking_id for booking in self.bookings[:3]])
+        self.assertEqual(Booking.objects.count(), 2)
+        self.assertEqual(set(OccupancyBucket.objects.values_list('granularity', 'start', 'bookings')), buckets)
+        self.assertEqual(summaries.read(self.user.id)['total_bookings'], totals)
+
+        # The rebuilds read the archive too
+        analytics.rebuild()
+        summaries.rebuild()
+        self.assertEqual(set(OccupancyBucket.objects.values_list('granularity', 'start', 'bookings')), buckets)
+        self.assertEqual(summaries.read(self.user.id)['total_bookings'], totals)
+
+        # Deleting the parking takes the archived bookings out of the summary
+        self.parking.delete()
+        self.assertEqual(summaries.read(self.user.id)['total_bookings'], 0)
+
+    def test_listing_includes_archived_bookings_on_request(self):
+        archive.archive_bookings(archive.cutoff(180)).__next__()
+        url = '/api/parkmate/bookings/'
+        response = self.client.get(url, HTTP_X_USER_ID=str(self.admin.id))
+        self.assertEqual(len(response.json()), 2)
+
+        ids = []
+        params = {'include_archived': 'true', 'ordering': '-start_time', 'limit': 2, 'fields': 'booking_id'}
+        while True:
+            response = self.client.get(url, params, HTTP_X_USER_ID=str(self.admin.id))
+            self.assertEqual(response.status_code, 200)
+            ids += [row['booking_id'] for row in response.json()['results']]
+            if response.json()['next'] is None:
+                break
+            params['cursor'] = response.json()['next']
+        self.assertEqual(ids, [booking.booking_id for booking in reversed(self.bookings)])
+
+        response = self.client.get(url, {'include_archived': 'true'}, HTTP_X_USER_ID=str(self.user.id))
+        self.assertEqual(response.status_code, 403)
+
+
+@skipUnless(connection.vendor == 'sqlite', 'EXPLAIN QUERY PLAN output is SQLite specific')
+class BookingIndexTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create(email='driver@parkmate.test')
+        self.parking = Parking.objects.create(amount_of_spots=10, address='1 Main Street', price=10)
+        self.start = timezone.now()
+
+    def test_overlap_query_uses_parking_time_index(self):
+        plan = Booking.objects.filter(
+            parking_id=self.parking,
+            start_time__lt=self.start + timedelta(hours=2),
+            end_time__gt=self.start,
+        ).explain()
+        self.assertIn('booking_parking_time_idx', plan)
+
+    def test_user_bookings_in_time_order_use_user_start_index(self):
+        plan = Booking.objects.filter(user_id=self.user).order_by('start_time').explain()
+        self.assertIn('booking_user_start_idx', plan)
+        self.assertNotIn('TEMP B-TREE', plan)
+
+
+class FastJSONRendererTests(SimpleTestCase):
+    def test_output_matches_the_stock_renderer(self):
+        data = {
+            'start_time': datetime(2030, 1, 1, 10, 0, 0, 123456, tzinfo=dt_timezone.utc),
+            'date': date(2030, 1, 1),
+            'price': Decimal('9.50'),
+            'error': gettext_lazy('Invalid'),
+            'ids': {1, 2},
+            'line': 'a\u2028b',
+            'nested': [{'comment': None, 'ok': True}],
+        }
+        self.assertEqual(renderers.FastJSONRenderer().render(data), JSONRenderer().render(data))
+        self.assertEqual(renderers.FastJSONRenderer().render(None), b'')
+
+    def test_indented_output_is_delegated(self):
+        body = renderers.FastJSONRenderer().render({'a': 1}, 'application/json; indent=2')
+        self.assertEqual(body, b'{\n  "a": 1\n}')
+
+
+class MetricsTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        metrics.reset()
+        self.parking = Parking.objects.create(amount_of_spots=10, address='1 Main Street', price=10)
+
+    def test_requests_are_timed_and_exposed(self):
+        response = self.client.get(f'/api/parkmate/parking/{self.parking.parking_id}/')
+        self.assertRegex(response['Server-Timing'], r'db;dur=[\d.]+;desc="1 queries", render;dur=[\d.]+, total;dur=')
+
+        body = self.client.get('/metrics').content.decode()
+        self.assertIn('parkmate_requests_total{view="get_parking",method="GET",status="200"} 1', body)
+        self.assertIn('parkmate_db_queries_bucket{view="get_parking",method="GET",le="1"} 1', body)
+        self.assertIn('parkmate_request_duration_seconds_count{view="get_parking",method="GET"} 1', body)
+
+    @override_settings(ROOT_URLCONF='config.asgi_urls')
+    async def test_queries_are_counted_under_asgi(self):
+        user = await User.objects.acreate(email='driver@parkmate.test')
+        user_cache.clear()
+        # A native async view, then a sync view run in a worker thread
+        response = await self.async_client.get(
+            f'/api/parkmate/parking/{self.parking.parking_id}/', headers={'X-User-Id': str(user.id)},
+        )
+        self.assertIn('desc="2 queries"', response['Server-Timing'])  # caller, parking
+        response = await self.async_client.get('/api/parkmate/bookings/', headers={'X-User-Id': str(user.id)})
+        self.assertIn('desc="1 queries"', response['Server-Timing'])  # bookings
+
+        body = (await self.async_client.get('/metrics')).content.decode()
+        self.assertIn('parkmate_db_queries_sum{view="get_parking",method="GET"} 2', body)
+        self.assertIn('parkmate_db_queries_sum{view="booking_list_create",method="GET"} 1', body)
+
+
+class QueryInspectorTests(TestCase):
+    def setUp(self):
+        self.parkings = [
+            Parking.objects.create(amount_of_spots=10, address=f'{number} Main Street', price=10)
+            for number in range(6)
+        ]
+
+    def test_fingerprint_collapses_literals_and_in_lists(self):
+        self.assertEqual(
+            fingerprint("SELECT * FROM t WHERE id IN (%s, %s, %s) AND name = 'x' LIMIT 21"),
+            fingerprint('SELECT * FROM t WHERE id IN (%s) AND name = %s LIMIT 5'),
+        )
+
+    def test_repeated_queries_fail_with_stack_trace(self):
+        with self.assertRaises(QueryBudgetExceeded) as raised:
+            with query_budget(repeat_threshold=5):
+                for parking in self.parkings:
+                    Parking.objects.get(parking_id=parking.parking_id)
+        self.assertIn('Query repeated 6 times', str(raised.exception))
+        self.assertIn('test_repeated_queries_fail_with_stack_trace', str(raised.exception))
+
+    def test_booking_list_stays_within_budget(self):
+        user = User.objects.create(email='driver@parkmate.test', is_admin=True)
+        for parking in self.parkings:
+            Booking.objects.create(
+                parking_id=parking, user_id=user,
+                start_time=timezone.now(), end_time=timezone.now() + timedelta(hours=1),
+            )
+        user_cache.clear()
+        with query_budget(max_queries=2):
+            response = self.client.get('/api/parkmate/bookings/', HTTP_X_USER_ID=str(user.id))
+        self.assertEqual(len(response.json()), 6)
+
+    @override_settings(
+        ROOT_URLCONF='config.asgi_urls',
+        PARKMATE_QUERY_INSPECTOR={'ENABLED': True, 'STRICT': True, 'BUDGETS': {'get_parking': 1, 'get_user': 1}},
+    )
+    async def test_budgets_apply_under_asgi(self):
+        cache.clear()
+        user = await User.objects.acreate(email='driver@parkmate.test')
+        user_cache.clear()
+        headers = {'X-User-Id': str(user.id)}
+        # Caller and parking: over the budget of the async view
+        with self.assertRaises(QueryBudgetExceeded):
+            await self.async_client.get(f'/api/parkmate/parking/{self.parkings[0].parking_id}/', headers=headers)
+        self.assertEqual(
+            (await self.async_client.get(f'/api/parkmate/parking/{self.parkings[1].parking_id}/', headers=headers)).status_code,
+            200,
+        )
+        # The sync view, run in a worker thread, is inspected too
+        user_cache.clear()
+        with self.assertRaises(QueryBudgetExceeded):
+            await self.async_client.get(f'/api/parkmate/users/{user.id}/', headers=headers)
+
+
+@override_settings(ROOT_URLCONF='config.asgi_urls')
+class AsyncViewTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        user_cache.clear()
+        self.user = User.objects.create(email='driver@parkmate.test')
+        self.parking = Parking.objects.create(amount_of_spots=2, address='1 Main Street', price=10)
+        self.booking = Booking.objects.create(
+            parking_id=self.parking, user_id=self.user,
+            start_time=timezone.now(), end_time=timezone.now() + timedelta(hours=1),
+        )
+
+    async def test_read_endpoints_match_sync_views(self):
+        moment = (self.booking.start_time + timedelta(minutes=10)).strftime('%Y-%m-%dT%H:%M:%SZ')
+        paths = [
+            '/api/parkmate/parking/',
+            '/api/parkmate/parking/?limit=1&fields=address',
+            f'/api/parkmate/parking/{self.parking.parking_id}/',
+            f'/api/parkmate/parking/{self.parking.parking_id}/availability/?from={moment}',
+            f'/api/parkmate/bookings/{self.booking.booking_id}/',
+            '/api/parkmate/parking/999/',
+        ]
+        token, _ = issue_token(self.user)
+        for path in paths:
+            response = await self.async_client.get(path, headers={'Authorization': f'Bearer {token}'})
+            with self.settings(ROOT_URLCONF='config.urls'):
+                expected = await self.async_client.get(path, headers={'Authorization': f'Bearer {token}'})
+            self.assertEqual(response.status_code, expected.status_code, path)
+            self.assertEqual(response.json(), expected.json(), path)
+
+    async def test_other_users_booking_is_forbidden(self):
+        other = await User.objects.acreate(email='other@parkmate.test')
+        response = await self.async_client.get(
+            f'/api/parkmate/bookings/{self.booking.booking_id}/', headers={'X-User-Id': str(other.id)}
+        )
+        self.assertEqual(response.status_code, 403)
+        response = await self.async_client.get('/api/parkmate/parking/', headers={'X-User-Id': '999'})
+        self.assertEqual(response.status_code, 401)
+
+
+@override_settings(PARKMATE_READ_REPLICAS=['replica1', 'replica2'])
+class ReplicaRouterTests(SimpleTestCase):
+    def test_reads_rotate_over_replicas(self):
+        router = ReplicaRouter()
+        with request_scope():
+            reads = [router.db_for_read(Parking) for _ in range(4)]
+        self.assertEqual(reads, ['replica1', 'replica2', 'replica1', 'replica2'])
+
+    def test_writes_pin_the_request_to_the_primary(self):
+        router = ReplicaRouter()
+        with request_scope() as scope:
+            self.assertEqual(router.db_for_write(Booking), 'default')
+            self.assertEqual(router.db_for_read(Booking), 'default')
+            self.assertTrue(scope.wrote)
+        with request_scope():
+            self.assertEqual(router.db_for_read(Booking), 'replica1')
+            pin_to_primary()
+            self.assertEqual(router.db_for_read(Booking), 'default')
+
+
+@override_settings(
+    PARKMATE_READ_REPLICAS=['replica1', 'replica2'],
+    DATABASE_ROUTERS=['parking.routers.ReplicaRouter'],
+)
+class ReplicaPinningTests(TestCase):
+    def test_reads_in_transactions_use_the_primary(self):
+        # TestCase runs each test inside a transaction
+        with request_scope():
+            self.assertEqual(ReplicaRouter().db_for_read(Parking), 'default')
+
+    def test_pin_cookie_after_write(self):
+        user = User.objects.create(email='fleet@parkmate.test')
+        response = self.client.post(
+            '/api/parkmate/parking/', {'amount_of_spots': 5, 'address': '2 Main Street', 'price': 3},
+            content_type='application/json', HTTP_X_USER_ID=str(user.id),
+        )
+        self.assertEqual(response.status_code, 201)
+        self.assertIn('parkmate_primary', response.cookies)
@@ -0,0 +1,135 @@
+"""
+Stateless access tokens.
+
+A token is ``<user id>.<token id>.<expiry>`` signed with an HMAC of the
+project SECRET_KEY, so verifying it is a signature check and a clock
+comparison with no database access. Logged-out tokens are kept in an
+in-memory revocation set; revocations are written through to the
+``revoked_token`` table and every process pulls the ones made by other
+workers at most ``PARKMATE_REVOCATION_SYNC_INTERVAL`` seconds later.
+Syncing only reads; rows of expired tokens are deleted by
+``manage.py purge_revoked_tokens``.
+"""
+import secrets
+import threading
+import time
+from collections import namedtuple
+from datetime import datetime, timedelta, timezone as dt_timezone
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core import signing
+from django.utils import timezone
+
+from .models import RevokedToken
+from .routers import PRIMARY
+
+TOKEN_TTL = getattr(settings, 'PARKMATE_TOKEN_TTL', 7 * 24 * 3600)
+REVOCATION_SYNC_INTERVAL = getattr(settings, 'PARKMATE_REVOCATION_SYNC_INTERVAL', 30)
+REVOCATION_SYNC_OVERLAP = getattr(settings, 'PARKMATE_REVOCATION_SYNC_OVERLAP', 120)
+
+AccessToken = namedtuple('AccessToken', ('user_id', 'jti', 'expires_at'))
+
+_signer = signing.Signer(salt='parkmate.tokens')
+
+
+class InvalidToken(Exception):
+    """Raised for tampered, malformed, expired or revoked tokens."""
+
+
+def issue_token(user, ttl=None):
+    """Return ``(token, AccessToken)`` for ``user``."""
+    expires_at = int(time.time()) + (TOKEN_TTL if ttl is None else ttl)
+    jti = secrets.token_urlsafe(12)
+    value = f'{user.id}.{jti}.{signing.b62_encode(expires_at)}'
+    return _signer.sign(value), AccessToken(user.id, jti, expires_at)
+
+
+def _decode(token):
+    try:
+        user_id, jti, expires_at = _signer.unsign(token).split('.')
+        access = AccessToken(int(user_id), jti, signing.b62_decode(expires_at))
+    except (signing.BadSignature, ValueError):
+        raise InvalidToken('Invalid token')
+    if access.expires_at <= time.time():
+        raise InvalidToken('Token has expired')
+    return access
+
+
+def verify_token(token):
+    """Return the ``AccessToken`` carried by a valid token."""
+    access = _decode(token)
+    if revocations.is_revoked(access.jti):
+        raise InvalidToken('Token has been revoked')
+    return access
+
+
+async def averify_token(token):
+    """Async ``verify_token``; only a due revocation sync leaves the event loop."""
+    access = _decode(token)
+    if await revocations.ais_revoked(access.jti):
+        raise InvalidToken('Token has been revoked')
+    return access
+
+
+class RevocationList:
+    """In-memory set of revoked token ids, synced with the database."""
+
+    def __init__(self, sync_interval=REVOCATION_SYNC_INTERVAL, sync_overlap=REVOCATION_SYNC_OVERLAP):
+        self.sync_interval = sync_interval
+        self.sync_overlap = sync_overlap
+        self._revoked = {}  # jti -> expires_at (epoch seconds)
+        self._synced_until = None  # revoked_at covered by the last sync
+        self._synced_at = None
+        self._lock = threading.Lock()
+
+    def revoke(self, access):
+        expires_at = datetime.fromtimestamp(access.expires_at, tz=dt_timezone.utc)
+        RevokedToken.objects.get_or_create(jti=access.jti, defaults={'expires_at': expires_at})
+        with self._lock:
+            self._revoked[access.jti] = access.expires_at
+
+    def _stale(self):
+        return self._synced_at is None or time.monotonic() - self._synced_at >= self.sync_interval
+
+    def is_revoked(self, jti):
+        if self._stale():
+            self.sync()
+        return jti in self._revoked
+
+    async def ais_revoked(self, jti):
+        if self._stale():
+            await sync_to_async(self.sync)()
+        return jti in self._revoked
+
+    def sync(self):
+        """
+        Pull the revocations made since the last sync and drop expired ones.
+        The window reaches ``sync_overlap`` seconds further back, for rows
+        committed after a later one was seen (ids and times are taken before
+        the commit) and for clock skew between processes.
+        """
+        now = timezone.now()
+        rows = RevokedToken.objects.using(PRIMARY).filter(expires_at__gt=now)
+        if self._synced_until is not None:
+            rows = rows.filter(revoked_at__gte=self._synced_until - timedelta(seconds=self.sync_overlap))
+        with self._lock:
+            for jti, expires_at in rows.values_list('jti', 'expires_at'):
+                self._revoked[jti] = expires_at.timestamp()
+            self._revoked = {jti: exp for jti, exp in self._revoked.items() if exp > now.timestamp()}
+            self._synced_until = now
+            self._synced_at = time.monotonic()
+
+    def clear(self):
+        with self._lock:
+            self._revoked.clear()
+            self._synced_until = None
+            self._synced_at = None
+
+
+def purge_expired(using=PRIMARY):
+    """Delete the revocations of tokens that have expired anyway; returns how many."""
+    return RevokedToken.objects.using(using).filter(expires_at__lte=timezone.now()).delete()[0]
+
+
+revocations = RevocationList()
@@ -6,11 +6,19 @@ from .views import (
     logout_view,
     get_user,
     delete_user,
+    user_summary,
     parking_list_create,
+    parking_bulk,
     get_parking,
     update_parking,
     delete_parking,
+    parking_availability,
+    parking_stats,
+    parking_nearby,
+    parking_search,
     booking_list_create,
+    booking_export,
+    booking_bulk,
     get_booking,
     update_booking,
     delete_booking,
@@ -27,15 +35,23 @@ urlpatterns = [
     # User endpoints
     path('users/<int:user_id>/', get_user, name='get_user'),
     path('users/<int:user_id>/delete/', delete_user, name='delete_user'),
+    path('users/<int:user_id>/summary/', user_summary, name='user_summary'),
     
     # Parking endpoints
     path('parking/', parking_list_create, name='parking_list_create'),
+    path('parking/bulk/', parking_bulk, name='parking_bulk'),
+    path('parking/nearby/', parking_nearby, name='parking_nearby'),
+    path('parking/search/', parking_search, name='parking_search'),
     path('parking/<int:parking_id>/', get_parking, name='get_parking'),
     path('parking/<int:parking_id>/update/', update_parking, name='update_parking'),
     path('parking/<int:parking_id>/delete/', delete_parking, name='delete_parking'),
+    path('parking/<int:parking_id>/availability/', parking_availability, name='parking_availability'),
+    path('parking/<int:parking_id>/stats/', parking_stats, name='parking_stats'),
     
     # Booking endpoints
     path('bookings/', booking_list_create, name='booking_list_create'),
+    path('bookings/export/', booking_export, name='booking_export'),
+    path('bookings/bulk/', booking_bulk, name='booking_bulk'),
     path('bookings/<int:booking_id>/', get_booking, name='get_booking'),
     path('bookings/<int:booking_id>/update/', update_booking, name='update_booking'),
     path('bookings/<int:booking_id>/delete/', delete_booking, name='delete_booking'),
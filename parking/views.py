@@ -1,15 +1,36 @@
+from datetime import timedelta
+
+from django.db import transaction
+from django.http import Http404, StreamingHttpResponse
 from django.shortcuts import render, get_object_or_404
 from rest_framework.decorators import api_view, permission_classes
 from rest_framework.response import Response
 from rest_framework import status, permissions
 from django.contrib.auth import authenticate
-from .models import Parking, User, Booking
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+from . import analytics, availability, bulk, caching, search, signals, spatial, summaries
+from .tokens import AccessToken, issue_token, revocations
+from .exports import DEFAULT_CHUNK_SIZE, EXPORT_FORMATS, export_bookings
+from .models import ArchivedBooking, Parking, User, Booking
 from .serializers import (
     UserRegistrationSerializer,
     UserSerializer,
     ParkingSerializer,
-    BookingSerializer
+    BookingSerializer,
+    BOOKING_FIELDS,
+    PARKING_FIELDS,
+    booking_rows,
 )
+from .pagination import InvalidQuery, KeysetPagination, is_integer, parse_fields
+from .routers import PRIMARY
+
+MAX_NEARBY_RADIUS_KM = 100
+MAX_NEARBY_LIMIT = 100
+MAX_SEARCH_LIMIT = 100
+MAX_SEARCH_OFFSET = 10000
+MAX_STATS_BUCKETS = 1000
+DEFAULT_STATS_SPAN = {'hour': timedelta(days=1), 'day': timedelta(days=30)}
 
 
 def home(request):
@@ -55,8 +76,12 @@ def login(request):
     
     user = authenticate(request, username=email, password=password)
     if user:
+        # Later requests send the token instead of re-checking the password
+        token, access = issue_token(user)
         return Response({
             'user': UserSerializer(user).data,
+            'token': token,
+            'expires_at': access.expires_at,
             'message': 'Login successful'
         }, status=status.HTTP_200_OK)
     else:
@@ -72,7 +97,10 @@ def logout_view(request):
     """
     Logout user.
     POST /api/parkmate/logout
+    Revokes the bearer token the request was made with.
     """
+    if isinstance(request.auth, AccessToken):
+        revocations.revoke(request.auth)
     return Response({'message': 'Logout successful'}, status=status.HTTP_200_OK)
 
 
@@ -87,19 +115,13 @@ def get_user(request, user_id):
     """
     user = get_object_or_404(User, id=user_id)
     
-    # Get authenticated user from token/session
-    auth_user_id = request.headers.get('X-User-Id')
-    if auth_user_id:
-        try:
-            auth_user = User.objects.get(id=int(auth_user_id))
-            # Check permission: admin or self
-            if not auth_user.is_admin and auth_user.id != user.id:
-                return Response(
-                    {'error': 'You do not have permission to access this user'},
-                    status=status.HTTP_403_FORBIDDEN
-                )
-        except (User.DoesNotExist, ValueError):
-            pass
+    # Check permission: admin or self
+    auth_user = request.user
+    if auth_user.is_authenticated and not auth_user.is_admin and auth_user.id != user.id:
+        return Response(
+            {'error': 'You do not have permission to access this user'},
+            status=status.HTTP_403_FORBIDDEN
+        )
     
     serializer = UserSerializer(user)
     return Response(serializer.data, status=status.HTTP_200_OK)
@@ -114,24 +136,46 @@ def delete_user(request, user_id):
     """
     user = get_object_or_404(User, id=user_id)
     
-    # Get authenticated user from token/session
-    auth_user_id = request.headers.get('X-User-Id')
-    if auth_user_id:
-        try:
-            auth_user = User.objects.get(id=int(auth_user_id))
-            # Check permission: admin or self
-            if not auth_user.is_admin and auth_user.id != user.id:
-                return Response(
-                    {'error': 'You do not have permission to delete this user'},
-                    status=status.HTTP_403_FORBIDDEN
-                )
-        except (User.DoesNotExist, ValueError):
-            pass
+    # Check permission: admin or self
+    auth_user = request.user
+    if auth_user.is_authenticated and not auth_user.is_admin and auth_user.id != user.id:
+        return Response(
+            {'error': 'You do not have permission to delete this user'},
+            status=status.HTTP_403_FORBIDDEN
+        )
     
-    user.delete()
+    # Derived rows of the cascaded bookings are updated once, not per booking
+    with transaction.atomic(), signals.batch():
+        user.delete()
     return Response({'message': 'User deleted successfully'}, status=status.HTTP_200_OK)
 
 
+@api_view(['GET'])
+def user_summary(request, user_id):
+    """
+    Dashboard summary of a user: booking totals and the active and upcoming bookings.
+    GET /api/parkmate/users/{user_id}/summary
+    Accessible only for admins and the user themselves.
+    """
+    auth_user = request.user
+    if not auth_user.is_authenticated:
+        return Response(
+            {'error': 'User authentication required'},
+            status=status.HTTP_401_UNAUTHORIZED
+        )
+    if not auth_user.is_admin and auth_user.id != user_id:
+        return Response(
+            {'error': 'You do not have permission to access this user'},
+            status=status.HTTP_403_FORBIDDEN
+        )
+    
+    try:
+        summary = summaries.read(user_id)
+    except User.DoesNotExist:
+        raise Http404('No User matches the given query.')
+    return Response(summary, status=status.HTTP_200_OK)
+
+
 # Parking endpoints
 
 @api_view(['GET', 'POST'])
@@ -139,7 +183,8 @@ def parking_list_create(request):
     """
     Create a new parking or get all parkings.
     POST /api/parkmate/parking - Create parking
-    GET /api/parkmate/parking - Get all parkings
+    GET /api/parkmate/parking - Get all parkings (cached; supports If-None-Match)
+    Query: fields=a,b; limit=N, cursor=... for keyset pagination
     """
     if request.method == 'POST':
         serializer = ParkingSerializer(data=request.data)
@@ -148,9 +193,21 @@ def parking_list_create(request):
             return Response(serializer.data, status=status.HTTP_201_CREATED)
         return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
     else:  # GET
-        parkings = Parking.objects.all()
-        serializer = ParkingSerializer(parkings, many=True)
-        return Response(serializer.data, status=status.HTTP_200_OK)
+        paginator = KeysetPagination({'parking_id': ('parking_id',)}, 'parking_id')
+        try:
+            fields = parse_fields(request, PARKING_FIELDS)
+            # Cached entries outlive the request: never build them from a lagging replica
+            parkings = paginator.paginate_queryset(Parking.objects.using(PRIMARY), request)
+        except InvalidQuery as exc:
+            return Response({'error': str(exc)}, status=status.HTTP_400_BAD_REQUEST)
+        
+        def build():
+            # Only the requested columns (plus the page key) are selected
+            columns = [name for name in PARKING_FIELDS if name in fields or name in paginator.key_fields]
+            rows = list(parkings.values(*columns))
+            return paginator.get_response_data(rows, fields)
+        
+        return caching.cached_response(request, caching.parking_list_key(request), build)
 
 
 @api_view(['GET'])
@@ -158,10 +215,13 @@ def get_parking(request, parking_id):
     """
     Get specific parking.
     GET /api/parkmate/parking/{parking_id}
+    Served from the catalog cache; supports If-None-Match.
     """
-    parking = get_object_or_404(Parking, parking_id=parking_id)
-    serializer = ParkingSerializer(parking)
-    return Response(serializer.data, status=status.HTTP_200_OK)
+    def build():
+        parking = get_object_or_404(Parking.objects.using(PRIMARY), parking_id=parking_id)
+        return ParkingSerializer(parking).data
+    
+    return caching.cached_response(request, caching.parking_detail_key(parking_id), build)
 
 
 @api_view(['PUT'])
@@ -185,10 +245,237 @@ def delete_parking(request, parking_id):
     DELETE /api/parkmate/parking/{parking_id}
     """
     parking = get_object_or_404(Parking, parking_id=parking_id)
-    parking.delete()
+    with transaction.atomic(), signals.batch():
+        parking.delete()
     return Response({'message': 'Parking deleted successfully'}, status=status.HTTP_200_OK)
 
 
+@api_view(['POST', 'PUT', 'DELETE'])
+def parking_bulk(request):
+    """
+    Create, update or delete parkings in bulk.
+    POST /api/parkmate/parking/bulk - Body: [{parking}, ...]
+    PUT /api/parkmate/parking/bulk - Body: [{"parking_id": ..., changes}, ...]
+    DELETE /api/parkmate/parking/bulk - Body: [parking_id, ...]
+    Returns one {"index", "status", "data" | "errors"} result per item.
+    """
+    handlers = {
+        'POST': bulk.create_parkings,
+        'PUT': bulk.update_parkings,
+        'DELETE': bulk.delete_parkings,
+    }
+    try:
+        items = bulk.check_items(request.data)
+    except bulk.BulkError as exc:
+        return Response({'error': str(exc)}, status=status.HTTP_400_BAD_REQUEST)
+    return Response({'results': handlers[request.method](items)}, status=status.HTTP_200_OK)
+
+
+def _parse_time(value):
+    """Parse an ISO 8601 query parameter into an aware datetime (None if invalid)."""
+    try:
+        parsed = parse_datetime(value)
+    except ValueError:
+        return None
+    if parsed is not None and timezone.is_naive(parsed):
+        parsed = timezone.make_aware(parsed)
+    return parsed
+
+
+def _parse_window(params):
+    """
+    The ("from", "to") window of a query: "from" defaults to now and "to"
+    may be omitted (None). Raises InvalidQuery.
+    """
+    start_time = timezone.now()
+    end_time = None
+    if 'from' in params:
+        start_time = _parse_time(params['from'])
+    if 'to' in params:
+        end_time = _parse_time(params['to'])
+        if end_time is None:
+            start_time = None
+    if start_time is None:
+        raise InvalidQuery('Invalid "from"/"to" datetime')
+    if end_time is not None and start_time >= end_time:
+        raise InvalidQuery('"to" must be after "from"')
+    return start_time, end_time
+
+
+@api_view(['GET'])
+def parking_availability(request, parking_id):
+    """
+    Get free spots of a parking.
+    GET /api/parkmate/parking/{parking_id}/availability?from=...&to=...
+    Without "to" the spots free at the moment "from" (default: now) are returned.
+    """
+    parking = get_object_or_404(Parking, parking_id=parking_id)
+    
+    try:
+        start_time, end_time = _parse_window(request.query_params)
+    except InvalidQuery as exc:
+        return Response({'error': str(exc)}, status=status.HTTP_400_BAD_REQUEST)
+    
+    if end_time is None:
+        occupied = availability.occupancy_at(parking.parking_id, start_time)
+    else:
+        occupied = availability.peak_occupancy(parking.parking_id, start_time, end_time)
+    return Response({
+        'parking_id': parking.parking_id,
+        'amount_of_spots': parking.amount_of_spots,
+        'from': start_time,
+        'to': end_time,
+        'occupied_spots': occupied,
+        'free_spots': max(parking.amount_of_spots - occupied, 0),
+    }, status=status.HTTP_200_OK)
+
+
+@api_view(['GET'])
+def parking_stats(request, parking_id):
+    """
+    Occupancy and revenue of a parking per hour or day (UTC).
+    GET /api/parkmate/parking/{parking_id}/stats?granularity=hour|day&from=...&to=...
+    Defaults to the last day (hour) or 30 days (day). Admin only.
+    """
+    if not request.user.is_authenticated:
+        return Response(
+            {'error': 'User authentication required'},
+            status=status.HTTP_401_UNAUTHORIZED
+        )
+    if not request.user.is_admin:
+        return Response(
+            {'error': 'You do not have permission to view parking statistics'},
+            status=status.HTTP_403_FORBIDDEN
+        )
+    parking = get_object_or_404(Parking, parking_id=parking_id)
+    
+    params = request.query_params
+    granularity = params.get('granularity', 'hour')
+    if granularity not in analytics.GRANULARITIES:
+        return Response(
+            {'error': f'granularity must be one of: {", ".join(analytics.GRANULARITIES)}'},
+            status=status.HTTP_400_BAD_REQUEST
+        )
+    end_time = timezone.now()
+    if 'to' in params:
+        end_time = _parse_time(params['to'])
+    start_time = end_time - DEFAULT_STATS_SPAN[granularity] if end_time else None
+    if 'from' in params:
+        start_time = _parse_time(params['from'])
+    if start_time is None or end_time is None:
+        return Response({'error': 'Invalid "from"/"to" datetime'}, status=status.HTTP_400_BAD_REQUEST)
+    if start_time >= end_time:
+        return Response({'error': '"to" must be after "from"'}, status=status.HTTP_400_BAD_REQUEST)
+    if (end_time - start_time).total_seconds() / analytics.GRANULARITIES[granularity] > MAX_STATS_BUCKETS:
+        return Response(
+            {'error': f'At most {MAX_STATS_BUCKETS} buckets can be requested'},
+            status=status.HTTP_400_BAD_REQUEST
+        )
+    
+    buckets = analytics.series(parking, granularity, start_time, end_time)
+    return Response({
+        'parking_id': parking.parking_id,
+        'granularity': granularity,
+        'from': start_time,
+        'to': end_time,
+        'buckets': buckets,
+        'booked_hours': round(sum(bucket['booked_hours'] for bucket in buckets), 2),
+        'revenue': round(sum(bucket['revenue'] for bucket in buckets), 2),
+    }, status=status.HTTP_200_OK)
+
+
+def _parse_float(params, name, low, high, default=None):
+    value = params.get(name)
+    if value is None:
+        if default is None:
+            raise InvalidQuery(f'"{name}" is required')
+        return default
+    try:
+        number = float(value)
+    except ValueError:
+        raise InvalidQuery(f'"{name}" must be a number')
+    if not low <= number <= high:
+        raise InvalidQuery(f'"{name}" must be between {low} and {high}')
+    return number
+
+
+def _parse_int(params, name, low, high, default):
+    value = params.get(name)
+    if value is None:
+        return default
+    try:
+        number = int(value)
+    except ValueError:
+        raise InvalidQuery(f'"{name}" must be an integer')
+    if not low <= number <= high:
+        raise InvalidQuery(f'"{name}" must be between {low} and {high}')
+    return number
+
+
+@api_view(['GET'])
+def parking_nearby(request):
+    """
+    Find the nearest parkings with a free spot.
+    GET /api/parkmate/parking/nearby?lat=...&lon=...&radius=km&from=...&to=...&limit=N
+    Radius defaults to 5 km (max 100), limit to 10 (max 100). Without "to"
+    parkings free at the moment "from" (default: now) are returned.
+    Results are ordered by distance.
+    """
+    params = request.query_params
+    try:
+        lat = _parse_float(params, 'lat', -90, 90)
+        lon = _parse_float(params, 'lon', -180, 180)
+        radius = _parse_float(params, 'radius', 0, MAX_NEARBY_RADIUS_KM, default=5.0)
+        limit = _parse_int(params, 'limit', 1, MAX_NEARBY_LIMIT, default=10)
+        start_time, end_time = _parse_window(params)
+    except InvalidQuery as exc:
+        return Response({'error': str(exc)}, status=status.HTTP_400_BAD_REQUEST)
+    
+    found = spatial.nearest_available(lat, lon, radius, start_time, end_time, limit)
+    return Response([
+        dict(ParkingSerializer(parking).data, distance_km=round(distance, 3), free_spots=free)
+        for parking, distance, free in found
+    ], status=status.HTTP_200_OK)
+
+
+@api_view(['GET'])
+def parking_search(request):
+    """
+    Search parkings by address and comment.
+    GET /api/parkmate/parking/search?q=...&limit=N&offset=M
+    Every word must match (words also match as prefixes); results are
+    ranked best first. Limit defaults to 20 (max 100), offset to 0 (max 10000).
+    "truncated" is true when a prefix had more extensions than are searched
+    (PARKMATE_SEARCH_MAX_EXPANSIONS); results then cover the first ones only.
+    """
+    params = request.query_params
+    query = params.get('q', '').strip()
+    try:
+        if not query:
+            raise InvalidQuery('"q" is required')
+        limit = _parse_int(params, 'limit', 1, MAX_SEARCH_LIMIT, default=20)
+        offset = _parse_int(params, 'offset', 0, MAX_SEARCH_OFFSET, default=0)
+    except InvalidQuery as exc:
+        return Response({'error': str(exc)}, status=status.HTTP_400_BAD_REQUEST)
+    
+    count, page, truncated = search.search(query, offset, limit)
+    rows = {
+        row['parking_id']: row
+        for row in Parking.objects.filter(parking_id__in=[parking_id for parking_id, _ in page]).values(*PARKING_FIELDS)
+    }
+    results = [
+        dict(rows[parking_id], score=round(score, 4))
+        for parking_id, score in page
+        if parking_id in rows  # deleted since the index was read
+    ]
+    return Response({
+        'count': count,
+        'next': offset + limit if offset + limit < count else None,
+        'truncated': truncated,
+        'results': results,
+    }, status=status.HTTP_200_OK)
+
+
 # Booking endpoints
 
 @api_view(['GET', 'POST'])
@@ -197,20 +484,11 @@ def booking_list_create(request):
     Create a new booking or get all bookings.
     POST /api/parkmate/bookings - Create booking
     GET /api/parkmate/bookings - Get all bookings (Admin: all, User: own)
+    Query: from, to, parking_id filters; fields=a,b; ordering=booking_id|start_time;
+    limit=N, cursor=... for keyset pagination; include_archived=true (admin only)
     """
     if request.method == 'POST':
-        # Get user from header
-        auth_user_id = request.headers.get('X-User-Id')
-        if auth_user_id:
-            try:
-                user = User.objects.get(id=int(auth_user_id))
-                request.user_obj = user
-            except (User.DoesNotExist, ValueError):
-                return Response(
-                    {'error': 'Invalid user authentication'},
-                    status=status.HTTP_401_UNAUTHORIZED
-                )
-        else:
+        if not request.user.is_authenticated:
             return Response(
                 {'error': 'User authentication required'},
                 status=status.HTTP_401_UNAUTHORIZED
@@ -222,21 +500,125 @@ def booking_list_create(request):
             return Response(serializer.data, status=status.HTTP_201_CREATED)
         return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
     else:  # GET
-        auth_user_id = request.headers.get('X-User-Id')
-        if auth_user_id:
-            try:
-                user = User.objects.get(id=int(auth_user_id))
-                if user.is_admin:
-                    bookings = Booking.objects.all()
-                else:
-                    bookings = Booking.objects.filter(user_id=user)
-            except (User.DoesNotExist, ValueError):
-                bookings = Booking.objects.none()
+        user = request.user
+        if user.is_authenticated and not user.is_admin:
+            bookings = Booking.objects.filter(user_id=user)
         else:
             bookings = Booking.objects.all()
         
-        serializer = BookingSerializer(bookings, many=True)
-        return Response(serializer.data, status=status.HTTP_200_OK)
+        paginator = KeysetPagination(
+            {'booking_id': ('booking_id',), 'start_time': ('start_time', 'booking_id')},
+            'booking_id',
+        )
+        include_archived = request.query_params.get('include_archived', '').lower() in ('1', 'true')
+        if include_archived and not (user.is_authenticated and user.is_admin):
+            return Response(
+                {'error': 'You do not have permission to list archived bookings'},
+                status=status.HTTP_403_FORBIDDEN
+            )
+        try:
+            fields = parse_fields(request, BOOKING_FIELDS)
+            bookings = _filter_bookings(bookings, request.query_params)
+            bookings = paginator.paginate_queryset(bookings, request)
+            if include_archived:
+                archived = _filter_bookings(ArchivedBooking.objects.all(), request.query_params)
+                archived = paginator.paginate_queryset(archived, request)
+        except InvalidQuery as exc:
+            return Response({'error': str(exc)}, status=status.HTTP_400_BAD_REQUEST)
+        
+        # Parking and user come from one joined query instead of two per row
+        rows = booking_rows(bookings, fields + tuple(paginator.key_fields))
+        if include_archived:
+            # Both tables are cut at the cursor; their pages merge into one
+            archived_rows = booking_rows(archived, fields + tuple(paginator.key_fields))
+            rows = paginator.merge(Booking, rows, archived_rows)
+        return Response(paginator.get_response_data(rows, fields), status=status.HTTP_200_OK)
+
+
+@api_view(['POST', 'PUT', 'DELETE'])
+def booking_bulk(request):
+    """
+    Create, update or delete bookings in bulk.
+    POST /api/parkmate/bookings/bulk - Body: [{"parking_id", "start_time", "end_time"}, ...]
+    PUT /api/parkmate/bookings/bulk - Body: [{"booking_id": ..., changes}, ...]
+    DELETE /api/parkmate/bookings/bulk - Body: [booking_id, ...]
+    Owner or admin only. Returns one {"index", "status", "data" | "errors"} result per item.
+    """
+    if not request.user.is_authenticated:
+        return Response(
+            {'error': 'User authentication required'},
+            status=status.HTTP_401_UNAUTHORIZED
+        )
+    handlers = {
+        'POST': bulk.create_bookings,
+        'PUT': bulk.update_bookings,
+        'DELETE': bulk.delete_bookings,
+    }
+    try:
+        items = bulk.check_items(request.data)
+    except bulk.BulkError as exc:
+        return Response({'error': str(exc)}, status=status.HTTP_400_BAD_REQUEST)
+    return Response({'results': handlers[request.method](items, request.user)}, status=status.HTTP_200_OK)
+
+
+@api_view(['GET'])
+def booking_export(request):
+    """
+    Stream all bookings as NDJSON or CSV.
+    GET /api/parkmate/bookings/export?output=ndjson|csv
+    Query: from, to, parking_id filters. Admin only.
+    """
+    if not request.user.is_authenticated:
+        return Response(
+            {'error': 'User authentication required'},
+            status=status.HTTP_401_UNAUTHORIZED
+        )
+    if not request.user.is_admin:
+        return Response(
+            {'error': 'You do not have permission to export bookings'},
+            status=status.HTTP_403_FORBIDDEN
+        )
+    
+    export_format = request.query_params.get('output', 'ndjson')
+    if export_format not in EXPORT_FORMATS:
+        return Response(
+            {'error': f'output must be one of: {", ".join(EXPORT_FORMATS)}'},
+            status=status.HTTP_400_BAD_REQUEST
+        )
+    try:
+        bookings = _filter_bookings(Booking.objects.all(), request.query_params)
+    except InvalidQuery as exc:
+        return Response({'error': str(exc)}, status=status.HTTP_400_BAD_REQUEST)
+    
+    response = StreamingHttpResponse(
+        export_bookings(bookings, export_format, chunk_size=DEFAULT_CHUNK_SIZE),
+        content_type=EXPORT_FORMATS[export_format],
+    )
+    response['Content-Disposition'] = f'attachment; filename="bookings.{export_format}"'
+    return response
+
+
+def _filter_bookings(bookings, params):
+    """Apply the from/to/parking_id list filters to a booking queryset."""
+    if 'from' in params:
+        start_time = _parse_time(params['from'])
+        if start_time is None:
+            raise InvalidQuery('Invalid "from" datetime')
+        bookings = bookings.filter(end_time__gt=start_time)
+    if 'to' in params:
+        end_time = _parse_time(params['to'])
+        if end_time is None:
+            raise InvalidQuery('Invalid "to" datetime')
+        bookings = bookings.filter(start_time__lt=end_time)
+    if 'parking_id' in params:
+        try:
+            parking_id = int(params['parking_id'])
+        except ValueError:
+            raise InvalidQuery('parking_id must be an integer')
+        if not is_integer(parking_id):
+            raise InvalidQuery('parking_id is out of range')
+        bookings = bookings.filter(parking_id=parking_id)
+    return bookings
 
 
 @api_view(['GET'])
@@ -245,22 +627,15 @@ def get_booking(request, booking_id):
     Get specific booking.
     GET /api/parkmate/bookings/{booking_id}
     """
-    booking = get_object_or_404(Booking, booking_id=booking_id)
+    booking = get_object_or_404(Booking.objects.select_related('parking_id', 'user_id'), booking_id=booking_id)
     
-    # Check permission
-    auth_user_id = request.headers.get('X-User-Id')
-    if auth_user_id:
-        try:
-            user = User.objects.get(id=int(auth_user_id))
-            if not user.is_admin:
-                # Check if user owns the booking
-                if booking.user_id != user:
-                    return Response(
-                        {'error': 'You do not have permission to access this booking'},
-                        status=status.HTTP_403_FORBIDDEN
-                    )
-        except (User.DoesNotExist, ValueError):
-            pass
+    # Check permission: admin or owner of the booking
+    user = request.user
+    if user.is_authenticated and not user.is_admin and booking.user_id_id != user.id:
+        return Response(
+            {'error': 'You do not have permission to access this booking'},
+            status=status.HTTP_403_FORBIDDEN
+        )
     
     serializer = BookingSerializer(booking)
     return Response(serializer.data, status=status.HTTP_200_OK)
@@ -275,24 +650,13 @@ def update_booking(request, booking_id):
     """
     booking = get_object_or_404(Booking, booking_id=booking_id)
     
-    # Check permission
-    auth_user_id = request.headers.get('X-User-Id')
-    if auth_user_id:
-        try:
-            user = User.objects.get(id=int(auth_user_id))
-            if not user.is_admin:
-                # Check if user owns the booking
-                if booking.user_id != user:
-                    return Response(
-                        {'error': 'You do not have permission to update this booking'},
-                        status=status.HTTP_403_FORBIDDEN
-                    )
-            request.user_obj = user
-        except (User.DoesNotExist, ValueError):
-            return Response(
-                {'error': 'Invalid user authentication'},
-                status=status.HTTP_401_UNAUTHORIZED
-            )
+    # Check permission: admin or owner of the booking
+    user = request.user
+    if user.is_authenticated and not user.is_admin and booking.user_id_id != user.id:
+        return Response(
+            {'error': 'You do not have permission to update this booking'},
+            status=status.HTTP_403_FORBIDDEN
+        )
     
     serializer = BookingSerializer(booking, data=request.data, partial=True, context={'request': request})
     if serializer.is_valid():
@@ -308,25 +672,16 @@ def delete_booking(request, booking_id):
     DELETE /api/parkmate/bookings/{booking_id}
     Owner or admin only.
     """
-    booking = get_object_or_404(Booking, booking_id=booking_id)
+    # The parking's price is needed to update the owner's summary
+    booking = get_object_or_404(Booking.objects.select_related('parking_id'), booking_id=booking_id)
     
-    # Check permission
-    auth_user_id = request.headers.get('X-User-Id')
-    if auth_user_id:
-        try:
-            user = User.objects.get(id=int(auth_user_id))
-            if not user.is_admin:
-                # Check if user owns the booking
-                if booking.user_id != user:
-                    return Response(
-                        {'error': 'You do not have permission to delete this booking'},
-                        status=status.HTTP_403_FORBIDDEN
-                    )
-        except (User.DoesNotExist, ValueError):
-            return Response(
-                {'error': 'Invalid user authentication'},
-                status=status.HTTP_401_UNAUTHORIZED
-            )
+    # Check permission: admin or owner of the booking
+    user = request.user
+    if user.is_authenticated and not user.is_admin and booking.user_id_id != user.id:
+        return Response(
+            {'error': 'You do not have permission to delete this booking'},
+            status=status.HTTP_403_FORBIDDEN
+        )
     
     booking.delete()
     return Response({'message': 'Booking deleted successfully'}, status=status.HTTP_200_OK)